@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# bench_merge -- compare merger implementations for growing source counts
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# builtin
+import argparse
+import datetime
+import random
+import time
+
+# custom
+import sherlock.sherlock as sherlock
+from sherlock.batches import Batch, numpy
+from sherlock.record import LineRecord
+from sherlock.timestamps import to_timestamp
+
+
+def make_sources(count, lines):
+    '''
+    build count sorted lists of records with lines entries in total
+    '''
+    rnd = random.Random(count)
+    start = to_timestamp(datetime.datetime(2019, 1, 1))
+    sources = {}
+    for num in range(count):
+        offsets = sorted(rnd.randrange(86400 * 1000) for _ in range(lines // count))
+        sources['source-%s' % num] = [
+            LineRecord('LOG', start + offset * 1000, 'line %s\n' % offset)
+            for offset in offsets
+        ]
+    return sources
+
+
+def bench(merge_name, sources):
+    '''
+    merge sources using merge_name, return seconds needed
+    '''
+    if merge_name == 'batch':
+        iterators = {
+            key: (Batch(lines[num:num + 4096]) for num in range(0, len(lines), 4096))
+            for key, lines in sources.items()
+        }
+    elif merge_name == 'reverse':  # takes lines newest first
+        iterators = {
+            key: (line_d for line_d in reversed(lines))
+            for key, lines in sources.items()
+        }
+    else:
+        iterators = {
+            key: (line_d for line_d in lines) for key, lines in sources.items()
+        }
+    merger = sherlock.MERGERS[merge_name](iterators)
+    start = time.perf_counter()
+    for _ in merger.run():
+        pass
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='bench_merge')
+    parser.add_argument('-l', '--lines', type=int, default=200000)
+    parser.add_argument(
+        '-k', '--sources', type=int, nargs='*',
+        default=[1, 2, 4, 8, 16, 32, 64, 128]
+    )
+    args = parser.parse_args()
+
+    # follow merger reads datasources in threads, see bench_suite
+    names = sorted(
+        name for name in sherlock.MERGERS
+        if name != 'follow' and (name != 'batch' or numpy)
+    )
+    print('%8s %s' % ('sources', ' '.join('%12s' % name for name in names)))
+    for count in args.sources:
+        sources = make_sources(count, args.lines)
+        results = [bench(name, sources) for name in names]
+        print('%8s %s' % (count, ' '.join('%11.3fs' % res for res in results)))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# bench_outputs -- lines per second written by each output
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# builtin
+import argparse
+import os
+import sys
+import time
+
+# custom
+import sherlock.outputs as outputs
+from sherlock.record import LineRecord
+
+
+def bench(output, lines, batch_size):
+    '''
+    write lines to output in batches like Sherlock.run, batch_size 0 writes
+    single lines. return lines per second
+    '''
+    start = time.perf_counter()
+    output.setup()
+    if batch_size:
+        for num in range(0, len(lines), batch_size):
+            output.write_batch(lines[num:num + batch_size])
+    else:
+        for line_d in lines:
+            output.write(line_d)
+    output.close()
+    return len(lines) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='bench_outputs')
+    parser.add_argument('-l', '--lines', type=int, default=1000000)
+    parser.add_argument('-b', '--batch-size', type=int, nargs='*', default=[0, 1000])
+    args = parser.parse_args()
+
+    with open('./tests/file_assets/apache2/access.log', 'r', encoding='utf-8') as logfile:
+        raw_lines = logfile.readlines()
+    lines = [
+        LineRecord('LOG', 1546300800000000 + num, raw_lines[num % len(raw_lines)])
+        for num in range(args.lines)
+    ]
+
+    # stdout and pager write to /dev/null, table is built but not shown
+    outputs.SimplePager.command = 'cat > /dev/null'
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    results = []
+    try:
+        for name, factory in (
+                ('stdout', outputs.StdOut),
+                ('simple', outputs.SimplePager),
+                ('table', outputs.Tablepager)):
+            for batch_size in args.batch_size:
+                output = factory()
+                results.append((name, batch_size, bench(output, lines, batch_size)))
+                if name == 'simple':
+                    output.run()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print('%8s %10s %12s' % ('output', 'batch', 'lines/s'))
+    for name, batch_size, speed in results:
+        print('%8s %10s %12d' % (name, batch_size, speed))
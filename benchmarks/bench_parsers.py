@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# bench_parsers -- compare timestamp fast path against plain dateutil
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# builtin
+import argparse
+import time
+
+# custom
+import sherlock.sherlock as sherlock
+from sherlock.timestamps import Timestamps
+
+ASSETS = {
+    'postgresql': './tests/file_assets/postgresql/postgresql-9.5-main.log',
+    'apache2-access': './tests/file_assets/apache2/access.log',
+    'apache2-error': './tests/file_assets/apache2/error.log',
+}
+
+
+def bench(parser, lines):
+    '''
+    run parser on lines, return lines per second
+    '''
+    start = time.perf_counter()
+    for line in lines:
+        parser.run(line)
+    return len(lines) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='bench_parsers')
+    parser.add_argument('-l', '--lines', type=int, default=100000)
+    args = parser.parse_args()
+
+    print('%16s %14s %14s %8s' % ('parser', 'dateutil l/s', 'fast l/s', 'speedup'))
+    for name, path in sorted(ASSETS.items()):
+        with open(path, 'r', encoding='utf-8') as logfile:
+            lines = logfile.readlines()
+        lines = (lines * (args.lines // len(lines) + 1))[:args.lines]
+
+        slow = sherlock.PARSERS[name]()
+        slow.timestamps = Timestamps(None, cache_size=0)
+        fast = sherlock.PARSERS[name]()
+
+        slow_res = bench(slow, lines)
+        fast_res = bench(fast, lines)
+        print('%16s %14d %14d %7.1fx' % (name, slow_res, fast_res, fast_res / slow_res))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# bench_patterns -- pattern filter cost for growing pattern lists
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# builtin
+import argparse
+import random
+import time
+
+# custom
+import sherlock.patterns as patterns
+
+
+def bench(pattern_set, mode, lines):
+    '''
+    run mode of pattern_set against lines, return lines per second
+    '''
+    match = getattr(pattern_set, mode)
+    start = time.perf_counter()
+    for line in lines:
+        match(line)
+    return len(lines) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='bench_patterns')
+    parser.add_argument('-l', '--lines', type=int, default=50000)
+    parser.add_argument(
+        '-p', '--patterns', type=int, nargs='*', default=[1, 10, 100, 1000]
+    )
+    args = parser.parse_args()
+
+    with open('./tests/file_assets/apache2/access.log', 'r', encoding='utf-8') as logfile:
+        lines = logfile.readlines()
+    lines = (lines * (args.lines // len(lines) + 1))[:args.lines]
+
+    rnd = random.Random(0)
+    automaton = patterns.ahocorasick
+    engines = [('regex', None)]
+    if automaton:
+        engines.append(('automaton', automaton))
+
+    print('%9s %10s %12s %12s' % ('patterns', 'engine', 'any l/s', 'all l/s'))
+    for count in args.patterns:
+        literals = [
+            'signature-%08x' % rnd.getrandbits(32) for _ in range(count - 1)
+        ] + ['cron_fast']
+        for name, module in engines:
+            patterns.ahocorasick = module
+            pattern_set = patterns.PatternSet(literals)
+            print('%9s %10s %12d %12d' % (
+                count, name,
+                bench(pattern_set, 'any', lines),
+                bench(pattern_set, 'all', lines),
+            ))
+    patterns.ahocorasick = automaton
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# bench_reader -- compare Logfile readers on a large generated logfile
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# builtin
+import argparse
+import os
+import tempfile
+import time
+
+# custom
+import sherlock.datasources as datasources
+import sherlock.filters as filters
+import sherlock.parsers as parsers
+
+
+def write_logfile(path, size):
+    '''
+    fill logfile at path up to size bytes by repeating apache2 access.log
+    '''
+    with open('./tests/file_assets/apache2/access.log', 'rb') as logfile:
+        data = logfile.read()
+    with open(path, 'wb') as logfile:
+        written = 0
+        while written < size:
+            logfile.write(data)
+            written += len(data)
+
+
+def bench(path, reader, lfilters):
+    '''
+    run Logfile datasource using reader, return seconds and lines passed
+    '''
+    source = datasources.Logfile(
+        parsers.Apache2_Access_Parser(), lfilters, path=path, reader=reader
+    )
+    start = time.perf_counter()
+    count = sum(1 for _ in source.run())
+    return time.perf_counter() - start, count
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='bench_reader')
+    parser.add_argument('-s', '--size', type=int, default=256, help='MB')
+    parser.add_argument('-p', '--path', help='existing apache2 access log')
+    args = parser.parse_args()
+
+    path = args.path
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(), 'access.log')
+        write_logfile(path, args.size * 1024 * 1024)
+    size = os.path.getsize(path)
+
+    keyword = filters.Keyword(keyword='cron_fast')
+    keyword.setup()
+    rare = filters.Keyword(keyword='no such keyword')
+    rare.setup()
+
+    print('%10s %8s %10s %10s %10s' % ('filter', 'reader', 'seconds', 'MB/s', 'lines'))
+    for name, lfilters in (('none', []), ('keyword', [keyword]), ('rare', [rare])):
+        for reader in ('lines', 'mmap'):
+            seconds, count = bench(path, reader, lfilters)
+            print('%10s %8s %9.3fs %10.1f %10d' % (
+                name, reader, seconds, size / seconds / 1024 / 1024, count
+            ))
+
+    if not args.path:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# bench_records -- memory and allocation time of line dicts against records
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# builtin
+import argparse
+import datetime
+import time
+import tracemalloc
+
+# custom
+from sherlock.record import LineRecord
+from sherlock.timestamps import to_timestamp
+
+
+def make_dict(code, dateobj, timestamp, raw_line):
+    '''line dictionary as built by parsers before'''
+    return {'code': code, 'datetime': dateobj, 'raw_line': raw_line}
+
+
+def make_record(code, dateobj, timestamp, raw_line):
+    '''record as built by parsers now'''
+    return LineRecord(code, timestamp, raw_line)
+
+
+def bench(factory, lines):
+    '''
+    hold lines built by factory like Tablepager does, return seconds and
+    bytes allocated
+    '''
+    start = datetime.datetime(2019, 1, 1)
+    raw_line = 'raw line\n'
+    dates = [start + datetime.timedelta(microseconds=num) for num in range(lines)]
+    timestamps = [to_timestamp(dateobj) for dateobj in dates]
+
+    begin = time.perf_counter()
+    results = [
+        factory('LOG', dateobj, timestamp, raw_line)
+        for dateobj, timestamp in zip(dates, timestamps)
+    ]
+    seconds = time.perf_counter() - begin
+    del results
+
+    # parsers build a new datetime or timestamp object per line
+    tracemalloc.start()
+    results = [
+        factory('LOG', dateobj.replace(), timestamp + 0, raw_line)
+        for dateobj, timestamp in zip(dates, timestamps)
+    ]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, size
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='bench_records')
+    parser.add_argument('-l', '--lines', type=int, default=1000000)
+    args = parser.parse_args()
+
+    print('%8s %10s %12s' % ('type', 'seconds', 'bytes/line'))
+    for name, factory in (('dict', make_dict), ('record', make_record)):
+        seconds, size = bench(factory, args.lines)
+        print('%8s %9.3fs %12d' % (name, seconds, size // args.lines))
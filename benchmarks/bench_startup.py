@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# bench_startup -- time pf_sherlock startup in fresh interpreters
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# builtin
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# custom
+import generators
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXECUTABLE = os.path.join(ROOT, 'bin', 'pf_sherlock')
+
+
+def commands(config):
+    '''
+    return list of name and command line, first one is the bare interpreter
+    '''
+    pf_sherlock = [sys.executable, EXECUTABLE]
+    return [
+        ('python', [sys.executable, '-c', 'pass']),
+        ('import', [sys.executable, '-c', 'import sherlock.sherlock']),
+        ('help', pf_sherlock + ['--help']),
+        ('run', pf_sherlock + ['-c', config]),
+        ('tail', pf_sherlock + ['-c', config, '--tail', '10']),
+    ]
+
+
+def bench(command, env, repeat):
+    '''
+    run command repeat times after a warm up run, return list of seconds
+    needed
+    '''
+    subprocess.run(
+        command, env=env, check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            command, env=env, check=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def imports(command, env, count):
+    '''
+    return count slowest imports of command as cumulative microseconds and
+    module name, see python -X importtime
+    '''
+    proc = subprocess.run(
+        [command[0], '-X', 'importtime'] + command[1:], env=env, check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True
+    )
+    res = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        res.append((int(cumulative), name.rstrip()))
+    return sorted(res, reverse=True)[:count]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='bench_startup')
+    parser.add_argument('-r', '--repeat', type=int, default=20)
+    parser.add_argument('-l', '--lines', type=int, default=100)
+    parser.add_argument(
+        '-i', '--imports', type=int, default=0,
+        help='show slowest imports of run command'
+    )
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_startup')
+    # bytecode is written to workdir like to __pycache__ of an installation
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    env['PYTHONPYCACHEPREFIX'] = os.path.join(workdir, 'pycache')
+    try:
+        logfile = os.path.join(workdir, 'postgresql.log')
+        generators.write(logfile, 'postgresql', args.lines)
+        config = os.path.join(workdir, 'config.py')
+        with open(config, 'w') as configfile:
+            configfile.write(
+                'logfile_map = {(%r, %r)}\nshellcmd_map = set()\n'
+                'output = %r\n' % ('postgresql', logfile, 'stdout')
+            )
+
+        baseline = None
+        print('%8s %10s %10s %10s' % ('command', 'min', 'median', 'overhead'))
+        for name, command in commands(config):
+            seconds = bench(command, env, args.repeat)
+            if baseline is None:
+                baseline = min(seconds)
+            print('%8s %8.1fms %8.1fms %8.1fms' % (
+                name, min(seconds) * 1000, statistics.median(seconds) * 1000,
+                (min(seconds) - baseline) * 1000
+            ))
+
+        if args.imports:
+            print()
+            for cumulative, name in imports(commands(config)[3][1], env, args.imports):
+                print('%8.1fms %s' % (cumulative / 1000, name))
+    finally:
+        shutil.rmtree(workdir)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# bench_suite -- time every pipeline stage on synthetic logfiles
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# builtin
+import argparse
+import datetime
+import functools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# custom
+import generators
+import sherlock.sherlock as sherlock
+from sherlock.batches import Batch, numpy
+
+
+# runs of every benchmark, the fastest one is reported
+REPEAT = 3
+
+
+def timed(function, *args):
+    '''
+    call function REPEAT times, return its result and fewest seconds needed
+    '''
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    return result, best
+
+
+def result(stage, name, lines, seconds, **params):
+    '''
+    machine readable result of a benchmark
+    '''
+    return dict(
+        stage=stage,
+        name=name,
+        params=params,
+        lines=lines,
+        seconds=round(seconds, 6),
+        lines_per_second=round(lines / seconds) if seconds else None,
+    )
+
+
+def bench_read(path):
+    '''read raw lines of logfile'''
+    with open(path, 'rb') as logfile:
+        return sum(1 for _ in logfile)
+
+
+def bench_parse(name, lines):
+    '''parse lines by new parser of name, return parsed records'''
+    run = sherlock.PARSERS[name]().run
+    return [line_d for line_d in map(run, lines) if line_d]
+
+
+def bench_filter(lfilters, records):
+    '''run filter chain against records, return count of passed records'''
+    count = 0
+    for line_d in records:
+        for lfilter in lfilters:
+            if not lfilter.run(line_d):
+                break
+        else:
+            count += 1
+    return count
+
+
+def bench_merge(merge_name, sources):
+    '''merge lists of records, return count of merged records'''
+    if merge_name == 'batch':
+        iterators = {
+            key: (
+                Batch(records[num:num + 4096])
+                for num in range(0, len(records), 4096)
+            )
+            for key, records in sources.items()
+        }
+        return sum(1 for _ in sherlock.MERGERS[merge_name](iterators).run())
+    iterators = {
+        key: (line_d for line_d in records) for key, records in sources.items()
+    }
+    return sum(1 for _ in sherlock.MERGERS[merge_name](iterators).run())
+
+
+def bench_sherlock(logfile_map, shards=0):
+    '''run Sherlock on logfiles writing to stdout'''
+    sherlock.Sherlock(
+        logfile_map=logfile_map,
+        shellcmd_map=[],
+        output_name='stdout',
+        shards=shards,
+    ).run()
+
+
+def bench_output(output_name, records, batch_size=1000, **options):
+    '''write records to output in batches like Sherlock.run'''
+    output = sherlock.OUTPUTS[output_name](**options)
+    output.setup()
+    for num in range(0, len(records), batch_size):
+        output.write_batch(records[num:num + batch_size])
+    output.close()
+    output.run()
+
+
+def run_suite(args, workdir):
+    '''
+    run all benchmarks, return list of results
+    '''
+    results = []
+    paths = {}
+    records = {}
+    for name in sorted(generators.GENERATORS):
+        path = os.path.join(workdir, '%s.log' % name)
+        generators.write(path, name, args.lines, seed=args.seed)
+        paths[name] = path
+
+        count, seconds = timed(bench_read, path)
+        results.append(result('read', name, count, seconds))
+
+        with open(path, 'r', encoding='utf-8') as logfile:
+            lines = logfile.readlines()
+        records[name], seconds = timed(bench_parse, name, lines)
+        results.append(result('parse', name, len(lines), seconds))
+
+    # generated lines start 2019-01-20 06:00, lh filters against now
+    chains = {
+        'kw': {'kw': 'session'},
+        'any': {'any': 'timeout,failed,re:5[0-9][0-9]'},
+        'lh-kw-not': {'lh': 24 * 365 * 100, 'kw': 'session', 'not': 'closed'},
+    }
+    for chain, filter_map in sorted(chains.items()):
+        lfilters = sherlock.build_filters(filter_map)
+        for name in sorted(records):
+            _, seconds = timed(bench_filter, lfilters, records[name])
+            results.append(result(
+                'filter', name, len(records[name]), seconds, chain=chain
+            ))
+
+    # sources of equal format starting at shifted times
+    for count in args.sources:
+        sources = {
+            'source-%s' % num: bench_parse(
+                'postgresql',
+                generators.generate(
+                    'postgresql', args.lines // count, seed=num,
+                    start=generators.START + datetime.timedelta(seconds=num)
+                )
+            )
+            for num in range(count)
+        }
+        total = sum(len(lines) for lines in sources.values())
+        for merge_name in ('heap', 'scan', 'batch'):
+            if merge_name == 'batch' and not numpy:
+                continue
+            if merge_name == 'scan' and count > 32:
+                continue  # O(k) per line, too slow to be interesting
+            _, seconds = timed(bench_merge, merge_name, sources)
+            results.append(result(
+                'merge', merge_name, total, seconds, sources=count
+            ))
+
+    # full pipeline, all formats cycled over count logfiles
+    names = sorted(paths)
+    for count in args.sources:
+        logfile_map = []
+        for num in range(count):
+            name = names[num % len(names)]
+            path = os.path.join(workdir, 'sherlock-%s.log' % num)
+            generators.write(path, name, args.lines // count, seed=num)
+            logfile_map.append((name, path))
+        _, seconds = timed(bench_sherlock, logfile_map)
+        results.append(result(
+            'sherlock', 'stdout', (args.lines // count) * count, seconds,
+            sources=count
+        ))
+        # parsing sharded over worker processes, one per core
+        shards = min(count, os.cpu_count() or 1)
+        if shards > 1:
+            _, seconds = timed(bench_sherlock, logfile_map, shards)
+            results.append(result(
+                'sherlock', 'shards', (args.lines // count) * count, seconds,
+                sources=count, shards=shards
+            ))
+
+    lines = records['apache2-access']
+    for output_name in sorted(sherlock.OUTPUTS):
+        # snapshot dumps its window once at close
+        options = {'directory': workdir} if output_name == 'snapshot' else {}
+        _, seconds = timed(
+            functools.partial(bench_output, **options), output_name, lines
+        )
+        results.append(result('output', output_name, len(lines), seconds))
+
+    return results
+
+
+def git_version():
+    '''return current git commit or None'''
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'],
+            stderr=subprocess.DEVNULL
+        ).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def key(res):
+    '''identify equal benchmarks of different runs'''
+    return (res['stage'], res['name'], json.dumps(res['params'], sort_keys=True))
+
+
+def compare(old, new, threshold):
+    '''
+    print speed of new results relative to old ones, return count of
+    results slower than threshold
+    '''
+    previous = {key(res): res for res in old['results']}
+    slower = 0
+    print('%-10s %-16s %-22s %10s %10s %8s' % (
+        'stage', 'name', 'params', 'old l/s', 'new l/s', 'ratio'
+    ))
+    for res in new['results']:
+        old_res = previous.get(key(res))
+        if not old_res or not old_res['lines_per_second']:
+            continue
+        ratio = res['lines_per_second'] / old_res['lines_per_second']
+        flag = ''
+        if ratio < 1 - threshold:
+            flag = ' SLOWER'
+            slower += 1
+        print('%-10s %-16s %-22s %10d %10d %7.2fx%s' % (
+            res['stage'], res['name'], json.dumps(res['params'], sort_keys=True)[:22],
+            old_res['lines_per_second'], res['lines_per_second'], ratio, flag
+        ))
+    return slower
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='bench_suite')
+    parser.add_argument('-l', '--lines', type=int, default=100000)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-r', '--repeat', type=int, default=REPEAT)
+    parser.add_argument(
+        '-k', '--sources', type=int, nargs='*', default=[1, 4, 16, 64]
+    )
+    parser.add_argument('-o', '--json', help='write results to path')
+    parser.add_argument('-c', '--compare', help='compare with results at path')
+    parser.add_argument(
+        '-t', '--threshold', type=float, default=0.1,
+        help='relative slowdown reported as regression'
+    )
+    args = parser.parse_args()
+
+    REPEAT = args.repeat
+
+    # outputs write to /dev/null, pagers are replaced by cat
+    sherlock.OUTPUTS['simple'].command = 'cat > /dev/null'
+    sherlock.OUTPUTS['table'].command = 'cat > /dev/null'
+    workdir = tempfile.mkdtemp(prefix='bench_suite')
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        results = run_suite(args, workdir)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        shutil.rmtree(workdir)
+
+    report = dict(
+        version=git_version(),
+        python=platform.python_version(),
+        machine=platform.machine(),
+        lines=args.lines,
+        seed=args.seed,
+        repeat=args.repeat,
+        results=results,
+    )
+    if args.json:
+        with open(args.json, 'w') as reportfile:
+            json.dump(report, reportfile, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as reportfile:
+            old = json.load(reportfile)
+        sys.exit(1 if compare(old, report, args.threshold) else 0)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# generators -- deterministic synthetic logfiles for every parser
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# builtin
+import datetime
+import random
+
+START = datetime.datetime(2019, 1, 20, 6, 0, 0)
+
+WORDS = (
+    'connection', 'received', 'authorized', 'checkpoint', 'starting', 'fork',
+    'timeout', 'request', 'session', 'closed', 'user', 'database', 'process',
+    'unavailable', 'temporarily', 'resource', 'complete', 'failed',
+)
+PATHS = ('/', '/cron_fast', '/index.html', '/api/v1/items', '/login', '/static/app.js')
+
+
+def message(rnd, words=8):
+    '''random message of words'''
+    return ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(2, words)))
+
+
+def dates(rnd, count, start=START):
+    '''count ascending datetimes, about ten per second'''
+    dateobj = start
+    for _ in range(count):
+        dateobj += datetime.timedelta(microseconds=rnd.randrange(200000))
+        yield dateobj
+
+
+def postgresql(rnd, count, start=START):
+    '''postgresql logfile lines'''
+    for num, dateobj in enumerate(dates(rnd, count, start)):
+        yield '%s CET [%s-%s] %s:  %s\n' % (
+            dateobj.strftime('%Y-%m-%d %H:%M:%S'), rnd.randrange(1000, 30000),
+            num, rnd.choice(('LOG', 'LOG', 'LOG', 'ERROR', 'FATAL')), message(rnd)
+        )
+
+
+def apache2_error(rnd, count, start=START):
+    '''apache2 error logfile lines'''
+    for dateobj in dates(rnd, count, start):
+        yield '[%s] [%s] %s\n' % (
+            dateobj.strftime('%a %b %d %H:%M:%S %Y'),
+            rnd.choice(('error', 'notice', 'warn')), message(rnd)
+        )
+
+
+def apache2_access(rnd, count, start=START):
+    '''apache2 access logfile lines'''
+    for dateobj in dates(rnd, count, start):
+        yield '10.0.%s.%s - - [%s +0100] "GET %s HTTP/1.1" %s - "-" "curl/7.58.0" %s\n' % (
+            rnd.randrange(256), rnd.randrange(256),
+            dateobj.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3], rnd.choice(PATHS),
+            rnd.choice((200, 200, 204, 302, 404, 500)), rnd.randrange(1000, 500000)
+        )
+
+
+def journal(rnd, count, start=START):
+    '''journalctl short-iso lines'''
+    for dateobj in dates(rnd, count, start):
+        yield '%s+0100 host %s[%s]: %s\n' % (
+            dateobj.strftime('%Y-%m-%dT%H:%M:%S'),
+            rnd.choice(('cron', 'sshd', 'kernel', 'systemd')),
+            rnd.randrange(1, 30000), message(rnd)
+        )
+
+
+def measure(rnd, count, start=START):
+    '''measure logfile lines'''
+    for dateobj in dates(rnd, count, start):
+        yield '%s %s %s\n' % (
+            dateobj.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3],
+            rnd.choice(('LOAD', 'MEM', 'DISK', 'NET')), rnd.random() * 100
+        )
+
+
+def auth(rnd, count, start=START):
+    '''auth logfile lines'''
+    for dateobj in dates(rnd, count, start):
+        yield '%s host %s[%s]: %s\n' % (
+            dateobj.strftime('%b %d %H:%M:%S'),
+            rnd.choice(('sshd', 'sudo', 'CRON')), rnd.randrange(1, 30000),
+            message(rnd)
+        )
+
+
+# parser names of sherlock.PARSERS mapped to generators
+GENERATORS = {
+    'postgresql': postgresql,
+    'apache2-error': apache2_error,
+    'apache2-access': apache2_access,
+    'journal': journal,
+    'measure': measure,
+    'auth': auth,
+}
+
+
+def generate(name, count, seed=0, start=START):
+    '''
+    return list of count lines in format of parser name, equal for equal seed
+    '''
+    return list(GENERATORS[name](random.Random(seed), count, start))
+
+
+def write(path, name, count, seed=0, start=START):
+    '''
+    write logfile of count lines in format of parser name to path
+    '''
+    with open(path, 'w', encoding='utf-8') as logfile:
+        logfile.writelines(generate(name, count, seed, start))
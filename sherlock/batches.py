@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# batches -- columnar blocks of records for the batch engine
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# optional, needed by the batch engine only. imported on first use, importing
+# it takes longer than starting pf_sherlock without it
+_numpy = False
+
+
+def load_numpy():
+    '''return numpy module, None if it is not installed'''
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+
+def __getattr__(name):
+    '''module attribute numpy imports numpy on first access'''
+    if name == 'numpy':
+        return load_numpy()
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+class Batch(object):
+
+    '''
+    Block of records of a datasource. Timestamps are held as int64 column
+    for vectorized filters and merging, records are kept for outputs.
+    '''
+
+    __slots__ = ('timestamps', 'records')
+
+    def __init__(self, records, timestamps=None):
+        numpy = load_numpy()
+        assert numpy, 'Batch engine needs numpy!'
+        self.records = records
+        if timestamps is None:
+            timestamps = numpy.fromiter(
+                (line_d.timestamp for line_d in records),
+                dtype=numpy.int64, count=len(records)
+            )
+        self.timestamps = timestamps
+
+    def __len__(self):
+        return len(self.records)
+
+    def select(self, mask):
+        '''return Batch of records where boolean mask is set'''
+        indexes = load_numpy().flatnonzero(mask)
+        records = self.records
+        return Batch([records[index] for index in indexes.tolist()], self.timestamps[indexes])
+
+    def descents(self):
+        '''
+        return positions where timestamps decrease, empty for time ordered
+        batches
+        '''
+        numpy = load_numpy()
+        return numpy.flatnonzero(numpy.diff(self.timestamps) < 0) + 1
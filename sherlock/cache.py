@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# cache -- persistent cache of parsed records of unchanged logfiles
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import array
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+
+VERSION = 1
+
+DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'pf_sherlock')
+
+
+class Entry(object):
+
+    '''
+    Cached records of a logfile, memory mapped from a cache file.
+
+    Columns hold timestamp, code id and offset of the raw line of every
+    record, raw lines are stored one after another behind the columns.
+    '''
+
+    def __init__(self, cachefile, header):
+        self.header = header
+        self.codes = header['codes']
+        count = header['count']
+        self.mapped = mmap.mmap(cachefile.fileno(), 0, access=mmap.ACCESS_READ)
+        position = cachefile.tell()
+        self.timestamps = array.array('q')
+        self.code_ids = array.array('i')
+        self.offsets = array.array('q')
+        for column, size in ((self.timestamps, count), (self.code_ids, count),
+                             (self.offsets, count + 1)):
+            end = position + size * column.itemsize
+            column.frombytes(self.mapped[position:end])
+            position = end
+        self.text = position
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def start(self, timestamp):
+        '''return index of first record having timestamp >= timestamp'''
+        return bisect.bisect_left(self.timestamps, timestamp)
+
+    def record(self, index):
+        '''return code, timestamp and raw line of record at index'''
+        raw_line = self.mapped[
+            self.text + self.offsets[index]:self.text + self.offsets[index + 1]
+        ].decode('utf-8')
+        return self.codes[self.code_ids[index]], self.timestamps[index], raw_line
+
+    def close(self):
+        self.mapped.close()
+
+
+class Writer(object):
+
+    '''
+    Collect records of a logfile and store them as cache file. Raw lines are
+    spooled to a temporary file, columns are kept in memory
+    '''
+
+    def __init__(self, cache, path, parser_name, stat):
+        self.cache = cache
+        self.path = path
+        self.parser_name = parser_name
+        self.stat = stat
+        self.codes = {}
+        self.timestamps = array.array('q')
+        self.code_ids = array.array('i')
+        self.offsets = array.array('q', [0])
+        self.text = tempfile.TemporaryFile(dir=cache.directory)
+
+    def add(self, line_d):
+        '''add record.LineRecord'''
+        code_id = self.codes.get(line_d.code)
+        if code_id is None:
+            code_id = self.codes[line_d.code] = len(self.codes)
+        raw_line = line_d.raw_line.encode('utf-8')
+        self.text.write(raw_line)
+        self.timestamps.append(line_d.timestamp)
+        self.code_ids.append(code_id)
+        self.offsets.append(self.offsets[-1] + len(raw_line))
+
+    def abort(self):
+        '''discard collected records'''
+        self.text.close()
+
+    def commit(self):
+        '''write cache file, evict old cache files if cache is too large'''
+        header = self.cache.header(self.path, self.parser_name, self.stat)
+        header['count'] = len(self.timestamps)
+        header['codes'] = sorted(self.codes, key=self.codes.get)
+        target = self.cache.cache_path(self.path, self.parser_name)
+        name = None
+        try:
+            with tempfile.NamedTemporaryFile(
+                    dir=self.cache.directory, delete=False) as cachefile:
+                name = cachefile.name
+                cachefile.write(json.dumps(header).encode('utf-8'))
+                cachefile.write(b'\n')
+                cachefile.write(self.timestamps.tobytes())
+                cachefile.write(self.code_ids.tobytes())
+                cachefile.write(self.offsets.tobytes())
+                self.text.seek(0)
+                shutil.copyfileobj(self.text, cachefile)
+            os.replace(name, target)
+        except OSError:
+            if name and os.path.exists(name):
+                os.remove(name)
+        finally:
+            self.text.close()
+        self.cache.evict()
+
+
+class RecordCache(object):
+
+    '''
+    Directory of cache files holding parsed records of logfiles, one per
+    logfile and parser. Entries are valid as long as size and mtime of the
+    logfile are unchanged. Least recently used entries are evicted once
+    the directory holds more than max_size bytes
+    '''
+
+    def __init__(self, directory=None, max_size=1024 * 1024 * 1024):
+        self.directory = directory or DEFAULT_DIR
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    def cache_path(self, path, parser_name):
+        '''return path of cache file for logfile at path and parser'''
+        key = '%s\0%s' % (os.path.abspath(path), parser_name)
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, '%s.records' % name)
+
+    def header(self, path, parser_name, stat):
+        '''header identifying logfile state the records were parsed from'''
+        return {
+            'version': VERSION,
+            'path': os.path.abspath(path),
+            'parser': parser_name,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+        }
+
+    def load(self, path, parser_name):
+        '''
+        return Entry of logfile at path if cached and unchanged, else None
+        '''
+        cache_path = self.cache_path(path, parser_name)
+        expected = self.header(path, parser_name, os.stat(path))
+        try:
+            with open(cache_path, 'rb') as cachefile:
+                header = json.loads(cachefile.readline().decode('utf-8'))
+                if any(header.get(key) != value for key, value in expected.items()):
+                    return None
+                entry = Entry(cachefile, header)
+            # mtime of cache file marks last use
+            os.utime(cache_path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def writer(self, path, parser_name):
+        '''return Writer storing records of logfile at path'''
+        return Writer(self, path, parser_name, os.stat(path))
+
+    def evict(self):
+        '''remove least recently used cache files exceeding max_size'''
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.records'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
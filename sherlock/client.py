@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# client -- send queries to a running pf_sherlock daemon
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# only builtin modules on import, the client must start fast
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+
+# directory of the default socket is only accessible by the user
+DEFAULT_SOCKET = os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or '/tmp/pf_sherlock-%s' % os.getuid(),
+    'pf_sherlock.sock'
+)
+
+
+def check_owner(path):
+    '''
+    fail unless path is owned by the user, a socket of another user may fake
+    the daemon
+    '''
+    owner = os.stat(path).st_uid
+    assert owner == os.getuid(), 'Socket %s is owned by uid %s!' % (path, owner)
+
+
+def local_pager(output_name):
+    '''
+    return pager command of output on this terminal, None if output has no
+    pager or stdout is no terminal. the daemon only sends data
+    '''
+    # pf_sherlock has loaded them already for its argument choices
+    from sherlock.outputs import pager_command
+    from sherlock.sherlock import OUTPUTS
+    output_class = OUTPUTS.get(output_name or 'stdout')
+    if not hasattr(output_class, 'pager'):
+        return None
+    return pager_command(output_class)
+
+
+def query(request, socket_path=None, stream=None):
+    '''
+    send request to daemon at socket_path, write result to stream or into
+    $PAGER or the default pager of the output if stdout is a terminal. see
+    daemon.Daemon.query
+    '''
+    socket_path = socket_path or DEFAULT_SOCKET
+    check_owner(socket_path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path)
+    try:
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        response = sock.makefile('rb')
+        header = json.loads(response.readline().decode('utf-8'))
+        if 'error' in header:
+            raise RuntimeError('Query failed in daemon:\n%s' % header['error'])
+        for key, oldest in sorted(header.get('truncated', {}).items()):
+            print(
+                'Warning: daemon keeps records of %s since %s only, older '
+                'lines are missing, see daemon_max_records' % (key, oldest),
+                file=sys.stderr
+            )
+
+        pager = None
+        if stream is None:
+            pager = local_pager(request.get('output'))
+        if pager:
+            proc = subprocess.Popen(pager, stdin=subprocess.PIPE, shell=True)
+            try:
+                shutil.copyfileobj(response, proc.stdin)
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            proc.wait()
+            return
+        if stream is None:
+            stream = sys.stdout.buffer
+        try:
+            shutil.copyfileobj(response, stream)
+            stream.flush()
+        except BrokenPipeError:
+            pass
+    finally:
+        sock.close()
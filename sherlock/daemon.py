@@ -0,0 +1,489 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# daemon -- keep parsed datasources in memory, answer queries over a socket
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# custom
+import sherlock.datasources as datasources
+import sherlock.outputs as outputs
+import sherlock.sherlock as sherlock
+from sherlock.client import DEFAULT_SOCKET, check_owner
+from sherlock.output import BufferedOutput
+from sherlock.timestamps import to_datetime
+
+# builtin
+import array
+import bisect
+import itertools
+import json
+import os
+import socketserver
+import threading
+import time
+import traceback
+
+
+class Store(object):
+
+    '''
+    Parsed records of a datasource kept in memory, at most about max_records
+    of them, oldest records are dropped first, see truncated. Records are read again into a
+    new store whenever size or mtime of the logfiles of the datasource
+    change and swapped in holding lock, queries select records holding lock
+    '''
+
+    def __init__(self, source, lock=None, max_records=1000000):
+        self.source = source
+        self.lock = lock or threading.Lock()
+        self.max_records = max_records
+        self.records = []
+        self.timestamps = array.array('q')
+        # records are in time order, time windows are bisected
+        self.ordered = True
+        # timestamp of oldest record kept once older ones were dropped
+        self.truncated = None
+        self.state = None
+
+    def clear(self):
+        '''drop all records'''
+        self.records = []
+        self.timestamps = array.array('q')
+        self.ordered = True
+        self.truncated = None
+
+    def add(self, line_d):
+        '''append record, drop oldest records beyond max_records'''
+        if self.timestamps and line_d.timestamp < self.timestamps[-1]:
+            self.ordered = False
+        self.records.append(line_d)
+        self.timestamps.append(line_d.timestamp)
+        # dropped in chunks, deleting from the start copies all records
+        if len(self.records) > self.max_records + self.max_records // 8:
+            drop = len(self.records) - self.max_records
+            del self.records[:drop]
+            del self.timestamps[:drop]
+            self.truncated = self.timestamps[0]
+
+    def replace(self, other):
+        '''take records of other store holding lock'''
+        with self.lock:
+            self.records = other.records
+            self.timestamps = other.timestamps
+            self.ordered = other.ordered
+            self.truncated = other.truncated
+
+    def stamp(self):
+        '''
+        return state of logfiles of datasource
+        '''
+        path = self.source.kwargs['path']
+        if isinstance(self.source, datasources.Logset):
+            paths = sorted(self.source.discover(path))
+        else:
+            paths = [path]
+        state = []
+        for member in paths:
+            try:
+                stat = os.stat(member)
+            except FileNotFoundError:
+                continue
+            state.append((member, stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        return state
+
+    def load(self):
+        '''return new store holding all records of datasource'''
+        store = Store(self.source, max_records=self.max_records)
+        self.source.start()
+        for line_d in self.source.run():
+            store.add(line_d)
+        return store
+
+    def refresh(self):
+        '''read datasource again if it changed'''
+        state = self.stamp()
+        if state == self.state:
+            return
+        self.replace(self.load())
+        self.state = state
+
+    def select(self, start, end, filters, reverse=False):
+        '''
+        yield records within time window passing filters, newest first if
+        reverse is set. caller holds lock
+        '''
+        first, last = 0, len(self.records)
+        if self.ordered:
+            if start is not None:
+                first = bisect.bisect_left(self.timestamps, start)
+            if end is not None:
+                last = bisect.bisect_left(self.timestamps, end)
+        indexes = range(first, last)
+        if reverse:
+            indexes = reversed(indexes)
+        raw_filters = [lfilter for lfilter in filters if lfilter.raw()]
+        line_filters = [lfilter for lfilter in filters if not lfilter.raw()]
+        records = self.records
+        for index in indexes:
+            line_d = records[index]
+            if all(lfilter.run_raw(line_d.raw_line) for lfilter in raw_filters) and \
+                    all(lfilter.run(line_d) for lfilter in line_filters):
+                yield line_d
+
+
+class CommandStore(Store):
+
+    '''
+    Parsed records of a shell command kept in memory. The command runs again
+    in a background thread at most every interval seconds, never while a
+    query waits. Its records replace the previous ones once it ends. A
+    command still running after interval seconds, e.g. "journalctl -f", has
+    its records swapped in then and appended while it runs
+    '''
+
+    def __init__(self, source, lock=None, max_records=1000000, interval=5.0):
+        super().__init__(source, lock, max_records)
+        self.interval = interval
+        self.thread = None
+        self.started = None
+
+    def refresh(self):
+        '''start command unless it runs or ran within interval'''
+        if self.thread is not None and self.thread.is_alive():
+            return
+        now = time.monotonic()
+        if self.started is not None and now - self.started < self.interval:
+            return
+        self.started = now
+        self.thread = threading.Thread(target=self.load, daemon=True)
+        self.thread.start()
+
+    def wait(self, timeout):
+        '''wait at most timeout seconds for running command'''
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def load(self):
+        '''run command, swap in its records'''
+        store = Store(self.source, max_records=self.max_records)
+        published = False
+        deadline = time.monotonic() + self.interval
+        self.source.start()
+        for line_d in self.source.run():
+            if published:
+                with self.lock:
+                    self.add(line_d)
+                continue
+            store.add(line_d)
+            if time.monotonic() >= deadline:
+                self.replace(store)
+                published = True
+        if not published:
+            self.replace(store)
+
+
+class LogfileStore(Store):
+
+    '''
+    Parsed records of a logfile kept in memory. The logfile is kept open,
+    appended lines are parsed on refresh and added holding lock. A rotated
+    logfile is reopened, a truncated one is read again from the start. A last
+    line lacking its line break is read once it is complete
+    '''
+
+    def __init__(self, source, lock=None, max_records=1000000):
+        super().__init__(source, lock, max_records)
+        self.logfile = None
+        self.offset = 0
+
+    def refresh(self):
+        '''parse lines appended since last refresh'''
+        path = self.source.kwargs['path']
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        reopened = False
+        if self.logfile is None or stat.st_size < self.offset or \
+                stat.st_ino != os.fstat(self.logfile.fileno()).st_ino:
+            if self.logfile is not None:
+                self.logfile.close()
+            self.logfile = open(path, 'rb')
+            self.offset = 0
+            reopened = True
+        if stat.st_size == self.offset and not reopened:
+            return
+
+        lines = []
+        self.logfile.seek(self.offset)
+        for line in self.logfile:
+            if not line.endswith(b'\n'):
+                break
+            line_d = self.source.parse(line.decode('utf-8'))
+            if line_d:
+                line_d.offset = self.offset
+                lines.append(line_d)
+            self.offset += len(line)
+        with self.lock:
+            if reopened:
+                self.clear()
+            for line_d in lines:
+                self.add(line_d)
+
+    def close(self):
+        '''close logfile'''
+        if self.logfile is not None:
+            self.logfile.close()
+            self.logfile = None
+
+
+class SocketOutput(BufferedOutput):
+
+    '''
+    Write raw lines to the socket of a query
+    '''
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write_data(self, data):
+        '''write data to socket'''
+        self.stream.write(data.encode('utf-8'))
+
+
+class Handler(socketserver.StreamRequestHandler):
+
+    '''
+    Read one query as json line, answer with json header line followed by
+    result text
+    '''
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            self.server.daemon.query(request, self.wfile)
+        except BrokenPipeError:
+            pass
+        except Exception:
+            self.wfile.write(json.dumps({
+                'error': traceback.format_exc()
+            }).encode('utf-8') + b'\n')
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+
+class Daemon(object):
+
+    '''
+    Long running pf_sherlock. Config is loaded once, datasources are parsed
+    once and kept in memory, see Store. Queries carry filter_map, output,
+    output_options, head and tail like pf_sherlock arguments and are
+    answered from memory after reading what changed in logfiles since the
+    last query. Logfiles are refreshed in the background every interval
+    seconds too, shell commands only run there, see CommandStore. The lock
+    is held to select records of a query, not while writing them
+    '''
+
+    def __init__(self, sources, socket_path=None, filter_map=None,
+                 output_options=None, interval=5.0, max_records=1000000):
+        '''
+        - sources: unfiltered datasource instances keyed like in Sherlock
+        - filter_map: filters of every query, query filters are added
+        - output_options: output arguments keyed by output name
+        - max_records: records kept per datasource, oldest are dropped
+        '''
+        self.socket_path = socket_path or DEFAULT_SOCKET
+        self.filter_map = filter_map or {}
+        self.output_options = output_options or {}
+        self.interval = interval
+        self.lock = threading.Lock()
+        # refreshes of queries and refresher thread take turns
+        self.refreshing = threading.Lock()
+        self.stores = {}
+        for key, source in sources.items():
+            if type(source) is datasources.Logfile:
+                store = LogfileStore(source, self.lock, max_records)
+            elif 'path' in source.kwargs:
+                store = Store(source, self.lock, max_records)
+            else:
+                store = CommandStore(source, self.lock, max_records, interval)
+            self.stores[key] = store
+        self.stop = threading.Event()
+        self.server = None
+
+    def refresh(self, commands=True):
+        '''
+        read what changed in logfiles, start shell commands not run within
+        interval if commands is set
+        '''
+        with self.refreshing:
+            for store in self.stores.values():
+                if commands or not isinstance(store, CommandStore):
+                    store.refresh()
+
+    def refresher(self):
+        '''refresh datasources every interval seconds until stopped'''
+        while not self.stop.wait(self.interval):
+            self.refresh()
+
+    def query(self, request, stream):
+        '''
+        write header and result of query to stream
+        '''
+        filter_map = dict(self.filter_map)
+        filter_map.update(request.get('filter_map') or {})
+        filters = sherlock.build_filters(filter_map)
+        start = end = None
+        for lfilter in filters:
+            fstart, fend = lfilter.window()
+            if fstart is not None and (start is None or fstart > start):
+                start = fstart
+            if fend is not None and (end is None or fend < end):
+                end = fend
+
+        output_name = request.get('output') or 'stdout'
+        assert output_name in sherlock.OUTPUTS, 'Unknown output %s' % output_name
+        options = dict(self.output_options.get(output_name, {}))
+        options.update((request.get('output_options') or {}).get(output_name, {}))
+        output_class = sherlock.OUTPUTS[output_name]
+        if output_class in (outputs.StdOut, outputs.SimplePager):
+            output = SocketOutput(stream)
+        else:
+            output = output_class(**options)
+
+        head, tail = request.get('head'), request.get('tail')
+        self.refresh(commands=False)
+        # selected records are copied, slow clients do not block the lock.
+        # no datasource contributes more than head or tail lines
+        selected = {}
+        # datasources missing records of the time window, their oldest kept
+        truncated = {}
+        with self.lock:
+            for key, store in self.stores.items():
+                lines = store.select(start, end, filters, reverse=bool(tail))
+                if tail or head:
+                    lines = itertools.islice(lines, tail or head)
+                selected[key] = list(lines)
+                if store.truncated is None or (tail and len(selected[key]) == tail):
+                    continue
+                if start is None or start < store.truncated:
+                    truncated[key] = str(to_datetime(store.truncated))
+
+        # only data is sent, the client picks its pager, see client.local_pager
+        stream.write(json.dumps({'truncated': truncated}).encode('utf-8') + b'\n')
+
+        iterators = {key: iter(lines) for key, lines in selected.items()}
+        if output.needs_source:
+            iterators = {
+                key: self.tagged(key, iterator)
+                for key, iterator in iterators.items()
+            }
+        if tail:
+            lines = sherlock.MERGERS['reverse'](iterators).run()
+            lines = reversed(list(itertools.islice(lines, tail)))
+        else:
+            lines = sherlock.MERGERS['heap'](iterators).run()
+        if head:
+            lines = itertools.islice(lines, head)
+        output.setup()
+        batch = list(itertools.islice(lines, sherlock.Sherlock.batch_size))
+        while batch:
+            output.write_batch(batch)
+            batch = list(itertools.islice(lines, sherlock.Sherlock.batch_size))
+        output.close()
+
+        render = getattr(output, 'render', None)
+        if render:
+            lines = render()
+            chunk = []
+            for line in lines:
+                chunk.append(line)
+                if len(chunk) >= 1000:
+                    stream.write(('\n'.join(chunk) + '\n').encode('utf-8'))
+                    chunk = []
+            if chunk:
+                stream.write(('\n'.join(chunk) + '\n').encode('utf-8'))
+
+    @staticmethod
+    def tagged(key, iterator):
+        '''yield lines of iterator, set source of lines to key'''
+        for line_d in iterator:
+            line_d.source = key
+            yield line_d
+
+    def serve(self):
+        '''
+        parse datasources and answer queries on socket until shutdown
+        '''
+        self.refresh()
+        # first runs of shell commands swap in their records after interval
+        # seconds at the latest
+        for store in self.stores.values():
+            if isinstance(store, CommandStore):
+                store.wait(self.interval + 1)
+        if self.socket_path == DEFAULT_SOCKET:
+            directory = os.path.dirname(self.socket_path)
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            check_owner(directory)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.server = Server(self.socket_path, Handler)
+        self.server.daemon = self
+        thread = threading.Thread(target=self.refresher, daemon=True)
+        thread.start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.stop.set()
+            self.server.server_close()
+            os.remove(self.socket_path)
+            for store in self.stores.values():
+                if isinstance(store, LogfileStore):
+                    store.close()
+
+    def shutdown(self):
+        '''stop serving, called from another thread'''
+        self.server.shutdown()
+
+    @staticmethod
+    def from_args(args):
+        '''
+        build and return Daemon instance from argparse args object, like
+        Sherlock.from_args. filters of config apply to every query
+        '''
+        assert os.path.isfile(args.config), 'Invalid configpath: %s' % args.config
+        config = sherlock.Sherlock.load_config(args.config)
+        s = sherlock.Sherlock(
+            logfile_map=config.logfile_map,
+            shellcmd_map=config.shellcmd_map,
+            output_name='stdout',
+            source_options=getattr(config, 'source_options', None),
+            async_shell=getattr(config, 'async_shell', False),
+            logset_map=getattr(config, 'logset_map', None),
+        )
+        return Daemon(
+            s.sources,
+            socket_path=args.socket or getattr(config, 'daemon_socket', None),
+            filter_map=getattr(config, 'filter_map', None),
+            output_options=getattr(config, 'output_options', None),
+            interval=getattr(config, 'daemon_interval', 5.0),
+            max_records=getattr(config, 'daemon_max_records', 1000000),
+        )
@@ -20,6 +20,11 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from abc import ABC  # abstract base class
+from sherlock.batches import Batch, load_numpy
+from sherlock.cache import RecordCache
+from sherlock.record import LineRecord
+import collections
+import time
 
 
 class Datasource(ABC):
@@ -39,8 +44,281 @@ class Datasource(ABC):
         self.filters = filters
         self.kwargs = kwargs
 
+        # filters only needing raw lines run before parsing
+        self.raw_filters = [lfilter for lfilter in filters if lfilter.raw()]
+        self.line_filters = [lfilter for lfilter in filters if not lfilter.raw()]
+
+        # stats.SourceStats if counters and timers are enabled
+        self.stats = None
+
     def run(self):
         '''
         - must yield parsed lines
         '''
         pass
+
+    def run_batches(self, size=4096):
+        '''
+        - yield batches.Batch of records returned by run
+        - vectorized filters are applied to batches instead of single records
+        '''
+        vectorized = [lfilter for lfilter in self.filters if lfilter.vectorized]
+        self.line_filters = [
+            lfilter for lfilter in self.line_filters if not lfilter.vectorized
+        ]
+        records = []
+        for line_d in self.run():
+            records.append(line_d)
+            if len(records) >= size:
+                batch = self.mask(Batch(records), vectorized)
+                if len(batch):
+                    yield batch
+                records = []
+        if records:
+            batch = self.mask(Batch(records), vectorized)
+            if len(batch):
+                yield batch
+
+    def run_reverse(self, limit=None):
+        '''
+        - yield parsed lines newest first, lines older than the newest limit
+          ones may be left out
+        - reads all lines returned by run and keeps the newest limit ones,
+          see Logfile for reading backwards
+        '''
+        lines = collections.deque(self.run(), maxlen=limit)
+        while lines:
+            yield lines.pop()
+
+    def mask(self, batch, vectorized):
+        '''
+        - return batch of records passing vectorized filters
+        '''
+        if not vectorized:
+            return batch
+        mask = load_numpy().ones(len(batch), dtype=bool)
+        for lfilter in vectorized:
+            passed = mask & lfilter.mask(batch.timestamps)
+            if self.stats is not None:
+                dropped = int(mask.sum() - passed.sum())
+                self.stats.drop(type(lfilter).__name__, dropped)
+                self.stats.passed -= dropped
+            mask = passed
+        if mask.all():
+            return batch
+        return batch.select(mask)
+
+    def start(self):
+        '''
+        - optional, start fetching data in background. called for all
+          datasources before run when parsing inline
+        '''
+        pass
+
+    def seeks(self):
+        '''
+        - return True if only the time window of filters is read by bisecting
+          or by the time index. needs time ordered logfiles, so "seek" or
+          "index" argument must be set
+        '''
+        return bool(self.kwargs.get('seek') or self.kwargs.get('index'))
+
+    def parse(self, line):
+        '''
+        - parse line, return record.LineRecord or None if parser dropped it.
+          logfiles are read as bytes, "\r\n" line breaks become "\n" like
+          in text mode
+        '''
+        if line.endswith('\r\n'):
+            line = line[:-2] + '\n'
+        line_d = self.parser.run(line)
+        if type(line_d) is dict:  # custom parser
+            return LineRecord.from_dict(line_d)
+        return line_d
+
+    def process(self, line):
+        '''
+        - run raw filters against line, parse surviving line and run
+          remaining filters against it
+        - return record.LineRecord or None if parser or a filter dropped it
+        '''
+        if self.stats is not None:
+            return self.process_counted(line)
+        for lfilter in self.raw_filters:
+            if not lfilter.run_raw(line):
+                return
+        return self.process_parsed(line)
+
+    def process_bytes(self, line, newline=True):
+        '''
+        - like process, but run raw filters against undecoded line without
+          line break and only decode surviving line
+        - newline is False for a last line not ending with line break
+        '''
+        if self.stats is not None:
+            return self.process_counted(line, newline)
+        for lfilter in self.raw_filters:
+            if not lfilter.run_bytes(line):
+                return
+        line = line.decode('utf-8')
+        if newline:
+            line += '\n'
+        return self.process_parsed(line)
+
+    def process_parsed(self, line):
+        '''
+        - parse line which passed raw filters and run remaining filters
+        '''
+        line_d = self.parse(line)
+        if not line_d:
+            return
+        for lfilter in self.line_filters:
+            if not lfilter.run(line_d):
+                return
+        return line_d
+
+    def process_counted(self, line, newline=None):
+        '''
+        - like process, counting lines and timing parser and filters in
+          self.stats
+        - newline is None for decoded lines, see process_bytes otherwise
+        '''
+        stats = self.stats
+        stats.lines += 1
+        stats.bytes += len(line)
+        clock = time.perf_counter
+        start = clock()
+        for lfilter in self.raw_filters:
+            if newline is None:
+                passed = lfilter.run_raw(line)
+            else:
+                passed = lfilter.run_bytes(line)
+            if not passed:
+                stats.filter_time += clock() - start
+                stats.drop(type(lfilter).__name__)
+                return
+        if newline is not None:
+            line = line.decode('utf-8')
+            if newline:
+                line += '\n'
+
+        parsed = clock()
+        stats.filter_time += parsed - start
+        line_d = self.parse(line)
+        start = clock()
+        stats.parse_time += start - parsed
+        if not line_d:
+            stats.rejected += 1
+            return
+        for lfilter in self.line_filters:
+            if not lfilter.run(line_d):
+                stats.filter_time += clock() - start
+                stats.drop(type(lfilter).__name__)
+                return
+        stats.filter_time += clock() - start
+        stats.passed += 1
+        return line_d
+
+    def cache(self):
+        '''
+        - return cache.RecordCache of "cache" argument, a directory or True
+          for the default one. None if records are not cached or the cache
+          directory is not writable
+        - "cache_size" argument is the size cap of the cache in MB
+        '''
+        option = self.kwargs.get('cache')
+        if not option:
+            return None
+        try:
+            return RecordCache(
+                option if isinstance(option, str) else None,
+                int(self.kwargs.get('cache_size', 1024)) * 1024 * 1024
+            )
+        except OSError:  # cache directory can not be created
+            return None
+
+    def run_cached(self, cache, path, lines):
+        '''
+        - yield records of logfile at path from cache, filtered like process
+        - on cache miss call lines for raw lines of logfile, parse all of
+          them and store records in cache
+        '''
+        parser_name = type(self.parser).__name__
+        entry = cache.load(path, parser_name)
+        if entry is not None:
+            try:
+                yield from self.replay(entry)
+            finally:
+                entry.close()
+            return
+
+        writer = cache.writer(path, parser_name)
+        try:
+            for line in lines():
+                line_d = self.parse(line)
+                if line_d:
+                    writer.add(line_d)
+                if self.check(line, line_d):
+                    yield line_d
+        except BaseException:
+            writer.abort()
+            raise
+        writer.commit()
+
+    def replay(self, entry):
+        '''
+        - yield filtered records of cache.Entry, only within time window of
+          filters if seeking, see seeks
+        '''
+        first, last = 0, len(entry)
+        if self.seeks():
+            start, end = self.window()
+            if start is not None:
+                first = entry.start(start)
+            if end is not None:
+                last = entry.start(end)
+        for index in range(first, last):
+            code, timestamp, raw_line = entry.record(index)
+            line_d = LineRecord(code, timestamp, raw_line)
+            if self.check(raw_line, line_d):
+                yield line_d
+
+    def check(self, line, line_d):
+        '''
+        - return True if parsed line passes all filters, count it in stats
+        '''
+        stats = self.stats
+        if stats is not None:
+            stats.lines += 1
+            stats.bytes += len(line)
+        if not line_d:
+            if stats is not None:
+                stats.rejected += 1
+            return False
+        for lfilter in self.raw_filters:
+            if not lfilter.run_raw(line):
+                if stats is not None:
+                    stats.drop(type(lfilter).__name__)
+                return False
+        for lfilter in self.line_filters:
+            if not lfilter.run(line_d):
+                if stats is not None:
+                    stats.drop(type(lfilter).__name__)
+                return False
+        if stats is not None:
+            stats.passed += 1
+        return True
+
+    def window(self):
+        '''
+        - combine time windows of all filters to (start, end) timestamps,
+          None if unbounded
+        '''
+        start = end = None
+        for lfilter in self.filters:
+            fstart, fend = lfilter.window()
+            if fstart is not None and (start is None or fstart > start):
+                start = fstart
+            if fend is not None and (end is None or fend < end):
+                end = fend
+        return start, end
@@ -20,16 +20,78 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from sherlock.datasource import Datasource
+from sherlock.index import TimeIndex
+import bz2
+import codecs
+import glob
+import gzip
+import lzma
+import mmap
 import os
+import queue
+import re
 import subprocess
+import threading
+import time
+
+# magic bytes of compressed files mapped to functions opening them
+COMPRESSIONS = {
+    b'\x1f\x8b': gzip.open,
+    b'BZh': bz2.open,
+    b'\xfd7zXZ\x00': lzma.open,
+}
+
+# suffix of rotated logfiles, e.g. ".1", ".2.gz" or "-20190120.xz"
+ROTATED = re.compile(r'^[.-][0-9]+(\.(gz|bz2|xz))?$')
+
+
+def compression(path):
+    '''
+    return function opening compressed file at path, None if path is not
+    compressed
+    '''
+    with open(path, 'rb') as logfile:
+        head = logfile.read(6)
+    for magic, opener in COMPRESSIONS.items():
+        if head.startswith(magic):
+            return opener
+
+
+def split_lines(blocks):
+    '''
+    decode blocks of bytes and yield lines including line break, the last
+    line may lack it
+    '''
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    rest = ''
+    for block in blocks:
+        lines = (rest + decoder.decode(block)).split('\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line + '\n'
+
+    rest += decoder.decode(b'', final=True)
+    if rest:
+        yield rest
 
 
 class Logfile(Datasource):
 
     '''
-    Simple Logfile datasource
+    Simple Logfile datasource. With "seek" argument set, time ordered
+    logfiles are bisected for the time window of filters. With "index"
+    argument set, a persistent time index is used instead of bisecting, see
+    index.TimeIndex. "index_step" (KB) and "index_dir" configure the index.
+    "reader" argument "mmap" memory maps the logfile and only decodes lines
+    passing raw filters. With "follow" argument set, appended lines are
+    returned endlessly, polling every "interval" seconds. Like "tail -f",
+    following starts at the end unless filters have a time window start.
+    "cache" argument
+    keeps parsed records of unchanged logfiles, see Datasource.cache
     '''
 
+    blocksize = 1024 * 1024
+
     def run(self):
         '''
         read file bytes, decode and return
@@ -38,22 +100,471 @@ class Logfile(Datasource):
         assert 'path' in self.kwargs, 'Needs path argument!'
         path = self.kwargs['path']
         assert os.path.isfile(path), 'Path must be a valid file: %s' % path
+        reader = self.kwargs.get('reader', 'lines')
+        assert reader in ('lines', 'mmap'), 'Unknown reader: %s' % reader
+
+        cache = self.cache()
+        if cache and not self.kwargs.get('follow'):
+            yield from self.run_cached(cache, path, lambda: self.lines(path))
+            return
+
+        with open(path, 'rb') as logfile:
+            offset, end = 0, None
+            if self.seeks():
+                offset, end = self.seek(logfile)
+
+            if self.kwargs.get('follow'):
+                if self.window()[0] is None:
+                    offset = self.last_line_end(logfile)
+                logfile.seek(offset)
+                yield from self.follow(logfile, offset)
+                return
+
+            if reader == 'mmap':
+                yield from self.mmap_lines(logfile, offset, end)
+                return
+
+            logfile.seek(offset)
+            for line in logfile:
+                if end is not None and offset >= end:
+                    break
+                line_d = self.process(line.decode('utf-8'))
+                if line_d:
+                    line_d.offset = offset
+                    yield line_d
+                offset += len(line)
 
-        logfile = open(path, 'r', encoding='utf-8')
+    def run_reverse(self, limit=None):
+        '''
+        read blocks backwards from end of logfile or time window, return
+        parsed lines newest first. costs scale with lines read, not with
+        size of the logfile
+        '''
+        assert 'path' in self.kwargs, 'Needs path argument!'
+        path = self.kwargs['path']
+        assert os.path.isfile(path), 'Path must be a valid file: %s' % path
+
+        with open(path, 'rb') as logfile:
+            offset, end = 0, None
+            if self.seeks():
+                offset, end = self.seek(logfile)
+            size = os.fstat(logfile.fileno()).st_size
+            if end is None or end > size:
+                end = size
+            for line_offset, line, newline in self.reverse_lines(logfile, offset, end):
+                line_d = self.process_bytes(line, newline)
+                if line_d:
+                    line_d.offset = line_offset
+                    yield line_d
+
+    def reverse_lines(self, logfile, offset, end):
+        '''
+        yield offset, bytes and line break flag of lines between byte offsets
+        of logfile, last line first. lines are returned without line break
+        '''
+        position = end
+        # bytes from position on not returned yet, begins with partial line
+        pending = b''
         while True:
-            line = logfile.readline()
-            if line:
-                line_d = self.parser.run(line)
-                if not line_d:
+            if position > offset:
+                start = max(offset, position - self.blocksize)
+                logfile.seek(start)
+                pending = logfile.read(position - start) + pending
+                position = start
+            # lines behind first line break are complete
+            cut = pending.find(b'\n') + 1 if position > offset else 0
+            if position > offset and not cut:
+                continue
+            lines = pending[cut:].split(b'\n')
+            line_offset = position + len(pending)
+            pending = pending[:cut]
+            last = lines.pop()
+            if last:  # last line of window lacks line break
+                line_offset -= len(last)
+                yield line_offset, last, False
+            for line in reversed(lines):
+                line_offset -= len(line) + 1
+                yield line_offset, line, True
+            if position <= offset:
+                return
+
+    def lines(self, path):
+        '''
+        yield decoded lines of logfile at path
+        '''
+        with open(path, 'rb') as logfile:
+            for line in logfile:
+                yield line.decode('utf-8')
+
+    def follow(self, logfile, offset):
+        '''
+        yield parsed lines from offset on, wait for appended lines at end of
+        logfile. a rotated logfile is reopened, a truncated one is read again
+        from the start
+        '''
+        path = self.kwargs['path']
+        interval = float(self.kwargs.get('interval', 0.5))
+        partial = b''
+        try:
+            while True:
+                line = logfile.readline()
+                if line:
+                    # incomplete lines are kept until their line break arrives
+                    partial += line
+                    if not partial.endswith(b'\n'):
+                        continue
+                    line, partial = partial, b''
+                    line_d = self.process(line.decode('utf-8'))
+                    if line_d:
+                        line_d.offset = offset
+                        yield line_d
+                    offset += len(line)
                     continue
-                for lfilter in self.filters:
-                    if not lfilter.run(line_d):
-                        break
-                else:  # nobreak - all filters returned True
-                    yield line_d
+
+                try:
+                    current = os.stat(path)
+                except FileNotFoundError:
+                    current = None
+                if current and current.st_ino != os.fstat(logfile.fileno()).st_ino:
+                    logfile.close()
+                    logfile = open(path, 'rb')
+                    offset, partial = 0, b''
+                elif current and current.st_size < offset + len(partial):
+                    logfile.seek(0)
+                    offset, partial = 0, b''
+                else:
+                    time.sleep(interval)
+        finally:
+            logfile.close()
+
+    def last_line_end(self, logfile):
+        '''
+        return offset behind last line break of logfile
+        '''
+        size = os.fstat(logfile.fileno()).st_size
+        start = max(size - self.blocksize, 0)
+        logfile.seek(start)
+        return start + logfile.read(size - start).rfind(b'\n') + 1
+
+    def mmap_lines(self, logfile, offset, end):
+        '''
+        yield parsed lines between byte offsets of memory mapped logfile.
+        lines are split in blocks, blocks and lines are checked by raw filters
+        before decoding
+        '''
+        size = os.fstat(logfile.fileno()).st_size
+        if end is None or end > size:
+            end = size
+        if offset >= end:
+            return
+
+        with mmap.mmap(logfile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            while offset < end:
+                # cut block behind its last line break, long lines extend it
+                stop = min(offset + self.blocksize, end)
+                cut = mapped.rfind(b'\n', offset, stop) + 1
+                if not cut:
+                    cut = mapped.find(b'\n', stop, end) + 1 or end
+                block = mapped[offset:cut]
+                skipped = [
+                    lfilter for lfilter in self.raw_filters
+                    if lfilter.skip_block(block)
+                ]
+                if skipped:
+                    if self.stats is not None:
+                        count = block.count(b'\n') + (not block.endswith(b'\n'))
+                        self.stats.lines += count
+                        self.stats.bytes += len(block)
+                        self.stats.drop(type(skipped[0]).__name__, count)
+                    offset = cut
+                    continue
+                lines = block.split(b'\n')
+                last = lines.pop()
+                for line in lines:
+                    line_d = self.process_bytes(line)
+                    if line_d:
+                        line_d.offset = offset
+                        yield line_d
+                    offset += len(line) + 1
+                if last:
+                    line_d = self.process_bytes(last, newline=False)
+                    if line_d:
+                        line_d.offset = offset
+                        yield line_d
+                    offset += len(last)
+
+    def seek(self, logfile):
+        '''
+        return byte offsets of first line to read and behind last line to
+        read by bisecting logfile or looking up the time index for time
+        window of filters
+        '''
+        start, end = self.window()
+
+        if self.kwargs.get('index'):
+            index = TimeIndex(
+                self.kwargs['path'],
+                type(self.parser).__name__,
+                step=int(self.kwargs.get('index_step', 256)) * 1024,
+                index_dir=self.kwargs.get('index_dir'),
+            )
+            index.update(logfile, self.probe)
+            return (
+                index.start(start) if start is not None else 0,
+                index.end(end) if end is not None else None,
+            )
+
+        if start is None and end is None:
+            return 0, None
+        size = os.fstat(logfile.fileno()).st_size
+        first = self.bisect(logfile, start, size) if start is not None else 0
+        last = self.bisect(logfile, end, size) if end is not None else None
+        return first, last
+
+    def bisect(self, logfile, timestamp, size):
+        '''
+        return offset of first line having timestamp >= timestamp
+        '''
+        low, high = 0, size
+        while low < high:
+            mid = (low + high) // 2
+            _, found = self.probe(logfile, mid)
+            if found is None or found >= timestamp:
+                high = mid
             else:
-                logfile.close()
+                low = mid + 1
+        return self.probe(logfile, low)[0]
+
+    def probe(self, logfile, offset):
+        '''
+        return offset and timestamp of first parsable line starting at or
+        behind offset. timestamp is None if there is none
+        '''
+        # resync to line boundary, byte before offset ends previous line
+        if offset:
+            logfile.seek(offset - 1)
+            offset += len(logfile.readline()) - 1
+        else:
+            logfile.seek(0)
+
+        for line in iter(logfile.readline, b''):
+            line_d = self.parse(line.decode('utf-8', 'replace'))
+            if line_d:
+                return offset, line_d.timestamp
+            offset += len(line)
+        return offset, None
+
+
+class Compressedfile(Datasource):
+
+    '''
+    Compressed logfile datasource, gzip, bzip2 and xz are detected by magic
+    bytes. Decompresses large blocks in a background thread unless
+    "threaded" argument is False. "cache" argument keeps parsed records,
+    later runs skip decompressing and parsing, see Datasource.cache
+    '''
+
+    blocksize = 1024 * 1024
+
+    @staticmethod
+    def accepts(path):
+        '''return True if file at path is compressed'''
+        return compression(path) is not None
+
+    def run(self):
+        '''
+        decompress and decode blocks, split them into lines and return
+        '''
+
+        assert 'path' in self.kwargs, 'Needs path argument!'
+        path = self.kwargs['path']
+        assert os.path.isfile(path), 'Path must be a valid file: %s' % path
+        opener = compression(path)
+        assert opener, 'Path must be a compressed file: %s' % path
+
+        cache = self.cache()
+        if cache:
+            yield from self.run_cached(cache, path, lambda: self.lines(opener, path))
+            return
+
+        for line in self.lines(opener, path):
+            line_d = self.process(line)
+            if line_d:
+                yield line_d
+
+    def lines(self, opener, path):
+        '''
+        yield decoded lines of compressed file at path
+        '''
+        if self.kwargs.get('threaded', True):
+            blocks = self.threaded_blocks(opener, path)
+        else:
+            blocks = self.blocks(opener, path)
+        return split_lines(blocks)
+
+    def blocks(self, opener, path):
+        '''
+        yield decompressed blocks of file at path
+        '''
+        with opener(path, 'rb') as logfile:
+            for block in iter(lambda: logfile.read(self.blocksize), b''):
+                yield block
+
+    def threaded_blocks(self, opener, path):
+        '''
+        yield decompressed blocks of file at path, decompression runs in a
+        background thread feeding a bounded queue
+        '''
+        blocks = queue.Queue(maxsize=4)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    blocks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def decompress():
+            try:
+                for block in self.blocks(opener, path):
+                    if not put(block):
+                        return
+                put(None)
+            except Exception as exc:
+                put(exc)
+
+        thread = threading.Thread(target=decompress, daemon=True)
+        thread.start()
+        try:
+            while True:
+                block = blocks.get()
+                if block is None:
+                    break
+                if isinstance(block, Exception):
+                    raise block
+                yield block
+        finally:
+            stop.set()
+            thread.join()
+
+
+class Logset(Datasource):
+
+    '''
+    Logfile and its rotated siblings read one after another as one stream.
+    "path" argument is the current logfile, rotations named like "path.1"
+    or "path.2.gz" are discovered next to it, or a glob pattern matching
+    all logfiles of the set. Logfiles are ordered by their first timestamp
+    and must not overlap in time. Logfiles before or behind the time window
+    of filters are not opened. Other arguments are passed to the Logfile or
+    Compressedfile datasource of each logfile, "follow" only applies to the
+    newest logfile. Without time window start only the newest logfile is
+    followed, from its end
+    '''
+
+    def run(self):
+        '''
+        yield parsed lines of logfiles of the set, oldest first
+        '''
+        assert 'path' in self.kwargs, 'Needs path argument!'
+        paths = self.discover(self.kwargs['path'])
+        assert paths, 'No logfiles found for: %s' % self.kwargs['path']
+
+        members = self.members(paths)
+        start, end = self.window()
+        if self.kwargs.get('follow') and start is None:
+            members = members[-1:]
+        for num, (first, path) in enumerate(members):
+            following = members[num + 1][0] if num + 1 < len(members) else None
+            # logfile ends before the next one starts
+            if start is not None and following is not None and following <= start:
+                continue
+            if end is not None and first is not None and first >= end:
+                break
+            yield from self.datasource(path, following is None).run()
+
+    def run_reverse(self, limit=None):
+        '''
+        yield parsed lines of logfiles of the set newest first, at most
+        limit lines
+        '''
+        assert 'path' in self.kwargs, 'Needs path argument!'
+        paths = self.discover(self.kwargs['path'])
+        assert paths, 'No logfiles found for: %s' % self.kwargs['path']
+
+        members = self.members(paths)
+        start, end = self.window()
+        count = 0
+        for num in range(len(members) - 1, -1, -1):
+            first, path = members[num]
+            following = members[num + 1][0] if num + 1 < len(members) else None
+            if end is not None and first is not None and first >= end:
+                continue
+            if start is not None and following is not None and following <= start:
                 break
+            remaining = limit - count if limit is not None else None
+            for line_d in self.datasource(path, False).run_reverse(remaining):
+                yield line_d
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+    @staticmethod
+    def discover(path):
+        '''
+        return paths of logfiles matching glob pattern or of logfile at path
+        and its rotations
+        '''
+        if glob.has_magic(path):
+            paths = glob.glob(path)
+        else:
+            paths = [
+                sibling for sibling in glob.glob(glob.escape(path) + '*')
+                if sibling == path or ROTATED.match(sibling[len(path):])
+            ]
+        return [sibling for sibling in paths if os.path.isfile(sibling)]
+
+    def members(self, paths):
+        '''
+        return list of (first timestamp, path) ordered by time. logfiles
+        without parsable lines come first, they yield nothing anyway
+        '''
+        members = [(self.first(path), path) for path in paths]
+        return sorted(
+            members,
+            key=lambda member: (member[0] is not None, member[0] or 0, member[1])
+        )
+
+    def first(self, path):
+        '''
+        return timestamp of first parsable line of logfile at path, None if
+        there is none
+        '''
+        opener = compression(path) or open
+        with opener(path, 'rb') as logfile:
+            for line in logfile:
+                line_d = self.parse(line.decode('utf-8', 'replace'))
+                if line_d:
+                    return line_d.timestamp
+        return None
+
+    def datasource(self, path, newest):
+        '''
+        return datasource reading logfile at path, sharing parser, filters
+        and stats of the set
+        '''
+        kwargs = dict(self.kwargs, path=path)
+        if not newest:
+            kwargs.pop('follow', None)
+        if compression(path):
+            source = Compressedfile(self.parser, self.filters, **kwargs)
+        else:
+            source = Logfile(self.parser, self.filters, **kwargs)
+        source.stats = self.stats
+        return source
 
 
 class Shellcommand(Datasource):
@@ -82,13 +593,59 @@ class Shellcommand(Datasource):
 
             line = proc.stdout.readline().decode('utf-8')
             if line:
-                line_d = self.parser.run(line)
-                if not line_d:
-                    continue
-                for lfilter in self.filters:
-                    if not lfilter.run(line_d):
-                        break
-                else:
+                line_d = self.process(line)
+                if line_d:
                     yield line_d
             if retcode is not None and not line:
                 break
+
+
+class AsyncShellcommand(Datasource):
+
+    '''
+    Fetch data from shell command running in an asyncio event loop. All
+    commands are started at once before merging, their output is read in
+    chunks into bounded queues of "queue_size" chunks. Commands running longer
+    than "timeout" seconds are killed. Very dangerous, see Shellcommand.
+    '''
+
+    def __init__(self, parser, filters, **kwargs):
+        super().__init__(parser, filters, **kwargs)
+        self.stream = None
+
+    def start(self):
+        '''
+        start command in event loop of shell.runner
+        '''
+        assert 'command' in self.kwargs, 'Needs command argument!'
+        # asyncio is imported on first use only
+        import sherlock.shell as shell
+        if self.stream is None:
+            self.stream = shell.runner().start(
+                self.kwargs['command'],
+                queue_size=int(self.kwargs.get('queue_size', 8)),
+                timeout=self.kwargs.get('timeout'),
+            )
+
+    def run(self):
+        '''
+        start command unless started before, split chunks of its output into
+        lines and return
+        '''
+        self.start()
+        stream, self.stream = self.stream, None
+        chunks = stream.chunks()
+        if self.stats is not None:
+            chunks = self.sampled(stream, chunks)
+        for line in split_lines(chunks):
+            line_d = self.process(line)
+            if line_d:
+                yield line_d
+
+    def sampled(self, stream, chunks):
+        '''
+        yield chunks, sample queue size of stream into stats
+        '''
+        for chunk in chunks:
+            self.stats.sample_queue(stream.queue.qsize())
+            yield chunk
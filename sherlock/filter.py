@@ -20,6 +20,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from abc import ABC  # abstract base class
+from sherlock.record import LineRecord
 
 
 class Filter(ABC):
@@ -28,6 +29,13 @@ class Filter(ABC):
     Base class for filter implementations of sherlock results
     '''
 
+    # record fields needed by the filter. filters only needing "raw_line" are
+    # run against raw lines before parsing
+    fields = ('code', 'datetime', 'raw_line')
+
+    # filter only compares timestamps and implements mask, see batches.Batch
+    vectorized = False
+
     def __init__(self, **kwargs):
         '''
         safe arguments for processing
@@ -36,6 +44,47 @@ class Filter(ABC):
 
     def run(self, line_d):
         '''
-        run filter against line dictionary. must return boolean
+        run filter against record.LineRecord of a line. must return boolean
         '''
         pass
+
+    def raw(self):
+        '''
+        return True if filter only needs the raw line
+        '''
+        return tuple(self.fields) == ('raw_line',)
+
+    def run_raw(self, line):
+        '''
+        run filter against raw line before parsing. must return boolean
+        '''
+        return self.run(LineRecord(None, None, line))
+
+    def run_bytes(self, line):
+        '''
+        run filter against undecoded raw line without line break. must return
+        boolean
+        '''
+        return self.run_raw(line.decode('utf-8', 'replace'))
+
+    def skip_block(self, block):
+        '''
+        return True if no line of undecoded block of lines can pass the
+        filter, so readers may skip the whole block
+        '''
+        return False
+
+    def mask(self, timestamps):
+        '''
+        return boolean numpy array of timestamps passing the filter. only
+        called for vectorized filters
+        '''
+        raise NotImplementedError
+
+    def window(self):
+        '''
+        return (start, end) timestamps bounding lines this filter may pass,
+        None if unbounded. used by datasources to skip parts of time ordered
+        sources
+        '''
+        return None, None
@@ -20,6 +20,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from sherlock.filter import Filter
+from sherlock.patterns import PatternSet, split_patterns
+from sherlock.timestamps import to_timestamp
 import datetime
 
 
@@ -31,6 +33,7 @@ class Lasthours(Filter):
     '''
 
     argument = 'lasth'
+    vectorized = True
 
     def setup(self):
         '''
@@ -39,12 +42,25 @@ class Lasthours(Filter):
         assert 'lasth' in self.kwargs, 'lasth argument needed!'
         self.lasth = int(self.kwargs['lasth'])
         self.hours_ago = datetime.datetime.now() - datetime.timedelta(hours=self.lasth)
+        self.timestamp = to_timestamp(self.hours_ago)
 
     def run(self, line_d):
         '''
         run filter against parser_results
         '''
-        return line_d['datetime'] > self.hours_ago
+        return line_d.timestamp > self.timestamp
+
+    def mask(self, timestamps):
+        '''
+        run filter against column of timestamps
+        '''
+        return timestamps > self.timestamp
+
+    def window(self):
+        '''
+        lines before hours_ago are never passed
+        '''
+        return self.timestamp, None
 
 
 class Uptohours(Filter):
@@ -55,6 +71,7 @@ class Uptohours(Filter):
     '''
 
     argument = 'uptoh'
+    vectorized = True
 
     def setup(self):
         '''
@@ -63,12 +80,25 @@ class Uptohours(Filter):
         assert 'uptoh' in self.kwargs, 'uptoh argument needed!'
         self.uptoh = int(self.kwargs['uptoh'])
         self.hours_ago = datetime.datetime.now() - datetime.timedelta(hours=self.uptoh)
+        self.timestamp = to_timestamp(self.hours_ago)
 
     def run(self, line_d):
         '''
         run filter against parser_results
         '''
-        return line_d['datetime'] < self.hours_ago
+        return line_d.timestamp < self.timestamp
+
+    def mask(self, timestamps):
+        '''
+        run filter against column of timestamps
+        '''
+        return timestamps < self.timestamp
+
+    def window(self):
+        '''
+        lines from hours_ago on are never passed
+        '''
+        return None, self.timestamp
 
 
 class Keyword(Filter):
@@ -78,6 +108,7 @@ class Keyword(Filter):
     '''
 
     argument = 'keyword'
+    fields = ('raw_line',)
 
     def setup(self):
         '''
@@ -85,9 +116,87 @@ class Keyword(Filter):
         '''
         assert 'keyword' in self.kwargs, 'keyword argument needed!'
         self.keyword = str(self.kwargs['keyword'])
+        self.keyword_bytes = self.keyword.encode('utf-8')
 
     def run(self, line_d):
         '''
         run filter against parser_results
         '''
-        return self.keyword in line_d['raw_line']
+        return self.keyword in line_d.raw_line
+
+    def run_raw(self, line):
+        '''
+        run filter against raw line
+        '''
+        return self.keyword in line
+
+    def run_bytes(self, line):
+        '''
+        run filter against undecoded raw line
+        '''
+        return self.keyword_bytes in line
+
+    def skip_block(self, block):
+        '''
+        skip blocks not containing keyword at all
+        '''
+        return self.keyword_bytes not in block
+
+
+class Anypattern(Filter):
+
+    '''
+    Filter parser_results for records matching any of "patterns" argument in
+    raw_line. patterns are comma separated or "@path" to a file having one
+    pattern per line, "re:" marks regular expressions
+    '''
+
+    argument = 'patterns'
+    fields = ('raw_line',)
+
+    def setup(self):
+        '''
+        check arguments and compile patterns
+        '''
+        assert 'patterns' in self.kwargs, 'patterns argument needed!'
+        self.patterns = PatternSet(split_patterns(self.kwargs['patterns']))
+
+    def run(self, line_d):
+        '''
+        run filter against parser_results
+        '''
+        return self.run_raw(line_d.raw_line)
+
+    def run_raw(self, line):
+        '''
+        run filter against raw line
+        '''
+        return self.patterns.any(line)
+
+
+class Allpatterns(Anypattern):
+
+    '''
+    Filter parser_results for records matching all of "patterns" argument in
+    raw_line. patterns are given like for Anypattern
+    '''
+
+    def run_raw(self, line):
+        '''
+        run filter against raw line
+        '''
+        return self.patterns.all(line)
+
+
+class Nopattern(Anypattern):
+
+    '''
+    Filter parser_results for records matching none of "patterns" argument in
+    raw_line. patterns are given like for Anypattern
+    '''
+
+    def run_raw(self, line):
+        '''
+        run filter against raw line
+        '''
+        return not self.patterns.any(line)
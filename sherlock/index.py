@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# index -- persistent sparse time index of logfiles
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import array
+import bisect
+import hashlib
+import json
+import os
+
+VERSION = 2
+# bytes at the start of the logfile identifying it after copytruncate
+FINGERPRINT_SIZE = 4096
+
+
+def index_path(path, index_dir=None):
+    '''
+    return path of index file for logfile at path. index files are stored
+    next to the logfile unless index_dir is given
+    '''
+    if not index_dir:
+        return '%s.sherlock-index' % path
+    name = os.path.abspath(path).strip(os.sep).replace(os.sep, '_')
+    return os.path.join(index_dir, '%s.sherlock-index' % name)
+
+
+class TimeIndex(object):
+
+    '''
+    Sparse table mapping timestamps to byte offsets of a time ordered logfile.
+
+    Every step bytes the first parsable line is sampled. The table is stored
+    in a sidecar file, validated against inode, size, mtime and a fingerprint
+    of the first block of the logfile and extended if the logfile has grown.
+    '''
+
+    def __init__(self, path, parser_name, step=256 * 1024, index_dir=None):
+        self.path = path
+        self.parser_name = parser_name
+        self.step = step
+        self.index_path = index_path(path, index_dir)
+        self.size = 0
+        # sampled boundaries, line offsets and timestamps, same length
+        self.boundaries = array.array('q')
+        self.offsets = array.array('q')
+        self.timestamps = array.array('q')
+
+    @staticmethod
+    def fingerprint(logfile, size):
+        '''
+        return hash of the first block of logfile, at most size bytes
+        '''
+        head = os.pread(logfile.fileno(), min(size, FINGERPRINT_SIZE), 0)
+        return hashlib.sha1(head).hexdigest()
+
+    def header(self, logfile, stat):
+        '''
+        header identifying logfile state the index was built for
+        '''
+        return {
+            'version': VERSION,
+            'parser': self.parser_name,
+            'step': self.step,
+            'inode': stat.st_ino,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'fingerprint': self.fingerprint(logfile, stat.st_size),
+        }
+
+    def load(self, logfile, stat):
+        '''
+        load index file, keep entries only if still valid for logfile stat.
+        return False if index has to be built from scratch
+        '''
+        try:
+            with open(self.index_path, 'rb') as indexfile:
+                header = json.loads(indexfile.readline().decode('utf-8'))
+                data = array.array('q')
+                data.frombytes(indexfile.read())
+        except (OSError, ValueError):
+            return False
+
+        same = all(
+            header.get(key) == value
+            for key, value in (
+                ('version', VERSION),
+                ('parser', self.parser_name),
+                ('step', self.step),
+                ('inode', stat.st_ino),
+            )
+        )
+        # logfile must be unchanged or grown, otherwise it was rewritten
+        if not same or header['size'] > stat.st_size:
+            return False
+        if header['size'] == stat.st_size and header['mtime'] != stat.st_mtime_ns:
+            return False
+        # a truncated and regrown logfile starts with other lines
+        if header['fingerprint'] != self.fingerprint(logfile, header['size']):
+            return False
+
+        self.size = header['size']
+        self.boundaries = data[0::3]
+        self.offsets = data[1::3]
+        self.timestamps = data[2::3]
+        return True
+
+    def save(self, logfile, stat):
+        '''
+        write index file, indexes which can not be written are kept in memory
+        '''
+        data = array.array('q', [0]) * (3 * len(self.offsets))
+        data[0::3] = self.boundaries
+        data[1::3] = self.offsets
+        data[2::3] = self.timestamps
+        try:
+            with open(self.index_path, 'wb') as indexfile:
+                indexfile.write(json.dumps(self.header(logfile, stat)).encode('utf-8'))
+                indexfile.write(b'\n')
+                indexfile.write(data.tobytes())
+        except OSError:
+            pass
+
+    def update(self, logfile, probe):
+        '''
+        load index and sample logfile behind indexed size. probe is called
+        with logfile and offset and must return offset and timestamp of the
+        first parsable line behind offset, see datasources.Logfile.probe
+        '''
+        stat = os.fstat(logfile.fileno())
+        if not self.load(logfile, stat):
+            self.size = 0
+            self.boundaries = array.array('q')
+            self.offsets = array.array('q')
+            self.timestamps = array.array('q')
+        if self.size == stat.st_size:
+            return
+
+        # last sampled block may have been incomplete, sample it again
+        first = (self.size // self.step) * self.step
+        keep = bisect.bisect_left(self.boundaries, first)
+        del self.boundaries[keep:]
+        del self.offsets[keep:]
+        del self.timestamps[keep:]
+
+        for boundary in range(first, stat.st_size, self.step):
+            offset, timestamp = probe(logfile, boundary)
+            if timestamp is None:
+                break
+            self.boundaries.append(boundary)
+            self.offsets.append(offset)
+            self.timestamps.append(timestamp)
+
+        self.size = stat.st_size
+        self.save(logfile, stat)
+
+    def start(self, timestamp):
+        '''
+        return offset to start reading lines having timestamp >= timestamp
+        '''
+        pos = bisect.bisect_left(self.timestamps, timestamp)
+        if not pos:
+            return 0
+        return self.offsets[pos - 1]
+
+    def end(self, timestamp):
+        '''
+        return offset behind last line having timestamp < timestamp, None if
+        reading has to go on until the end of the logfile
+        '''
+        pos = bisect.bisect_left(self.timestamps, timestamp)
+        if pos == len(self.timestamps):
+            return None
+        return self.offsets[pos]
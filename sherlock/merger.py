@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# merger -- base class for merge implementations
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from abc import ABC  # abstract base class
+
+
+class Merger(ABC):
+
+    '''
+    Base class for merge implementations.
+
+    A merger takes the datasource iterators built by sherlock and combines
+    them into one stream of lines ordered by datetime.
+    '''
+
+    def __init__(self, datasources):
+        '''
+        - safe datasource iterators, a dict mapping keys to iterators.
+          dict order is used as source order
+        '''
+        self.datasources = datasources
+
+    def run(self):
+        '''
+        - must yield lines of all datasources ordered by datetime
+        '''
+        pass
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# mergers -- collection of merge implementations
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from sherlock.batches import load_numpy
+from sherlock.merger import Merger
+import collections
+import heapq
+import queue
+import threading
+import time
+
+
+class ScanMerger(Merger):
+
+    '''
+    Scan buffered line of every datasource for the lowest datetime on each
+    output line. Costs O(k) per line for k datasources.
+    '''
+
+    def run(self):
+        '''
+        - initialize buffer dict
+        - run mainloop (as long as data available)
+          - fill buffer
+          - remove empty datasources
+          - find and pop line having the lowest datetime entry from buffer
+        '''
+
+        datasources = dict(self.datasources)
+        buffer = {}
+
+        while datasources:
+
+            # poplist is used to pop empty datasources
+            poplist = []
+
+            # fetch buffer items from datasources, memorize empty ones
+            for key, iterator in datasources.items():
+                if key not in buffer or not buffer[key]:
+                    try:
+                        buffer[key] = iterator.send(None)
+                    except StopIteration:
+                        poplist.append(key)
+                    except Exception:
+                        raise
+
+            # remove empty datasources
+            for key in poplist:
+                datasources.pop(key)
+
+            # find and memorize buffer key to pop by finding earliest timestamp
+            mindate = None
+            popkey = None
+            for key, line_d in buffer.items():
+                if mindate is None:
+                    mindate = line_d.timestamp
+                    popkey = key
+                    continue
+                if line_d.timestamp < mindate:
+                    mindate = line_d.timestamp
+                    popkey = key
+
+            # throw popkey line from buffer, remove popkey from buffer
+            if popkey and popkey in buffer:
+                yield buffer.pop(popkey)
+
+
+class HeapMerger(Merger):
+
+    '''
+    k-way merge using a priority queue keyed on timestamp. Ties are broken by
+    source order. Costs O(log k) per line for k datasources.
+    '''
+
+    def run(self):
+        '''
+        - fill heap with first line of every datasource
+        - pop lowest line, refill heap from the datasource just consumed
+        '''
+
+        heap = []
+        for index, iterator in enumerate(self.datasources.values()):
+            for line_d in iterator:
+                heap.append((line_d.timestamp, index, line_d, iterator))
+                break
+        heapq.heapify(heap)
+
+        while heap:
+            _, index, line_d, iterator = heap[0]
+            for next_d in iterator:
+                heapq.heapreplace(
+                    heap, (next_d.timestamp, index, next_d, iterator)
+                )
+                break
+            else:  # nobreak - datasource is exhausted
+                heapq.heappop(heap)
+            yield line_d
+
+
+class ReverseMerger(Merger):
+
+    '''
+    k-way merge of datasources yielding lines newest first, see
+    Datasource.run_reverse. Lines are returned newest first, ties in reverse
+    source order, so reversing any prefix gives the order of HeapMerger.
+    '''
+
+    def run(self):
+        '''
+        - fill heap with newest line of every datasource
+        - pop newest line, refill heap from the datasource just consumed
+        '''
+
+        heap = []
+        for index, iterator in enumerate(self.datasources.values()):
+            for line_d in iterator:
+                heap.append((-line_d.timestamp, -index, line_d, iterator))
+                break
+        heapq.heapify(heap)
+
+        while heap:
+            _, index, line_d, iterator = heap[0]
+            for next_d in iterator:
+                heapq.heapreplace(
+                    heap, (-next_d.timestamp, index, next_d, iterator)
+                )
+                break
+            else:  # nobreak - datasource is exhausted
+                heapq.heappop(heap)
+            yield line_d
+
+
+class FollowMerger(Merger):
+
+    '''
+    Merge endless datasources of follow mode. Every datasource is read by its
+    own thread, lines are held back until every live datasource passed their
+    timestamp (watermark), at most for "lateness" seconds.
+    '''
+
+    def __init__(self, datasources, lateness=2.0, idle=None, poll=1.0,
+                 queue_size=1000):
+        '''
+        - idle is called before waiting for lines, e.g. to flush output
+        - poll: seconds idle is called again while no lines arrive, e.g. to
+          dump snapshots requested while datasources are quiet
+        - queue_size: lines buffered per datasource, reading threads wait
+          while the queue is full
+        '''
+        super().__init__(datasources)
+        self.lateness = lateness
+        self.idle = idle
+        self.poll = poll
+        self.queue_size = queue_size
+
+    def feed(self, index, iterator, lines):
+        '''
+        put lines of datasource into queue. None marks the end of a
+        datasource, an exception is raised in the merging thread
+        '''
+        try:
+            for line_d in iterator:
+                lines.put((index, line_d))
+            lines.put((index, None))
+        except Exception as exc:
+            lines.put((index, exc))
+
+    def run(self):
+        '''
+        - start reading threads
+        - put lines arriving from queue into heap, advance watermark of
+          their datasource
+        - pop lines behind lowest watermark of live datasources or held
+          back longer than lateness
+        '''
+        lines = queue.Queue(maxsize=self.queue_size * max(len(self.datasources), 1))
+        for index, iterator in enumerate(self.datasources.values()):
+            threading.Thread(
+                target=self.feed, args=(index, iterator, lines), daemon=True
+            ).start()
+
+        live = set(range(len(self.datasources)))
+        watermarks = {}
+        heap = []
+        # deadlines and timestamps in arrival order, see forced
+        arrivals = collections.deque()
+        # lines up to forced timestamp are released, their deadline passed
+        forced = None
+        count = 0
+
+        while live:
+            # release lines behind watermark or passed deadline
+            now = time.monotonic()
+            while arrivals and arrivals[0][0] <= now:
+                _, timestamp = arrivals.popleft()
+                if forced is None or timestamp > forced:
+                    forced = timestamp
+            watermark = forced
+            if live <= watermarks.keys():
+                lowest = min(watermarks[index] for index in live)
+                if watermark is None or lowest > watermark:
+                    watermark = lowest
+            while heap and watermark is not None and heap[0][0] <= watermark:
+                yield heapq.heappop(heap)[3]
+
+            # wait for next line, at most until next deadline
+            try:
+                index, line_d = lines.get_nowait()
+            except queue.Empty:
+                if self.idle:
+                    self.idle()
+                timeout = None
+                if arrivals:
+                    timeout = max(arrivals[0][0] - time.monotonic(), 0)
+                if self.idle and (timeout is None or timeout > self.poll):
+                    timeout = self.poll
+                try:
+                    index, line_d = lines.get(timeout=timeout)
+                except queue.Empty:
+                    continue
+
+            if line_d is None:
+                live.discard(index)
+                continue
+            if isinstance(line_d, Exception):
+                raise line_d
+            watermarks[index] = line_d.timestamp
+            heapq.heappush(heap, (line_d.timestamp, index, count, line_d))
+            arrivals.append((time.monotonic() + self.lateness, line_d.timestamp))
+            count += 1
+
+        # all datasources ended
+        while heap:
+            yield heapq.heappop(heap)[3]
+
+
+class BatchMerger(Merger):
+
+    '''
+    Blockwise merge of datasources yielding batches.Batch, needs numpy.
+    Records of all datasources up to the lowest last timestamp of their
+    current ascending runs are merged by a stable argsort. Yields records in
+    the same order as HeapMerger, unordered batches are split into ascending
+    runs of timestamps.
+    '''
+
+    def refill(self, iterator):
+        '''return next non empty batch of iterator, None if exhausted'''
+        for batch in iterator:
+            if len(batch):
+                return batch
+        return None
+
+    def run(self):
+        '''
+        - take current batch of every datasource, find positions where its
+          timestamps decrease
+        - merge records of all batches before the lowest last timestamp of
+          their current ascending runs, later records can not be taken
+          before it by HeapMerger
+        - if there are none, all remaining records of the run having the
+          lowest last timestamp have this timestamp. pass them of the first
+          datasource having them, like HeapMerger does
+        - refill exhausted batches
+        '''
+        numpy = load_numpy()
+        assert numpy, 'Batch merger needs numpy!'
+        iterators = list(self.datasources.values())
+        batches = [self.refill(iterator) for iterator in iterators]
+        descents = [batch.descents() if batch else None for batch in batches]
+        positions = [0] * len(iterators)
+        live = [index for index, batch in enumerate(batches) if batch is not None]
+
+        def run_end(index):
+            '''return end of ascending run at current position of batch'''
+            following = int(numpy.searchsorted(
+                descents[index], positions[index], side='right'
+            ))
+            if following < len(descents[index]):
+                return int(descents[index][following])
+            return len(batches[index])
+
+        while live:
+            ends = {index: run_end(index) for index in live}
+            bound = min(batches[index].timestamps[ends[index] - 1] for index in live)
+            timestamps = []
+            records = []
+            for index in live:
+                batch, position = batches[index], positions[index]
+                stop = position + int(numpy.searchsorted(
+                    batch.timestamps[position:ends[index]], bound, side='left'
+                ))
+                if stop > position:
+                    timestamps.append(batch.timestamps[position:stop])
+                    records.extend(batch.records[position:stop])
+                    positions[index] = stop
+
+            if records:
+                # stable sort keeps source order for equal timestamps
+                order = numpy.argsort(numpy.concatenate(timestamps), kind='stable')
+                for position in order.tolist():
+                    yield records[position]
+            else:
+                for index in live:
+                    batch, position = batches[index], positions[index]
+                    if batch.timestamps[position] == bound:
+                        stop = position + int(numpy.searchsorted(
+                            batch.timestamps[position:ends[index]], bound, side='right'
+                        ))
+                        yield from batch.records[position:stop]
+                        positions[index] = stop
+                        break
+
+            for index in list(live):
+                if positions[index] >= len(batches[index]):
+                    batches[index] = self.refill(iterators[index])
+                    positions[index] = 0
+                    if batches[index] is None:
+                        live.remove(index)
+                    else:
+                        descents[index] = batches[index].descents()
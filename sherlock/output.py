@@ -21,6 +21,7 @@
 
 from abc import ABC  # abstract base class
 import os
+import time
 
 
 class Output(ABC):
@@ -31,6 +32,9 @@ class Output(ABC):
     Basically a file-like object wrapper
     '''
 
+    # set line_d.source to key of datasource before lines are written
+    needs_source = False
+
     def setup(self):
         '''called before sherlock main loop. set up output stream'''
         pass
@@ -39,6 +43,15 @@ class Output(ABC):
         '''called during sherlock main loop. compute line_d and write'''
         pass
 
+    def write_batch(self, lines):
+        '''called during sherlock main loop. write list of line_d'''
+        for line_d in lines:
+            self.write(line_d)
+
+    def flush(self):
+        '''called while waiting for lines in follow mode. flush stream'''
+        pass
+
     def close(self):
         '''called after sherlock main loop. tell stream to close'''
         pass
@@ -49,3 +62,54 @@ class Output(ABC):
         method to keep output running after sherlock has finished
         '''
         pass
+
+
+class BufferedOutput(Output):
+
+    '''
+    Base class for outputs writing raw lines to a stream.
+
+    Batches of lines are joined into a buffer, the buffer is written once it
+    holds buffer_size characters or latency seconds passed since the last
+    write. Single lines only check buffer_size, see flush
+    '''
+
+    buffer_size = 64 * 1024
+    latency = 0.5
+
+    def setup(self):
+        '''set up buffer'''
+        self.buffer = []
+        self.size = 0
+        self.last = time.monotonic()
+
+    def write(self, line_d):
+        '''buffer raw_line of line_d, write buffer if full'''
+        self.buffer.append(line_d.raw_line)
+        self.size += len(line_d.raw_line)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def write_batch(self, lines):
+        '''buffer raw lines of batch, write buffer if full or too old'''
+        data = ''.join([line_d.raw_line for line_d in lines])
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= self.buffer_size or time.monotonic() - self.last >= self.latency:
+            self.flush()
+
+    def flush(self):
+        '''write buffer to stream'''
+        if self.buffer:
+            self.write_data(''.join(self.buffer))
+            self.buffer = []
+            self.size = 0
+        self.last = time.monotonic()
+
+    def write_data(self, data):
+        '''write string to stream and flush it'''
+        pass
+
+    def close(self):
+        '''write remaining buffer'''
+        self.flush()
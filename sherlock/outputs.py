@@ -19,26 +19,54 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from sherlock.output import Output
+from sherlock.output import BufferedOutput, Output
+from sherlock.timestamps import to_datetime
+import io
+import json
+import os
 import subprocess
 import sys
-import pydoc
+import tempfile
 
 
-class SimplePager(Output):
+def pager_command(output):
+    '''
+    return shell command of pager of output class or instance, its command
+    if set, else $PAGER or its default pager. None if stdout is no terminal,
+    output is written to stdout then
+    '''
+    if output.command:
+        return output.command
+    if not sys.stdout.isatty():
+        return None
+    return os.environ.get('PAGER') or output.pager
+
+
+class SimplePager(BufferedOutput):
 
     '''
-    Only display raw lines in "less" pager
+    Only display raw lines in $PAGER or "less" pager
     '''
 
+    # command replacing pager, see pager_command
+    command = None
+    pager = 'less'
+
     def setup(self):
-        '''call less with stdin pipe set'''
-        self.proc = subprocess.Popen('less', stdin=subprocess.PIPE)
+        '''call pager with stdin pipe set'''
+        super().setup()
+        self.proc = None
+        command = pager_command(self)
+        if command:
+            self.proc = subprocess.Popen(command, stdin=subprocess.PIPE, shell=True)
 
-    def write(self, line_d):
-        '''take raw_line from line_d, write to and flush proc.stdin'''
+    def write_data(self, data):
+        '''write data to and flush proc.stdin, stdout without pager'''
+        if self.proc is None:
+            StdOut.write_data(self, data)
+            return
         try:
-            self.proc.stdin.write(line_d['raw_line'].encode(encoding='utf-8'))
+            self.proc.stdin.write(data.encode(encoding='utf-8'))
             self.proc.stdin.flush()
         except BrokenPipeError:
             print('Pager closed.')
@@ -47,27 +75,28 @@ class SimplePager(Output):
             raise
 
     def close(self):
-        '''close pipe so less knows there is no more incoming data'''
-        self.proc.stdin.close()
+        '''write buffer and close pipe so less knows there is no more incoming data'''
+        super().close()
+        if self.proc is not None:
+            self.proc.stdin.close()
 
     def run(self):
         '''wait until user quits "less" '''
-        while True:
-            retcode = self.proc.poll()
-            if retcode is not None:
-                break
+        if self.proc is not None:
+            self.proc.wait()
 
 
-class StdOut(Output):
+class StdOut(BufferedOutput):
 
     '''
     well, this is stdout. not much to see here.
     '''
 
-    def write(self, line_d):
-        '''take raw_line from line_d, write to and flush proc.stdin'''
+    def write_data(self, data):
+        '''write data to and flush stdout'''
         try:
-            sys.stdout.write(line_d['raw_line'])
+            sys.stdout.write(data)
+            sys.stdout.flush()
         except BrokenPipeError:  # XXX: error is still shown!?
             print('Stdout pipe closed.')
             sys.exit(0)
@@ -78,69 +107,216 @@ class StdOut(Output):
 class Tablepager(Output):
 
     '''
-    Display full result in table. Needs to read all lines before tables can be
-    built
+    Display full result in table. Rows are spilled to a temporary file while
+    column widths are computed, the table is rendered row by row into
+    $PAGER or "less -S" when all lines are read
     '''
 
-    def make_table(self, columns, data):
-        '''
-        stolen from:
-        https://stackoverflow.com/questions/5909873/how-can-i-pretty-print-ascii-tables-with-python
+    columns = ('datetime', 'code', 'raw_line')
+    # command replacing pager, see pager_command
+    command = None
+    pager = 'less -S'
 
-        need a version NOT having any dependencies
-        '''
-        """Create an ASCII table and return it as a string.
-
-        Pass a list of strings to use as columns in the table and a list of
-        dicts. The strings in 'columns' will be used as the keys to the dicts in
-        'data.'
-
-        Not all column values have to be present in each data dict.
-
-        >>> print(make_table(["a", "b"], [{"a": "1", "b": "test"}]))
-        | a | b    |
-        |----------|
-        | 1 | test |
-        """
-        # Calculate how wide each cell needs to be
-        cell_widths = {}
-        for c in columns:
-            values = [str(d.get(c, "")) for d in data]
-            cell_widths[c] = len(max(values + [c]))
-
-        # Used for formatting rows of data
-        row_template = "|" + " {} |" * len(columns)
-
-        # CONSTRUCT THE TABLE
-
-        # The top row with the column titles
-        justified_column_heads = [c.ljust(cell_widths[c]) for c in columns]
-        header = row_template.format(*justified_column_heads)
-        # The second row contains separators
-        sep = "|" + "-" * (len(header) - 2) + "|"
-        # Rows of data
+    def setup(self):
+        '''create temporary file for rows'''
+        self.rows = tempfile.TemporaryFile('w+', encoding='utf-8')
+        self.widths = [len(column) for column in self.columns]
+
+    def write(self, line_d):
+        '''spill row of line_d'''
+        self.write_batch([line_d])
+
+    def write_batch(self, lines):
+        '''spill rows of lines, widen columns'''
         rows = []
-        for d in data:
-            fields = [str(d.get(c, "")).strip().ljust(cell_widths[c]) for c in columns]
-            row = row_template.format(*fields)
-            rows.append(row)
+        widths = self.widths
+        for line_d in lines:
+            fields = [str(line_d.get(column, '')).strip() for column in self.columns]
+            for num, field in enumerate(fields):
+                if len(field) > widths[num]:
+                    widths[num] = len(field)
+            rows.append(json.dumps(fields))
+        if rows:
+            self.rows.write('\n'.join(rows))
+            self.rows.write('\n')
+
+    def render(self):
+        '''yield lines of table, closes temporary file'''
+        row_template = '|' + ' {} |' * len(self.columns)
+        header = row_template.format(*[
+            column.ljust(width) for column, width in zip(self.columns, self.widths)
+        ])
+        try:
+            yield header
+            yield '|' + '-' * (len(header) - 2) + '|'
+            self.rows.seek(0)
+            for row in self.rows:
+                yield row_template.format(*[
+                    field.ljust(width) for field, width in zip(json.loads(row), self.widths)
+                ])
+        finally:
+            self.rows.close()
+
+    def run(self):
+        '''render table into pager in chunks of rows, stdout without pager'''
+        command = pager_command(self)
+        if command:
+            proc = subprocess.Popen(command, stdin=subprocess.PIPE, shell=True)
+            stream = proc.stdin
+        else:
+            proc = None
+            stream = sys.stdout
+        lines = self.render()
+        chunk = []
+        try:
+            for line in lines:
+                chunk.append(line)
+                if len(chunk) >= 1000:
+                    self.write_chunk(stream, chunk)
+                    chunk = []
+            self.write_chunk(stream, chunk)
+            if proc is not None:
+                proc.stdin.close()
+            else:
+                sys.stdout.flush()
+        except BrokenPipeError:
+            pass
+        finally:
+            lines.close()
+        if proc is not None:
+            proc.wait()
+
+    @staticmethod
+    def write_chunk(stream, chunk):
+        '''write lines of chunk to text or binary stream'''
+        data = '\n'.join(chunk) + '\n'
+        if isinstance(stream, io.TextIOBase):
+            stream.write(data)
+        else:
+            stream.write(data.encode('utf-8'))
 
-        return "\n".join([header, sep] + rows)
+
+class Histogram(Output):
+
+    '''
+    Count lines per time bucket, datasource and code instead of showing them.
+    Only counters are kept, rendered as table or sparklines to stdout
+    '''
+
+    needs_source = True
+    # characters of sparklines, from no lines to most lines of a series
+    ticks = ' ▁▂▃▄▅▆▇█'
+
+    def __init__(self, bucket=60, style='table', width=60):
+        '''
+        - bucket: width of buckets in seconds
+        - style: "table" or "sparkline"
+        - width: maximum characters of sparklines, neighbouring buckets are
+          summed up if there are more
+        '''
+        assert style in ('table', 'sparkline'), 'Unknown style %s' % style
+        self.bucket = bucket
+        self.style = style
+        self.width = width
 
     def setup(self):
-        self.parser_results = []
+        '''set up counters'''
+        self.step = int(self.bucket * 1000000)
+        # line count keyed by bucket number, datasource and code
+        self.counts = {}
 
     def write(self, line_d):
-        '''memorize hole line'''
-        self.parser_results.append(line_d)
+        '''count line_d'''
+        self.write_batch([line_d])
 
-    def close(self):
-        '''build display_text using make_table'''
-        self.display_text = self.make_table(
-            ['datetime', 'code', 'raw_line'],
-            self.parser_results
+    def write_batch(self, lines):
+        '''count lines'''
+        counts = self.counts
+        step = self.step
+        for line_d in lines:
+            key = (line_d.timestamp // step, line_d.source, line_d.code)
+            counts[key] = counts.get(key, 0) + 1
+
+    def series(self):
+        '''return sorted list of (datasource, code) having lines'''
+        return sorted(
+            {(source, code) for _, source, code in self.counts},
+            key=lambda item: (str(item[0]), str(item[1]))
         )
 
+    @staticmethod
+    def label(source, code, size=30):
+        '''short name of series'''
+        source = str(source)
+        if len(source) > size:
+            source = '...' + source[-size + 3:]
+        return '%s %s' % (source, code)
+
+    def render_table(self):
+        '''yield lines of table, one row per bucket having lines'''
+        series = self.series()
+        columns = ['bucket'] + [self.label(*item) for item in series] + ['total']
+        rows = {}
+        for (bucket, source, code), count in self.counts.items():
+            rows.setdefault(bucket, {})[(source, code)] = count
+        widths = [max(len(column), 6) for column in columns]
+        widths[0] = max(widths[0], 19)
+        row_template = '|' + ' {} |' * len(columns)
+        header = row_template.format(*[
+            column.ljust(width) for column, width in zip(columns, widths)
+        ])
+        yield header
+        yield '|' + '-' * (len(header) - 2) + '|'
+        for bucket in sorted(rows):
+            row = rows[bucket]
+            fields = [to_datetime(bucket * self.step).strftime('%Y-%m-%d %H:%M:%S')]
+            fields += [str(row.get(item, 0)) for item in series]
+            fields.append(str(sum(row.values())))
+            yield row_template.format(*[
+                field.rjust(width) for field, width in zip(fields, widths)
+            ])
+
+    def render_sparklines(self):
+        '''
+        yield header and one sparkline per series over all buckets, scaled
+        to the most lines of the series
+        '''
+        buckets = [bucket for bucket, _, _ in self.counts]
+        first, last = min(buckets), max(buckets)
+        # buckets summed up per character
+        per_tick = -(-(last - first + 1) // self.width)
+        yield '%s - %s, %.10gs per character' % (
+            to_datetime(first * self.step).strftime('%Y-%m-%d %H:%M:%S'),
+            to_datetime((last + 1) * self.step).strftime('%Y-%m-%d %H:%M:%S'),
+            self.bucket * per_tick,
+        )
+        series = self.series()
+        labels = [self.label(*item) for item in series]
+        size = max(len(label) for label in labels)
+        for item, label in zip(series, labels):
+            ticks = [0] * ((last - first) // per_tick + 1)
+            for (bucket, source, code), count in self.counts.items():
+                if (source, code) == item:
+                    ticks[(bucket - first) // per_tick] += count
+            top = max(ticks)
+            line = ''.join(
+                self.ticks[-(-count * (len(self.ticks) - 1) // top)] for count in ticks
+            )
+            yield '%s |%s| %d' % (label.ljust(size), line, sum(ticks))
+
+    def render(self):
+        '''yield lines of configured style'''
+        if not self.counts:
+            return iter(())
+        if self.style == 'sparkline':
+            return self.render_sparklines()
+        return self.render_table()
+
     def run(self):
-        '''we may use the pydoc.pager shorthand here'''
-        pydoc.pager(self.display_text)
+        '''write rendered lines to stdout'''
+        try:
+            for line in self.render():
+                sys.stdout.write(line + '\n')
+            sys.stdout.flush()
+        except BrokenPipeError:
+            pass
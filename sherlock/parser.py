@@ -20,6 +20,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from abc import ABC  # abstract base class
+from sherlock.timestamps import Timestamps
 
 
 class Parser(ABC):
@@ -28,8 +29,27 @@ class Parser(ABC):
     Base class for all parser implementations.
     '''
 
+    # key of timestamps.FORMATS used as fast path to parse dates
+    date_format = None
+    # memoize dates without their fraction of a second
+    split_fraction = True
+
+    def __init__(self):
+        '''
+        - build memoizing timestamp parser
+        '''
+        self.timestamps = Timestamps(self.date_format, self.split_fraction)
+
+    def parse_timestamp(self, datestring):
+        '''
+        Return integer of epoch microseconds for datestring, timezones are
+        ignored
+        '''
+        return self.timestamps.parse(datestring)
+
     def run(self, line):
         '''
-        Process one line for output stream
+        Process one line for output stream, return record.LineRecord or None
+        to drop the line
         '''
         pass
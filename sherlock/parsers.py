@@ -20,8 +20,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from sherlock.parser import Parser
+from sherlock.record import LineRecord
+from sherlock.timestamps import to_timestamp
 import datetime
-import dateutil.parser
 
 
 class Auth_Parser(Parser):
@@ -29,6 +30,8 @@ class Auth_Parser(Parser):
     Parser for auth logfiles
     '''
 
+    date_format = 'syslog'
+
     def run(self, line):
         tokens = line.split()
         if not tokens or not tokens[0] or len(tokens[0]) == 0:
@@ -36,13 +39,13 @@ class Auth_Parser(Parser):
         if len(tokens) == 1 or not tokens[1][0].isdigit():
             return
         datestring = ' '.join(tokens[:3])
-        dateobj = dateutil.parser.parse(datestring, ignoretz=True)
-        assert dateobj, 'Unable to build date from %s' % datestring
-        line_d = {
-            'code': tokens[4],
-            'datetime': dateobj,
-            'raw_line': line
-        }
+        timestamp = self.parse_timestamp(datestring)
+        assert timestamp is not None, 'Unable to build date from %s' % datestring
+        line_d = LineRecord(
+            tokens[4],
+            timestamp,
+            line
+        )
         return line_d
 
 
@@ -50,6 +53,9 @@ class Measure_Parser(Parser):
     '''
     Parser for measure logfiles
     '''
+
+    date_format = 'iso'
+
     def run(self, line):
         tokens = line.split()
         if not tokens or not tokens[0] or len(tokens[0]) == 0:
@@ -57,13 +63,13 @@ class Measure_Parser(Parser):
         if not tokens[0][0].isdigit() or len(tokens) == 1:
             return
         datestring = tokens[0]
-        dateobj = dateutil.parser.parse(datestring, ignoretz=True)
-        assert dateobj, 'Unable to build date from %s' % datestring
-        line_d = {
-            'code': tokens[1],
-            'datetime': dateobj,
-            'raw_line': line
-        }
+        timestamp = self.parse_timestamp(datestring)
+        assert timestamp is not None, 'Unable to build date from %s' % datestring
+        line_d = LineRecord(
+            tokens[1],
+            timestamp,
+            line
+        )
         return line_d
 
 
@@ -72,6 +78,8 @@ class Psql_Parser(Parser):
     Parser for psql logfiles
     '''
 
+    date_format = 'iso'
+
     def run(self, line):
         tokens = line.split()
         if not tokens or not tokens[0] or len(tokens[0]) == 0:
@@ -79,13 +87,13 @@ class Psql_Parser(Parser):
         if not tokens[0][0].isdigit() or len(tokens) == 1 or not tokens[1][0].isdigit():
             return
         datestring = ' '.join(tokens[:2])
-        dateobj = dateutil.parser.parse(datestring, ignoretz=True)
-        assert dateobj, 'Unable to build date from %s' % datestring
-        line_d = {
-            'code': tokens[3],
-            'datetime': dateobj,
-            'raw_line': line
-        }
+        timestamp = self.parse_timestamp(datestring)
+        assert timestamp is not None, 'Unable to build date from %s' % datestring
+        line_d = LineRecord(
+            tokens[3],
+            timestamp,
+            line
+        )
         return line_d
 
 
@@ -94,18 +102,21 @@ class Apache2_Error_Parser(Parser):
     Parser for apache2 error logfiles
     '''
 
+    date_format = 'ctime'
+    split_fraction = False
+
     def run(self, line):
         tokens = line.split()
         if not tokens or not tokens[0] or len(tokens[0]) == 0 or not tokens[0].startswith(u'['):
             return
         datestring = ' '.join(tokens[:5])[1:-1]
-        dateobj = dateutil.parser.parse(datestring, ignoretz=True)
-        assert dateobj, 'Unable to build date from %s' % datestring
-        line_d = {
-            'code': tokens[5][1:-1],
-            'datetime': dateobj,
-            'raw_line': line
-        }
+        timestamp = self.parse_timestamp(datestring)
+        assert timestamp is not None, 'Unable to build date from %s' % datestring
+        line_d = LineRecord(
+            tokens[5][1:-1],
+            timestamp,
+            line
+        )
         return line_d
 
 
@@ -114,28 +125,30 @@ class Apache2_Access_Parser(Parser):
     Parser for apache2 access logfiles
     '''
 
+    date_format = 'iso-or-clf'
+
     def run(self, line):
         tokens = line.split()
         if not tokens or not tokens[0] or len(tokens[0]) == 0:
             return
         datestring = tokens[3][1:]
         try:
-            dateobj = dateutil.parser.parse(datestring, ignoretz=True)
+            timestamp = self.parse_timestamp(datestring)
         except ValueError:
-            dateobj = datetime.datetime.strptime(
+            timestamp = to_timestamp(datetime.datetime.strptime(
                 datestring,
                 '%d/%b/%Y:%X'
-            )
+            ))
         except Exception:
             raise
 
         import string
-        assert dateobj, 'Unable to build date from %s' % datestring
-        line_d = {
-            'code': tokens[8],
-            'datetime': dateobj,
-            'raw_line': ''.join(char for char in line if char in string.printable)
-        }
+        assert timestamp is not None, 'Unable to build date from %s' % datestring
+        line_d = LineRecord(
+            tokens[8],
+            timestamp,
+            ''.join(char for char in line if char in string.printable)
+        )
         return line_d
 
 
@@ -144,6 +157,8 @@ class Journal_Parser(Parser):
     Parser for journal log
     '''
 
+    date_format = 'iso'
+
     def run(self, line):
         tokens = line.split()
         if not tokens or not tokens[0] or len(tokens[0]) == 0 or tokens[0] == '--':
@@ -152,12 +167,12 @@ class Journal_Parser(Parser):
         datestring = datestring.replace(u',', u'.')
         if not datestring[0].isdigit():
             return
-        dateobj = dateutil.parser.parse(datestring, ignoretz=True)
-        assert dateobj, 'Unable to build date from %s' % datestring
-        line_d = {
-            'code': tokens[1] if tokens[1].endswith(u':') else tokens[2][:-1],
-            'datetime': dateobj,
-            'raw_line': line
-        }
+        timestamp = self.parse_timestamp(datestring)
+        assert timestamp is not None, 'Unable to build date from %s' % datestring
+        line_d = LineRecord(
+            tokens[1] if tokens[1].endswith(u':') else tokens[2][:-1],
+            timestamp,
+            line
+        )
 
         return line_d
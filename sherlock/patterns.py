@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# patterns -- match many literals and regular expressions at once
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+
+# optional, literals are matched by a combined regular expression without it
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# prefix marking a pattern as regular expression
+REGEX_PREFIX = 're:'
+
+
+def split_patterns(argument):
+    '''
+    return list of patterns from filter argument. argument may be a list,
+    a comma separated string or "@path" of a file having one pattern per line
+    '''
+    if isinstance(argument, (list, tuple, set)):
+        return list(argument)
+    argument = str(argument)
+    if argument.startswith('@'):
+        with open(argument[1:], 'r', encoding='utf-8') as patternfile:
+            return [line.rstrip('\n') for line in patternfile if line.strip()]
+    return [pattern for pattern in argument.split(',') if pattern]
+
+
+class PatternSet(object):
+
+    '''
+    Match any number of literals and regular expressions against a line in
+    a single scan.
+
+    Literals are compiled into one Aho-Corasick automaton if pyahocorasick is
+    installed, otherwise into one regular expression together with the
+    regular expressions. Patterns prefixed by "re:" are regular expressions.
+    Regular expressions having groups or global inline flags like "(?i)"
+    can not be combined, they are searched one by one.
+    '''
+
+    def __init__(self, patterns):
+        '''
+        - split patterns into literals and regular expressions and compile them
+        '''
+        assert patterns, 'Needs at least one pattern!'
+        literals = []
+        regexes = []
+        # compiled regular expressions searched one by one
+        self.separate = []
+        default_flags = re.compile('').flags
+        for pattern in patterns:
+            if not pattern.startswith(REGEX_PREFIX):
+                literals.append(pattern)
+                continue
+            regex = pattern[len(REGEX_PREFIX):]
+            compiled = re.compile(regex)
+            # group numbers shift and global flags fail within alternations
+            if compiled.groups or compiled.flags != default_flags:
+                self.separate.append(compiled)
+            else:
+                regexes.append(regex)
+        # longest first, see find_all
+        self.literals = sorted(set(literals), key=len, reverse=True)
+        self.regexes = regexes
+
+        self.automaton = None
+        if ahocorasick and self.literals:
+            self.automaton = ahocorasick.Automaton()
+            for index, literal in enumerate(self.literals):
+                self.automaton.add_word(literal, index)
+            self.automaton.make_automaton()
+
+        # any: one alternation, literals included without automaton
+        alternatives = ['(?:%s)' % regex for regex in self.regexes]
+        if not self.automaton:
+            alternatives += [re.escape(literal) for literal in self.literals]
+        self.any_regex = re.compile('|'.join(alternatives)) if alternatives else None
+
+        # all: one lookahead per regular expression
+        self.all_regex = None
+        if self.regexes:
+            self.all_regex = re.compile(''.join(
+                r'(?=[\s\S]*?(?:%s))' % regex for regex in self.regexes
+            ))
+
+        # all without automaton: a lookahead alternation finds the longest
+        # literal at each position, literals being its prefixes are found too
+        self.literal_regex = None
+        if self.literals and not self.automaton:
+            self.literal_regex = re.compile('(?=(%s))' % '|'.join(
+                re.escape(literal) for literal in self.literals
+            ))
+            self.prefixes = {
+                literal: [
+                    other for other in self.literals
+                    if other != literal and literal.startswith(other)
+                ]
+                for literal in self.literals
+            }
+
+    def any(self, line):
+        '''
+        return True if any pattern matches line
+        '''
+        if self.automaton:
+            for _ in self.automaton.iter(line):
+                return True
+        if self.any_regex and self.any_regex.search(line) is not None:
+            return True
+        for regex in self.separate:
+            if regex.search(line) is not None:
+                return True
+        return False
+
+    def all(self, line):
+        '''
+        return True if all patterns match line
+        '''
+        if self.all_regex and not self.all_regex.match(line):
+            return False
+        for regex in self.separate:
+            if regex.search(line) is None:
+                return False
+        if self.literals:
+            return self.find_all(line)
+        return True
+
+    def find_all(self, line):
+        '''
+        return True if all literals are found in line
+        '''
+        missing = len(self.literals)
+        found = set()
+        if self.automaton:
+            for _, index in self.automaton.iter(line):
+                if index not in found:
+                    found.add(index)
+                    missing -= 1
+                    if not missing:
+                        return True
+            return False
+
+        for match in self.literal_regex.finditer(line):
+            literal = match.group(1)
+            if literal in found:
+                continue
+            for other in [literal] + self.prefixes[literal]:
+                if other not in found:
+                    found.add(other)
+                    missing -= 1
+            if not missing:
+                return True
+        return False
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# pool -- run datasources in worker processes
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import contextlib
+import multiprocessing
+import threading
+import traceback
+
+
+class Batcher(object):
+
+    '''
+    Collect items into lists of batch_size items passed to put. If latency
+    is set, a partial batch is passed after latency seconds too, e.g. lines
+    of follow mode arriving one by one
+    '''
+
+    def __init__(self, put, batch_size, latency=None):
+        self.put = put
+        self.batch_size = batch_size
+        self.latency = latency
+        self.batch = []
+        self.lock = contextlib.nullcontext()
+        self.done = None
+        if latency:
+            self.lock = threading.Lock()
+            self.done = threading.Event()
+            threading.Thread(target=self.flusher, daemon=True).start()
+
+    def add(self, item):
+        '''add item, pass batch if full'''
+        with self.lock:
+            self.batch.append(item)
+            if len(self.batch) >= self.batch_size:
+                self.put(self.batch)
+                self.batch = []
+
+    def flush(self):
+        '''pass partial batch'''
+        with self.lock:
+            if self.batch:
+                self.put(self.batch)
+                self.batch = []
+
+    def flusher(self):
+        '''pass partial batch every latency seconds until closed'''
+        while not self.done.wait(self.latency):
+            self.flush()
+
+    def close(self):
+        '''pass remaining items, stop flushing'''
+        if self.done is not None:
+            self.done.set()
+        self.flush()
+
+
+def feed(source, queue, batch_size, method, latency=None):
+    '''
+    run method of datasource, put batches of parsed lines into queue.
+    None marks the end of a datasource, a string carries a traceback, a dict
+    carries stats of the datasource
+    '''
+    batcher = Batcher(queue.put, batch_size, latency)
+    try:
+        for line_d in getattr(source, method)():
+            batcher.add(line_d)
+        batcher.close()
+        if source.stats is not None:
+            queue.put(source.stats.as_dict())
+        queue.put(None)
+    except Exception:
+        if batcher.done is not None:
+            batcher.done.set()
+        queue.put(traceback.format_exc())
+
+
+def work(jobs, batch_size, method, latency=None):
+    '''
+    worker process main function. feed every datasource from its own thread,
+    so a full queue of one datasource does not block the others
+    '''
+    threads = [
+        threading.Thread(
+            target=feed, args=(source, queue, batch_size, method, latency)
+        )
+        for source, queue in jobs
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class Pool(object):
+
+    '''
+    Parse and filter datasources in worker processes.
+
+    Datasources are distributed round robin over workers. Each worker sends
+    batches of parsed lines through a bounded queue per datasource, lines of
+    a datasource keep their order.
+    '''
+
+    def __init__(self, datasources, workers, queue_size=8, batch_size=1000,
+                 method='run', latency=None):
+        '''
+        - datasources is a list of datasource instances
+        - method of datasources yielding items, e.g. run_batches
+        - latency in seconds partial batches are sent after, see Batcher
+        '''
+        assert workers > 0, 'Needs at least one worker!'
+        self.datasources = datasources
+        self.workers = min(workers, len(datasources)) or 1
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.method = method
+        self.latency = latency
+        self.queues = []
+        self.processes = []
+
+    def start(self):
+        '''
+        create queues and start worker processes
+        '''
+        self.queues = [
+            multiprocessing.Queue(maxsize=self.queue_size)
+            for _ in self.datasources
+        ]
+        jobs = list(zip(self.datasources, self.queues))
+        for num in range(self.workers):
+            process = multiprocessing.Process(
+                target=work,
+                args=(jobs[num::self.workers], self.batch_size, self.method,
+                      self.latency),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+
+    def run(self, index):
+        '''
+        yield parsed lines of datasource at index
+        '''
+        queue = self.queues[index]
+        stats = self.datasources[index].stats
+        while True:
+            batch = queue.get()
+            if batch is None:
+                break
+            if isinstance(batch, str):
+                raise RuntimeError('Datasource failed in worker:\n%s' % batch)
+            if isinstance(batch, dict):
+                stats.update(batch)
+                continue
+            if stats is not None:
+                try:
+                    stats.sample_queue(queue.qsize())
+                except NotImplementedError:  # not available on macOS
+                    pass
+            yield from batch
+
+    def close(self):
+        '''
+        stop worker processes
+        '''
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self.processes = []
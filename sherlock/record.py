@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# record -- compact record of a parsed line
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from sherlock.timestamps import to_datetime, to_timestamp
+
+# keys available via dictionary access
+KEYS = ('code', 'datetime', 'raw_line', 'timestamp', 'offset', 'source')
+
+
+class LineRecord(object):
+
+    '''
+    Compact record of a parsed line, built by parsers and passed through
+    filters, mergers and outputs.
+
+    The time of a line is stored as sortable integer of epoch microseconds,
+    the datetime object is only built on access. Supports read access like
+    the line dictionaries used before, e.g. line_d['raw_line']. offset is the
+    byte offset of the line in its logfile, None for other datasources.
+    source is the key of the datasource, only set for outputs needing it.
+    '''
+
+    __slots__ = ('code', 'timestamp', 'raw_line', 'offset', 'source', '_datetime')
+
+    def __init__(self, code, timestamp, raw_line, offset=None):
+        self.code = code
+        self.timestamp = timestamp
+        self.raw_line = raw_line
+        self.offset = offset
+        self.source = None
+        self._datetime = None
+
+    @property
+    def datetime(self):
+        '''datetime of line, built on first access'''
+        if self._datetime is None:
+            self._datetime = to_datetime(self.timestamp)
+        return self._datetime
+
+    @classmethod
+    def from_dict(cls, line_d):
+        '''build record from line dictionary of custom parsers'''
+        return cls(
+            line_d.get('code'),
+            to_timestamp(line_d['datetime']),
+            line_d.get('raw_line', ''),
+        )
+
+    def __getitem__(self, key):
+        if key not in KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in KEYS
+
+    def __iter__(self):
+        return iter(KEYS)
+
+    def get(self, key, default=None):
+        if key not in KEYS:
+            return default
+        return getattr(self, key)
+
+    def keys(self):
+        return KEYS
+
+    def __repr__(self):
+        return 'LineRecord(%r, %r, %r)' % (self.code, self.timestamp, self.raw_line)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# registry -- plugin maps loading their classes on first use
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections.abc
+import importlib
+
+
+class Registry(collections.abc.Mapping):
+
+    '''
+    Map of plugin names to classes, loaded on first access.
+
+    Entries name their class as "module:attribute", so modules are only
+    imported once a plugin is used. Plugins of other packages are found via
+    entry points of group, e.g. "pf_sherlock.parsers". Entry points are only
+    looked up for unknown names or when listing all names, built in names
+    win over entry points.
+    '''
+
+    def __init__(self, group, entries):
+        self.group = group
+        self.entries = dict(entries)
+        self.loaded = {}
+        self.discovered = False
+
+    def register(self, name, target):
+        '''
+        add plugin name, target is a class or "module:attribute"
+        '''
+        self.entries[name] = target
+        self.loaded.pop(name, None)
+
+    def discover(self):
+        '''add entry points of group once'''
+        if self.discovered:
+            return
+        self.discovered = True
+        # imported on first use, importing it costs more than all of sherlock
+        import importlib.metadata
+        entry_points = importlib.metadata.entry_points()
+        if hasattr(entry_points, 'select'):
+            entry_points = entry_points.select(group=self.group)
+        else:  # before python 3.10
+            entry_points = entry_points.get(self.group, ())
+        for entry_point in entry_points:
+            self.entries.setdefault(entry_point.name, entry_point)
+
+    def __contains__(self, name):
+        if name in self.entries:
+            return True
+        self.discover()
+        return name in self.entries
+
+    def __getitem__(self, name):
+        if name in self.loaded:
+            return self.loaded[name]
+        if name not in self:
+            raise KeyError(name)
+        target = self.entries[name]
+        if isinstance(target, str):
+            module, attribute = target.split(':')
+            target = getattr(importlib.import_module(module), attribute)
+        elif hasattr(target, 'load'):  # entry point
+            target = target.load()
+        self.loaded[name] = target
+        return target
+
+    def __iter__(self):
+        self.discover()
+        return iter(self.entries)
+
+    def __len__(self):
+        self.discover()
+        return len(self.entries)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# shard -- parse datasources in worker processes streaming over sockets
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from sherlock.batches import Batch, load_numpy
+from sherlock.pool import Batcher
+from sherlock.record import LineRecord
+import array
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import traceback
+
+# frame kinds, every frame is kind and payload size followed by payload
+HELLO = 1    # index of datasource sent by connection
+RECORDS = 2  # records, see encode
+BATCH = 3    # records of a batches.Batch
+STATS = 4    # json of stats.SourceStats.as_dict
+ERROR = 5    # traceback of failed datasource
+END = 6      # end of datasource
+
+FRAME = struct.Struct('<BI')
+COUNT = struct.Struct('<II')
+
+
+def encode(records):
+    '''
+    serialize list of record.LineRecord. Codes are stored once per frame,
+    timestamps, code ids, offsets and line ends as columns, raw lines are
+    concatenated behind them
+    '''
+    codes = {}
+    timestamps = array.array('q')
+    code_ids = array.array('i')
+    offsets = array.array('q')
+    ends = array.array('q')
+    text = []
+    end = 0
+    for line_d in records:
+        code_id = codes.get(line_d.code)
+        if code_id is None:
+            code_id = codes[line_d.code] = len(codes)
+        raw_line = line_d.raw_line.encode('utf-8')
+        end += len(raw_line)
+        text.append(raw_line)
+        timestamps.append(line_d.timestamp)
+        code_ids.append(code_id)
+        offsets.append(-1 if line_d.offset is None else line_d.offset)
+        ends.append(end)
+    header = json.dumps(sorted(codes, key=codes.get)).encode('utf-8')
+    return b''.join([
+        COUNT.pack(len(timestamps), len(header)), header,
+        timestamps.tobytes(), code_ids.tobytes(), offsets.tobytes(),
+        ends.tobytes(),
+    ] + text)
+
+
+def decode(data):
+    '''
+    return timestamp column and list of record.LineRecord of frame built by
+    encode
+    '''
+    count, size = COUNT.unpack_from(data)
+    position = COUNT.size
+    codes = json.loads(data[position:position + size].decode('utf-8'))
+    position += size
+    columns = []
+    for typecode in 'qiqq':
+        column = array.array(typecode)
+        end = position + count * column.itemsize
+        column.frombytes(data[position:end])
+        columns.append(column)
+        position = end
+    timestamps, code_ids, offsets, ends = columns
+    text = data[position:]
+    records = []
+    start = 0
+    for num in range(count):
+        end = ends[num]
+        offset = offsets[num]
+        records.append(LineRecord(
+            codes[code_ids[num]], timestamps[num],
+            text[start:end].decode('utf-8'), None if offset < 0 else offset
+        ))
+        start = end
+    return timestamps, records
+
+
+def send(stream, kind, payload=b''):
+    '''write frame to stream'''
+    stream.write(FRAME.pack(kind, len(payload)))
+    stream.write(payload)
+
+
+def receive(stream):
+    '''read frame from stream, return kind and payload'''
+    header = stream.read(FRAME.size)
+    if len(header) < FRAME.size:
+        raise RuntimeError('Shard connection closed unexpectedly')
+    kind, size = FRAME.unpack(header)
+    payload = stream.read(size)
+    if len(payload) < size:
+        raise RuntimeError('Shard connection closed unexpectedly')
+    return kind, payload
+
+
+def connect(address):
+    '''return socket connected to coordinator address'''
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(address)
+    return sock
+
+
+def feed(source, index, address, batch_size, method, latency=None):
+    '''
+    run method of datasource and send frames of parsed lines to coordinator
+    at address. the connection starts with a HELLO frame of index. partial
+    batches are sent after latency seconds, see pool.Batcher
+    '''
+    sock = connect(address)
+    stream = sock.makefile('wb', buffering=256 * 1024)
+
+    def put(batch):
+        send(stream, RECORDS, encode(batch))
+        if latency:
+            stream.flush()
+
+    batcher = Batcher(put, batch_size, latency)
+    try:
+        send(stream, HELLO, struct.pack('<I', index))
+        if latency:
+            stream.flush()
+        for item in getattr(source, method)():
+            if method == 'run_batches':
+                send(stream, BATCH, encode(item.records))
+                continue
+            batcher.add(item)
+        batcher.close()
+        if source.stats is not None:
+            send(stream, STATS, json.dumps(source.stats.as_dict()).encode('utf-8'))
+        send(stream, END)
+    except (BrokenPipeError, ConnectionResetError):
+        return  # coordinator stopped reading
+    except Exception:
+        if batcher.done is not None:
+            batcher.done.set()
+        try:
+            with batcher.lock:
+                send(stream, ERROR, traceback.format_exc().encode('utf-8'))
+        except OSError:
+            return
+    try:
+        stream.close()
+    except OSError:
+        pass
+    sock.close()
+
+
+def work(jobs, address, batch_size, method, latency=None):
+    '''
+    worker process main function. feed every datasource of jobs, a list of
+    (index, datasource), through its own connection from its own thread
+    '''
+    threads = [
+        threading.Thread(
+            target=feed,
+            args=(source, index, address, batch_size, method, latency)
+        )
+        for index, source in jobs
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class Coordinator(object):
+
+    '''
+    Parse and filter datasources in worker processes owning a shard of the
+    datasources each. Workers stream compactly encoded batches of parsed
+    lines over one socket connection per datasource, the coordinator only
+    decodes, merges and writes output. Unix domain sockets are used unless
+    transport is "tcp", which listens on a local port instead.
+
+    Same interface as pool.Pool.
+    '''
+
+    def __init__(self, datasources, workers, batch_size=1000, method='run',
+                 transport='unix', timeout=30, latency=None):
+        '''
+        - datasources is a list of datasource instances
+        - method of datasources yielding items, e.g. run_batches
+        - timeout in seconds waiting for workers to connect
+        - latency in seconds partial batches are sent after, see pool.Batcher
+        '''
+        assert workers > 0, 'Needs at least one worker!'
+        assert transport in ('unix', 'tcp'), 'Unknown transport: %s' % transport
+        self.datasources = datasources
+        self.workers = min(workers, len(datasources)) or 1
+        self.batch_size = batch_size
+        self.method = method
+        self.transport = transport
+        self.timeout = timeout
+        self.latency = latency
+        self.streams = {}
+        self.sockets = []
+        self.processes = []
+        self.directory = None
+
+    def listen(self):
+        '''return listening socket and its address'''
+        if self.transport == 'tcp':
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.bind(('127.0.0.1', 0))
+        else:
+            self.directory = tempfile.mkdtemp(prefix='pf_sherlock')
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(os.path.join(self.directory, 'coordinator'))
+        listener.listen(len(self.datasources))
+        return listener, listener.getsockname()
+
+    def start(self):
+        '''
+        start worker processes and accept one connection per datasource
+        '''
+        listener, address = self.listen()
+        jobs = list(enumerate(self.datasources))
+        for num in range(self.workers):
+            process = multiprocessing.Process(
+                target=work,
+                args=(jobs[num::self.workers], address, self.batch_size,
+                      self.method, self.latency),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+
+        listener.settimeout(self.timeout)
+        try:
+            while len(self.streams) < len(self.datasources):
+                sock, _ = listener.accept()
+                sock.settimeout(None)
+                self.sockets.append(sock)
+                stream = sock.makefile('rb', buffering=256 * 1024)
+                kind, payload = receive(stream)
+                assert kind == HELLO, 'Shard did not say hello'
+                self.streams[struct.unpack('<I', payload)[0]] = stream
+        except socket.timeout:
+            raise RuntimeError('Shard workers did not connect')
+        finally:
+            listener.close()
+
+    def run(self, index):
+        '''
+        yield parsed lines of datasource at index
+        '''
+        stats = self.datasources[index].stats
+        while True:
+            kind, payload = receive(self.streams[index])
+            if kind == END:
+                break
+            if kind == ERROR:
+                raise RuntimeError(
+                    'Datasource failed in worker:\n%s' % payload.decode('utf-8')
+                )
+            if kind == STATS:
+                stats.update(json.loads(payload.decode('utf-8')))
+                continue
+            timestamps, records = decode(payload)
+            if kind == BATCH:
+                numpy = load_numpy()
+                yield Batch(records, numpy.frombuffer(timestamps, dtype=numpy.int64))
+                continue
+            yield from records
+
+    def close(self):
+        '''
+        close connections, stop worker processes
+        '''
+        for stream in self.streams.values():
+            stream.close()
+        for sock in self.sockets:
+            sock.close()
+        self.streams = {}
+        self.sockets = []
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self.processes = []
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
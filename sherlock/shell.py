@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# shell -- run shell commands concurrently in an asyncio event loop
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import os
+import signal
+import threading
+
+
+class Stream(object):
+
+    '''
+    Output of a shell command running in the event loop of a CommandRunner.
+
+    Chunks of output are read without blocking and put into a bounded queue.
+    Reading pauses while the queue is full, so the pipe fills up and the
+    command blocks until chunks are consumed.
+    '''
+
+    def __init__(self, loop, command, queue_size=8, chunk_size=64 * 1024,
+                 timeout=None):
+        self.loop = loop
+        self.command = command
+        self.queue_size = queue_size
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.queue = None
+        self.proc = None
+        self.task = None
+
+    async def launch(self):
+        '''
+        create queue and start reading task, called in event loop
+        '''
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.task = self.loop.create_task(self.read())
+
+    async def read(self):
+        '''
+        start command and put chunks of its output into queue. None marks
+        the end of output, an exception is raised in the consuming thread.
+        commands running longer than timeout seconds are killed, output read
+        until then is kept
+        '''
+        try:
+            # own session, so timeout and close kill commands of pipes too
+            self.proc = await asyncio.create_subprocess_shell(
+                self.command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                start_new_session=True
+            )
+            try:
+                await asyncio.wait_for(self.pump(), self.timeout)
+            except asyncio.TimeoutError:
+                self.kill()
+            await self.proc.wait()
+            await self.queue.put(None)
+        except asyncio.CancelledError:
+            self.kill()
+            raise
+        except Exception as exc:
+            self.kill()
+            await self.queue.put(exc)
+
+    async def pump(self):
+        '''
+        put chunks of command output into queue until end of output
+        '''
+        while True:
+            chunk = await self.proc.stdout.read(self.chunk_size)
+            if not chunk:
+                return
+            await self.queue.put(chunk)
+
+    def kill(self):
+        '''
+        kill process group of command if still running
+        '''
+        if self.proc is None or self.proc.returncode is not None:
+            return
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def chunks(self):
+        '''
+        yield chunks of command output, called from consuming thread. the
+        command is killed if the consumer stops early
+        '''
+        try:
+            while True:
+                chunk = asyncio.run_coroutine_threadsafe(
+                    self.queue.get(), self.loop
+                ).result()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            self.loop.call_soon_threadsafe(self.task.cancel)
+
+
+class CommandRunner(object):
+
+    '''
+    Run shell commands concurrently in an asyncio event loop running in a
+    background thread. One runner per process is shared by all datasources,
+    see runner.
+    '''
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.loop = None
+        self.lock = threading.Lock()
+
+    def start(self, command, **kwargs):
+        '''
+        start command, return Stream of its output. keyword arguments are
+        passed to Stream
+        '''
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        stream = Stream(self.loop, command, **kwargs)
+        asyncio.run_coroutine_threadsafe(stream.launch(), self.loop).result()
+        return stream
+
+
+# runner shared by datasources of this process
+RUNNER = None
+RUNNER_LOCK = threading.Lock()
+
+
+def runner():
+    '''
+    return CommandRunner of this process, created on first call. forked
+    worker processes create their own
+    '''
+    global RUNNER
+    with RUNNER_LOCK:
+        if RUNNER is None or RUNNER.pid != os.getpid():
+            RUNNER = CommandRunner()
+        return RUNNER
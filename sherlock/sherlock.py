@@ -20,18 +20,20 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # custom
-import sherlock.parsers as parsers
-import sherlock.datasources as datasources
-import sherlock.filters as filters
-import sherlock.outputs as outputs
+from sherlock.registry import Registry
+from sherlock.stats import Stats
 
 
 # builtin
+import cProfile
+import itertools
 import os
+import time
 import importlib.util
 import sys
 
-# module maps
+# module maps, classes are named as "module:attribute" and imported on first
+# use. other packages add entries via entry points, see registry.Registry
 PARSERS_HELP = '''
 PARSERS
 
@@ -40,40 +42,52 @@ parser-name is referenced from config.py, ParserClass instances are built during
 sherlock startup.
 
 '''
-PARSERS = {
-    'postgresql': parsers.Psql_Parser,
-    'apache2-error': parsers.Apache2_Error_Parser,
-    'apache2-access': parsers.Apache2_Access_Parser,
-    'journal': parsers.Journal_Parser,
-    'measure': parsers.Measure_Parser,
-    'auth': parsers.Auth_Parser,
-}
+PARSERS = Registry('pf_sherlock.parsers', {
+    'postgresql': 'sherlock.parsers:Psql_Parser',
+    'apache2-error': 'sherlock.parsers:Apache2_Error_Parser',
+    'apache2-access': 'sherlock.parsers:Apache2_Access_Parser',
+    'journal': 'sherlock.parsers:Journal_Parser',
+    'measure': 'sherlock.parsers:Measure_Parser',
+    'auth': 'sherlock.parsers:Auth_Parser',
+})
 
 DATASOURCES_HELP = '''
 DATASOURCES
 
 :: datasource-name: DatasourceClass
-datasource-name is indirectly referenced via logfile_map and shellcmd_map
-in config.py, DatasourceClass instances are built during parser building
+datasource-name is indirectly referenced via logfile_map, logset_map and
+shellcmd_map in config.py, DatasourceClass instances are built during parser
+building. logset_map maps parsers against logfiles whose rotations are read
+one after another instead of being merged.
+compressed logfiles in logfile_map are detected by magic bytes, commands in
+shellcmd_map run in an asyncio event loop if async_shell is set in config.py
 
 '''
-DATASOURCES = {
-    'logfile': datasources.Logfile,
-    'shellcommand': datasources.Shellcommand,
-}
+DATASOURCES = Registry('pf_sherlock.datasources', {
+    'logfile': 'sherlock.datasources:Logfile',
+    'compressed': 'sherlock.datasources:Compressedfile',
+    'logset': 'sherlock.datasources:Logset',
+    'shellcommand': 'sherlock.datasources:Shellcommand',
+    'asyncshell': 'sherlock.datasources:AsyncShellcommand',
+})
 
 OUTPUTS_HELP = '''
 OUTPUTS
 :: output-name: OutputClass
 output-name is references via output string in config.py or via output argument,
-it is used to build output instance which is populated during sherlock main loop
+it is used to build output instance which is populated during sherlock main loop.
+arguments in output_options of config.py keyed by output-name are passed to it,
+e.g. bucket seconds of histogram. a "trigger" argument is a filter map like
+filter_map and passed as filter instances, e.g. for snapshot
 
 '''
-OUTPUTS = {
-    'simple': outputs.SimplePager,
-    'stdout': outputs.StdOut,
-    'table': outputs.Tablepager,
-}
+OUTPUTS = Registry('pf_sherlock.outputs', {
+    'simple': 'sherlock.outputs:SimplePager',
+    'stdout': 'sherlock.outputs:StdOut',
+    'table': 'sherlock.outputs:Tablepager',
+    'histogram': 'sherlock.outputs:Histogram',
+    'snapshot': 'sherlock.snapshot:Snapshot',
+})
 
 FILTERS_HELP = '''
 
@@ -83,11 +97,35 @@ filter-shortcut and arguments may be used in config.py "filter_map" or as
 arguments on pf_sherlock call. Filters are applied sequential on parser results.
 
 '''
-FILTERS = {
-    'lh': filters.Lasthours,
-    'uh': filters.Uptohours,
-    'kw': filters.Keyword,
-}
+FILTERS = Registry('pf_sherlock.filters', {
+    'lh': 'sherlock.filters:Lasthours',
+    'uh': 'sherlock.filters:Uptohours',
+    'kw': 'sherlock.filters:Keyword',
+    'any': 'sherlock.filters:Anypattern',
+    'all': 'sherlock.filters:Allpatterns',
+    'not': 'sherlock.filters:Nopattern',
+})
+
+
+MERGERS_HELP = '''
+
+MERGERS
+:: merger-name: MergerClass
+merger-name is referenced via merge string in config.py or via merge argument,
+it is used to combine datasource iterators into one stream ordered by datetime.
+follow mode always uses the follow merger. the batch merger needs numpy, it
+merges blocks of records of datasources and filters them by time vectorized.
+the reverse merger returns lines newest first, logfiles are read backwards.
+tail limit always uses the reverse merger.
+
+'''
+MERGERS = Registry('pf_sherlock.mergers', {
+    'heap': 'sherlock.mergers:HeapMerger',
+    'scan': 'sherlock.mergers:ScanMerger',
+    'follow': 'sherlock.mergers:FollowMerger',
+    'batch': 'sherlock.mergers:BatchMerger',
+    'reverse': 'sherlock.mergers:ReverseMerger',
+})
 
 
 def show_help():
@@ -103,9 +141,27 @@ def show_help():
     res += u'\n'.join('%s %s' % (key, value.__doc__) for key, value in OUTPUTS.items())
     res += FILTERS_HELP
     res += u'\n'.join('%s %s' % (key, value.__doc__) for key, value in FILTERS.items())
+    res += MERGERS_HELP
+    res += u'\n'.join('%s %s' % (key, value.__doc__) for key, value in MERGERS.items())
     return res
 
 
+def build_filters(filter_map):
+    '''
+    build and return filter instances defined in filter_map
+    '''
+    filters = []
+    for fkey, argument in filter_map.items():
+        assert fkey in FILTERS, 'Unknown filter %s' % fkey
+        f_class = FILTERS[fkey]
+        f_instance = f_class(**{
+            f_class.argument: argument
+        })
+        f_instance.setup()
+        filters.append(f_instance)
+    return filters
+
+
 class Sherlock(object):
 
     '''
@@ -113,22 +169,82 @@ class Sherlock(object):
     Builds datasource instances and sort their output by datetime
     '''
 
-    def __init__(self, logfile_map, shellcmd_map, output_name, filter_map=None):
+    # merged lines written to output at once
+    batch_size = 1000
+
+    def __init__(self, logfile_map, shellcmd_map, output_name, filter_map=None,
+                 merge_name='heap', source_options=None, workers=0,
+                 queue_size=8, async_shell=False, follow=False, lateness=2.0,
+                 stats=False, profile=None, output_options=None,
+                 logset_map=None, head=None, tail=None, shards=0,
+                 shard_transport='unix'):
         '''
         check args and call initialization methods
         '''
         self.logfile_map = logfile_map
         self.shellcmd_map = shellcmd_map
+        # logfiles read together with their rotations, see datasources.Logset
+        self.logset_map = logset_map or []
+
+        # additional datasource arguments keyed by path or command, "*" for all
+        if not source_options:
+            self.source_options = {}
+        else:
+            self.source_options = source_options
 
         assert output_name in OUTPUTS, 'Unknown output %s' % output_name
         self.output_name = output_name
-        self.output = OUTPUTS[output_name]()
+        # additional output arguments keyed by output name
+        self.output_options = output_options or {}
+        options = dict(self.output_options.get(output_name, {}))
+        if 'trigger' in options:
+            options['trigger'] = build_filters(options['trigger'])
+        self.output = OUTPUTS[output_name](**options)
 
         if not filter_map:
             self.filter_map = {}
         else:
             self.filter_map = filter_map
 
+        assert merge_name in MERGERS, 'Unknown merger %s' % merge_name
+        self.merge_name = merge_name
+
+        # number of worker processes parsing datasources, 0 parses inline
+        self.workers = workers
+        self.queue_size = queue_size
+
+        # number of worker processes streaming parsed lines over sockets,
+        # used instead of workers if set, see shard.Coordinator
+        self.shards = shards
+        self.shard_transport = shard_transport
+
+        # run all shell commands at once in an asyncio event loop
+        self.async_shell = async_shell
+
+        # keep logfiles open and merge lines appended to them, lines are held
+        # back at most lateness seconds waiting for other datasources
+        self.follow = follow
+        self.lateness = lateness
+        # workers send partial batches of appended lines after batch_latency
+        # seconds instead of waiting for full batches
+        self.batch_latency = None
+        if follow:
+            self.merge_name = 'follow'
+            self.batch_latency = 0.1
+
+        # only write first head or last tail lines. datasources are read no
+        # further than needed, tail reads logfiles backwards
+        self.head = head
+        self.tail = tail
+        if tail:
+            assert not follow, 'Tail limit does not work in follow mode!'
+            self.merge_name = 'reverse'
+
+        # count lines and time pipeline stages, see stats.Stats
+        self.enable_stats = stats
+        # path to write cProfile stats of run to
+        self.profile = profile
+
         self.setup()
 
     def setup(self):
@@ -138,93 +254,234 @@ class Sherlock(object):
 
         self.build_filter()
 
-        self.datasources = {}
+        # datasource instances keyed by path or command
+        self.sources = {}
         for parser, path in self.logfile_map:
             assert parser in PARSERS, 'Unknown parser: %s' % parser
-            source = DATASOURCES['logfile'](
+            assert os.path.isfile(path), 'Path must be a valid file: %s' % path
+            options = self.options(path)
+            if DATASOURCES['compressed'].accepts(path):
+                datasource = DATASOURCES['compressed']
+            else:
+                datasource = DATASOURCES['logfile']
+                if self.follow:
+                    options.setdefault('follow', True)
+            source = datasource(
+                PARSERS[parser](),
+                self.filters,
+                path=path,
+                **options
+            )
+            self.sources[path] = source
+
+        for parser, path in self.logset_map:
+            assert parser in PARSERS, 'Unknown parser: %s' % parser
+            options = self.options(path)
+            if self.follow:
+                options.setdefault('follow', True)
+            source = DATASOURCES['logset'](
                 PARSERS[parser](),
                 self.filters,
-                path=path
+                path=path,
+                **options
             )
-            self.datasources[path] = source.run()
+            self.sources[path] = source
 
+        if self.async_shell:
+            shell_datasource = DATASOURCES['asyncshell']
+        else:
+            shell_datasource = DATASOURCES['shellcommand']
         for parser, command in self.shellcmd_map:
             assert parser in PARSERS, 'Unknown parser: %s' % parser
-            source = DATASOURCES['shellcommand'](
+            source = shell_datasource(
                 PARSERS[parser](),
                 self.filters,
-                command=command
+                command=command,
+                **self.options(command)
+            )
+            self.sources[command] = source
+
+        self.stats = None
+        if self.enable_stats:
+            self.stats = Stats(self.sources)
+            for key, source in self.sources.items():
+                source.stats = self.stats.sources[key]
+
+        # datasource iterators, either run inline or in worker processes.
+        # batch merger takes batches.Batch instead of single lines, reverse
+        # merger takes lines newest first
+        method = 'run'
+        if self.merge_name == 'batch':
+            method = 'run_batches'
+        elif self.merge_name == 'reverse':
+            method = 'run_reverse'
+        self.pool = None
+        # tail limit only reads the newest lines, not worth workers
+        if self.shards and not self.tail:
+            from sherlock.shard import Coordinator
+            self.pool = Coordinator(
+                list(self.sources.values()),
+                self.shards,
+                batch_size=1 if method == 'run_batches' else 1000,
+                method=method,
+                transport=self.shard_transport,
+                latency=self.batch_latency,
+            )
+            self.datasources = {
+                key: self.pool.run(index)
+                for index, key in enumerate(self.sources)
+            }
+        elif self.workers and not self.tail:
+            from sherlock.pool import Pool
+            self.pool = Pool(
+                list(self.sources.values()),
+                self.workers,
+                queue_size=self.queue_size,
+                batch_size=1 if method == 'run_batches' else 1000,
+                method=method,
+                latency=self.batch_latency,
             )
-            self.datasources[command] = source.run()
+            self.datasources = {
+                key: self.pool.run(index)
+                for index, key in enumerate(self.sources)
+            }
+        elif self.tail:
+            self.datasources = {
+                key: source.run_reverse(self.tail)
+                for key, source in self.sources.items()
+            }
+        else:
+            self.datasources = {
+                key: getattr(source, method)()
+                for key, source in self.sources.items()
+            }
+
+    def options(self, key):
+        '''
+        return additional datasource arguments for path or command. arguments
+        of key "*" apply to all datasources
+        '''
+        options = dict(self.source_options.get('*', {}))
+        options.update(self.source_options.get(key, {}))
+        return options
 
     def build_filter(self):
         '''
         called during setup method
         build filters defined in filter_map
         '''
-        self.filters = []
-        for fkey, argument in self.filter_map.items():
-            assert fkey in FILTERS, 'Unknown filter %s' % fkey
-            f_class = FILTERS[fkey]
-            f_instance = f_class(**{
-                f_class.argument: argument
-            })
-            f_instance.setup()
-            self.filters.append(f_instance)
+        self.filters = build_filters(self.filter_map)
 
     def run(self):
         '''
         method called from executable. runs main loop on datasources.
-        - initialize buffer dict
-        - run mainloop (as long as data available)
-          - fill buffer
-          - remove empty datasources
-          - find and pop line having the lowest datetime entry from buffer
+        - merge datasources using configured merger
+        - write batches of merged lines to output
+        - profile main loop if profile path is set
         '''
 
-        self.buffer = {}
         self.output.setup()
+        if self.pool:
+            self.pool.start()
+        else:
+            for source in self.sources.values():
+                source.start()
+
+        if self.profile:
+            profiler = cProfile.Profile()
+            try:
+                profiler.runcall(self.merge)
+            finally:
+                profiler.dump_stats(self.profile)
+        else:
+            self.merge()
 
-        while self.datasources:
-
-            # poplist is used to pop empty datasources
-            poplist = []
-
-            # fetch buffer items from datasources, memorize empty ones
-            for key, iterator in self.datasources.items():
-                if key not in self.buffer or not self.buffer[key]:
-                    try:
-                        self.buffer[key] = iterator.send(None)
-                    except StopIteration:
-                        poplist.append(key)
-                    except Exception:
-                        raise
-
-            # remove empty datasources
-            for key in poplist:
-                self.datasources.pop(key)
-
-            # find and memorize buffer key to pop by finding earliest datetime
-            mindate = None
-            popkey = None
-            for key, line_d in self.buffer.items():
-                if not mindate:
-                    mindate = line_d['datetime']
-                    popkey = key
-                    continue
-                if line_d['datetime'] < mindate:
-                    mindate = line_d['datetime']
-                    popkey = key
-
-            # throw popkey line from buffer, remove popkey from buffer
-            if popkey and popkey in self.buffer:
-                popline = self.buffer.pop(popkey)
-                self.output.write(popline)
+        if self.pool:
+            self.pool.close()
 
         # close output stream and call optional run method
         self.output.close()
         self.output.run()
 
+    def merge(self):
+        '''
+        main loop, write merged lines of datasources to output. time
+        datasources and output if stats are enabled
+        '''
+        start = time.perf_counter()
+        datasources = self.datasources
+        if self.output.needs_source:
+            datasources = {
+                key: self.tagged(key, iterator)
+                for key, iterator in datasources.items()
+            }
+        if self.stats:
+            datasources = {
+                key: self.stats.timed(key, iterator)
+                for key, iterator in datasources.items()
+            }
+
+        # merged lines are written to output in batches
+        batch = []
+
+        def write():
+            '''write pending batch to output'''
+            if self.stats:
+                begin = time.perf_counter()
+                self.output.write_batch(batch)
+                self.stats.output_time += time.perf_counter() - begin
+            else:
+                self.output.write_batch(batch)
+            batch.clear()
+
+        def idle():
+            '''write pending batch and flush output while merger waits'''
+            if batch:
+                write()
+            self.output.flush()
+
+        if self.merge_name == 'follow':
+            # queue_size batches of lines are buffered per datasource
+            merger = MERGERS['follow'](
+                datasources, lateness=self.lateness, idle=idle,
+                queue_size=self.queue_size * self.batch_size,
+            )
+        else:
+            merger = MERGERS[self.merge_name](datasources)
+        lines = merger.run()
+        if self.tail:
+            lines = reversed(list(itertools.islice(lines, self.tail)))
+        if self.head:
+            lines = itertools.islice(lines, self.head)
+        for line_d in lines:
+            batch.append(line_d)
+            if len(batch) >= self.batch_size:
+                write()
+        if batch:
+            write()
+
+        # stop datasources not read to their end, follow merger threads may
+        # still be reading them
+        if (self.head or self.tail) and self.merge_name != 'follow':
+            for iterator in itertools.chain(
+                    datasources.values(), self.datasources.values()):
+                iterator.close()
+
+        if self.stats:
+            self.stats.finish(time.perf_counter() - start)
+
+    def tagged(self, key, iterator):
+        '''
+        yield lines or batches of iterator, set source of lines to key
+        '''
+        for item in iterator:
+            if self.merge_name == 'batch':
+                for line_d in item.records:
+                    line_d.source = key
+            else:
+                item.source = key
+            yield item
+
     @staticmethod
     def load_config(configpath):
         '''
@@ -262,14 +519,60 @@ class Sherlock(object):
             }
             filter_map.update(args_filter_map)
 
+        if hasattr(config, 'source_options') and isinstance(config.source_options, dict):
+            source_options = config.source_options
+        else:
+            source_options = {}
+
         if args.output:
             output_name = args.output
         else:
             output_name = config.output
 
+        if hasattr(config, 'output_options') and isinstance(config.output_options, dict):
+            output_options = dict(config.output_options)
+        else:
+            output_options = {}
+        histogram = dict(output_options.get('histogram', {}))
+        if getattr(args, 'bucket', None):
+            histogram['bucket'] = args.bucket
+        if getattr(args, 'style', None):
+            histogram['style'] = args.style
+        output_options['histogram'] = histogram
+
+        if args.merge:
+            merge_name = args.merge
+        else:
+            merge_name = getattr(config, 'merge', 'heap')
+
+        if args.workers is not None:
+            workers = args.workers
+        else:
+            workers = getattr(config, 'workers', 0)
+
+        if getattr(args, 'shards', None) is not None:
+            shards = args.shards
+        else:
+            shards = getattr(config, 'shards', 0)
+
         return Sherlock(
             logfile_map=config.logfile_map,
             shellcmd_map=config.shellcmd_map,
             output_name=output_name,
-            filter_map=filter_map
+            filter_map=filter_map,
+            merge_name=merge_name,
+            source_options=source_options,
+            workers=workers,
+            queue_size=getattr(config, 'queue_size', 8),
+            async_shell=getattr(config, 'async_shell', False),
+            follow=getattr(args, 'follow', False) or getattr(config, 'follow', False),
+            lateness=getattr(config, 'lateness', 2.0),
+            stats=getattr(args, 'stats', False),
+            profile=getattr(args, 'profile', None),
+            output_options=output_options,
+            logset_map=getattr(config, 'logset_map', None),
+            head=getattr(args, 'head', None),
+            tail=getattr(args, 'tail', None),
+            shards=shards,
+            shard_transport=getattr(config, 'shard_transport', 'unix')
         )
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# snapshot -- keep recent merged lines in memory, dump them on a trigger
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from sherlock.output import Output
+import collections
+import datetime
+import gzip
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+
+class RingBuffer(object):
+
+    '''
+    Recent raw lines held as gzip compressed blocks of block_size characters.
+    Oldest blocks are dropped once blocks are older than max_age microseconds
+    before the newest line, or blocks and pending lines exceed max_bytes.
+    Blocks are complete gzip members, so dumping only concatenates them.
+    '''
+
+    Block = collections.namedtuple('Block', ('first', 'last', 'count', 'data'))
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_age=None,
+                 block_size=256 * 1024):
+        assert block_size < max_bytes, 'Blocks must be smaller than buffer!'
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.block_size = block_size
+        self.blocks = collections.deque()
+        # compressed bytes of blocks
+        self.size = 0
+        # lines not compressed yet
+        self.lines = []
+        self.pending = 0
+        self.first = None
+        self.last = None
+
+    def __len__(self):
+        return sum(block.count for block in self.blocks) + len(self.lines)
+
+    def add_batch(self, lines):
+        '''append list of line_d, compress block if full'''
+        for line_d in lines:
+            if self.first is None:
+                self.first = line_d.timestamp
+            self.last = line_d.timestamp
+            self.lines.append(line_d.raw_line)
+            self.pending += len(line_d.raw_line)
+            if self.pending >= self.block_size:
+                self.seal()
+
+    def seal(self):
+        '''compress pending lines into block, drop old blocks'''
+        if not self.lines:
+            return
+        data = gzip.compress(
+            ''.join(self.lines).encode('utf-8'), compresslevel=1, mtime=0
+        )
+        self.blocks.append(self.Block(self.first, self.last, len(self.lines), data))
+        self.size += len(data)
+        self.lines = []
+        self.pending = 0
+        self.first = None
+        self.evict()
+
+    def evict(self):
+        '''drop oldest blocks exceeding max_bytes or max_age'''
+        blocks = self.blocks
+        # a full block of pending lines always fits
+        while blocks and self.size + self.block_size > self.max_bytes:
+            self.size -= len(blocks.popleft().data)
+        if self.max_age is None or not blocks:
+            return
+        newest = blocks[-1].last
+        while blocks and blocks[0].last < newest - self.max_age:
+            self.size -= len(blocks.popleft().data)
+
+    def dump(self, path):
+        '''
+        write all lines to gzip file at path, return count of lines
+        '''
+        self.seal()
+        with open(path + '.part', 'wb') as dumpfile:
+            for block in self.blocks:
+                dumpfile.write(block.data)
+        os.replace(path + '.part', path)
+        return sum(block.count for block in self.blocks)
+
+
+class Snapshot(Output):
+
+    '''
+    Keep merged lines of the last minutes, at most megabytes compressed, in
+    memory. Dump them to a gzip file in directory on SIGUSR1, when a line
+    passes all trigger filters or on "dump" command sent to socket. Best
+    used in follow mode
+    '''
+
+    def __init__(self, minutes=30, megabytes=64, directory='.', trigger=None,
+                 socket=None, block_size=256, on_close=True, cooldown=60):
+        '''
+        - trigger: filter instances, lines passing all of them trigger a dump
+        - socket: path of Unix socket accepting "dump" commands
+        - block_size: KB of lines compressed at once
+        - on_close: dump when datasources ended, e.g. without follow mode
+        - cooldown: seconds after a dump lines do not trigger another one
+        '''
+        self.max_age = int(minutes * 60 * 1000000) if minutes else None
+        self.max_bytes = int(megabytes * 1024 * 1024)
+        self.directory = directory
+        self.trigger = trigger or []
+        self.socket_path = socket
+        self.block_size = int(block_size * 1024)
+        self.on_close = on_close
+        self.cooldown = cooldown
+
+    def setup(self):
+        '''set up buffer, signal handler and socket'''
+        self.buffer = RingBuffer(self.max_bytes, self.max_age, self.block_size)
+        self.raw_trigger = [lfilter for lfilter in self.trigger if lfilter.raw()]
+        self.line_trigger = [lfilter for lfilter in self.trigger if not lfilter.raw()]
+        # reason of requested dump, checked on every write and flush
+        self.requested = None
+        # events of socket commands waiting for the path of the dump
+        self.waiting = []
+        self.lock = threading.Lock()
+        self.dumps = []
+        # monotonic time of last dump, see cooldown
+        self.dumped = None
+        self.previous = None
+        if threading.current_thread() is threading.main_thread():
+            self.previous = signal.signal(signal.SIGUSR1, self.signalled)
+        self.listener = None
+        if self.socket_path:
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.listener.bind(self.socket_path)
+            self.listener.listen(4)
+            threading.Thread(
+                target=self.serve, args=(self.listener,), daemon=True
+            ).start()
+
+    def signalled(self, signum, frame):
+        '''
+        request dump on SIGUSR1. runs in main thread between any two
+        bytecodes, must not take lock
+        '''
+        self.requested = 'signal'
+
+    def request(self, reason, event=None):
+        '''request dump on next write or flush, see FollowMerger.poll'''
+        with self.lock:
+            self.requested = reason
+            if event is not None:
+                self.waiting.append(event)
+
+    def serve(self, listener):
+        '''answer "dump" commands on listener socket with path of dump'''
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:  # listener closed
+                return
+            with conn:
+                command = conn.makefile('rb').readline().strip()
+                if command != b'dump':
+                    conn.sendall(b'unknown command\n')
+                    continue
+                event = threading.Event()
+                event.path = None
+                self.request('socket', event)
+                event.wait(60)
+                conn.sendall(('%s\n' % (event.path or 'timeout')).encode('utf-8'))
+
+    def write(self, line_d):
+        '''ingest line_d'''
+        self.write_batch([line_d])
+
+    def write_batch(self, lines):
+        '''
+        ingest lines, dump if requested or a line passes trigger filters
+        unless the last dump is less than cooldown seconds ago
+        '''
+        self.buffer.add_batch(lines)
+        if self.trigger and self.requested is None and (
+                self.dumped is None or
+                time.monotonic() - self.dumped >= self.cooldown):
+            for line_d in lines:
+                if all(lfilter.run_raw(line_d.raw_line) for lfilter in self.raw_trigger) and \
+                        all(lfilter.run(line_d) for lfilter in self.line_trigger):
+                    self.request('trigger')
+                    break
+        if self.requested is not None:
+            self.dump()
+
+    def flush(self):
+        '''dump if requested while waiting for lines'''
+        if self.requested is not None:
+            self.dump()
+
+    def dump(self):
+        '''write buffer to new gzip file in directory, return its path'''
+        with self.lock:
+            reason, self.requested = self.requested, None
+            waiting, self.waiting = self.waiting, []
+        path = os.path.join(self.directory, 'pf_sherlock-%s.log.gz' % (
+            datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        ))
+        count = self.buffer.dump(path)
+        self.dumps.append(path)
+        self.dumped = time.monotonic()
+        print('Snapshot of %s lines written to %s (%s)' % (
+            count, path, reason or 'close'
+        ), file=sys.stderr)
+        for event in waiting:
+            event.path = path
+            event.set()
+        return path
+
+    def close(self):
+        '''dump remaining window, close socket, restore SIGUSR1 handler'''
+        if self.on_close and len(self.buffer):
+            self.dump()
+        if self.previous is not None:
+            signal.signal(signal.SIGUSR1, self.previous)
+            self.previous = None
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+            os.remove(self.socket_path)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# stats -- counters and timers of pipeline stages
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+
+class SourceStats(object):
+
+    '''
+    Counters and timers of a datasource.
+
+    - lines: lines read
+    - bytes: size of lines read, characters for decoded lines
+    - rejected: lines the parser returned None for
+    - dropped: lines dropped per filter name
+    - passed: lines passed to merger
+    - parse_time, filter_time: seconds spent parsing and filtering
+    - source_time: seconds the merger waited for the datasource, including
+      reading, parsing and filtering when parsing inline
+    - queue_max, queue_sum, queue_samples: sampled sizes of the queue
+      feeding the merger, see pool.Pool and datasources.AsyncShellcommand
+    '''
+
+    fields = (
+        'lines', 'bytes', 'rejected', 'passed', 'parse_time', 'filter_time',
+        'source_time',
+    )
+
+    def __init__(self):
+        self.lines = 0
+        self.bytes = 0
+        self.rejected = 0
+        self.passed = 0
+        self.parse_time = 0.0
+        self.filter_time = 0.0
+        self.source_time = 0.0
+        self.dropped = {}
+        self.queue_max = 0
+        self.queue_sum = 0
+        self.queue_samples = 0
+
+    def drop(self, name, count=1):
+        '''count lines dropped by filter name'''
+        self.dropped[name] = self.dropped.get(name, 0) + count
+
+    def sample_queue(self, depth):
+        '''record sampled queue size'''
+        if depth > self.queue_max:
+            self.queue_max = depth
+        self.queue_sum += depth
+        self.queue_samples += 1
+
+    def as_dict(self):
+        '''return counters as dictionary'''
+        result = {field: getattr(self, field) for field in self.fields}
+        result['dropped'] = dict(self.dropped)
+        result['queue_max'] = self.queue_max
+        result['queue_mean'] = (
+            self.queue_sum / self.queue_samples if self.queue_samples else 0
+        )
+        result['queue_sum'] = self.queue_sum
+        result['queue_samples'] = self.queue_samples
+        return result
+
+    def update(self, other):
+        '''add counters of dictionary built by as_dict, e.g. from workers'''
+        for field in self.fields:
+            if field != 'source_time':
+                setattr(self, field, getattr(self, field) + other[field])
+        for name, count in other['dropped'].items():
+            self.drop(name, count)
+        self.queue_max = max(self.queue_max, other['queue_max'])
+        self.queue_sum += other['queue_sum']
+        self.queue_samples += other['queue_samples']
+
+
+class Stats(object):
+
+    '''
+    Counters and timers of a Sherlock run: SourceStats per datasource key,
+    seconds spent merging and writing output
+    '''
+
+    def __init__(self, keys):
+        self.sources = {key: SourceStats() for key in keys}
+        self.merge_time = 0.0
+        self.output_time = 0.0
+        self.total_time = 0.0
+
+    def timed(self, key, iterator):
+        '''
+        yield from iterator, add time spent in it to source_time of key
+        '''
+        stats = self.sources[key]
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            try:
+                line_d = next(iterator)
+            except StopIteration:
+                stats.source_time += clock() - start
+                return
+            stats.source_time += clock() - start
+            yield line_d
+
+    def finish(self, total_time):
+        '''
+        set total run time, merge time is what sources and output left
+        '''
+        self.total_time = total_time
+        self.merge_time = max(0.0, total_time - self.output_time - sum(
+            stats.source_time for stats in self.sources.values()
+        ))
+
+    def as_dict(self):
+        '''return all counters as dictionary'''
+        return {
+            'sources': {
+                key: stats.as_dict() for key, stats in self.sources.items()
+            },
+            'merge_time': self.merge_time,
+            'output_time': self.output_time,
+            'total_time': self.total_time,
+        }
+
+    def report(self):
+        '''return human readable report'''
+        lines = [
+            '%-40s %10s %12s %10s %10s %9s %9s %9s %7s' % (
+                'datasource', 'lines', 'bytes', 'rejected', 'passed',
+                'parse s', 'filter s', 'source s', 'queue'
+            )
+        ]
+        for key, stats in self.sources.items():
+            name = key if len(key) <= 40 else '...' + key[-37:]
+            lines.append('%-40s %10d %12d %10d %10d %9.3f %9.3f %9.3f %7d' % (
+                name, stats.lines, stats.bytes, stats.rejected, stats.passed,
+                stats.parse_time, stats.filter_time, stats.source_time,
+                stats.queue_max
+            ))
+            for fname, count in sorted(stats.dropped.items()):
+                lines.append('    dropped by %-28s %10d' % (fname, count))
+        lines.append('merge %.3fs, output %.3fs, total %.3fs' % (
+            self.merge_time, self.output_time, self.total_time
+        ))
+        return '\n'.join(lines)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Lars Bergmann
+#
+# timestamps -- fast path timestamp parsing for parsers
+#
+# GNU GENERAL PUBLIC LICENSE
+#    Version 3, 29 June 2007
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+
+MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+}
+
+# characters a timezone suffix may start with, timezones are ignored
+TZ_START = ('+', '-', 'Z')
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def iso(datestring):
+    '''
+    2019-01-20 06:26:01 or 2019-01-20T06:26:01, optionally followed by a
+    timezone
+    '''
+    if (datestring[4] != '-' or datestring[7] != '-' or
+            datestring[10] not in 'T ' or datestring[13] != ':' or
+            datestring[16] != ':'):
+        raise ValueError(datestring)
+    rest = datestring[19:]
+    if rest and not rest.startswith(TZ_START):
+        raise ValueError(datestring)
+    return datetime.datetime(
+        int(datestring[0:4]), int(datestring[5:7]), int(datestring[8:10]),
+        int(datestring[11:13]), int(datestring[14:16]), int(datestring[17:19]),
+    )
+
+
+def clf(datestring):
+    '''
+    common log format: 20/Jan/2019:06:26:01
+    '''
+    if (len(datestring) != 20 or datestring[2] != '/' or
+            datestring[6] != '/' or datestring[11] != ':'):
+        raise ValueError(datestring)
+    return datetime.datetime(
+        int(datestring[7:11]), MONTHS[datestring[3:6]], int(datestring[0:2]),
+        int(datestring[12:14]), int(datestring[15:17]), int(datestring[18:20]),
+    )
+
+
+def iso_or_clf(datestring):
+    '''
+    apache2 access logs come with iso or common log format dates
+    '''
+    if datestring[2] == '/':
+        return clf(datestring)
+    return iso(datestring)
+
+
+def ctime(datestring):
+    '''
+    apache2 error log format: Tue Mar 08 10:34:21 2005, seconds may have a
+    fraction
+    '''
+    _, month, day, clock, year = datestring.split()
+    if clock[2] != ':' or clock[5] != ':':
+        raise ValueError(datestring)
+    micro = fraction(clock[9:]) if len(clock) > 8 else 0
+    return datetime.datetime(
+        int(year), MONTHS[month], int(day),
+        int(clock[0:2]), int(clock[3:5]), int(clock[6:8]), micro,
+    )
+
+
+def syslog(datestring):
+    '''
+    syslog format without year: Jan 20 06:26:01, current year is used
+    '''
+    month, day, clock = datestring.split()
+    if len(clock) != 8 or clock[2] != ':' or clock[5] != ':':
+        raise ValueError(datestring)
+    return datetime.datetime(
+        datetime.date.today().year, MONTHS[month], int(day),
+        int(clock[0:2]), int(clock[3:5]), int(clock[6:8]),
+    )
+
+
+def fraction(digits):
+    '''
+    convert fraction of a second to microseconds. digits may be followed by
+    a timezone
+    '''
+    end = 0
+    while end < len(digits) and digits[end].isdigit():
+        end += 1
+    if not end or (end < len(digits) and not digits.startswith(TZ_START, end)):
+        raise ValueError(digits)
+    return int(digits[:min(end, 6)].ljust(6, '0'))
+
+
+FORMATS = {
+    'iso': iso,
+    'clf': clf,
+    'iso-or-clf': iso_or_clf,
+    'ctime': ctime,
+    'syslog': syslog,
+}
+
+
+def to_timestamp(dateobj):
+    '''
+    convert naive datetime to sortable integer of epoch microseconds
+    '''
+    delta = dateobj - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def to_datetime(timestamp):
+    '''
+    convert integer of epoch microseconds to naive datetime
+    '''
+    return EPOCH + datetime.timedelta(microseconds=timestamp)
+
+
+class Timestamps(object):
+
+    '''
+    Memoizing timestamp parser having a fixed format fast path.
+
+    Dates are parsed using the fast path function of date_format, dateutil is
+    only used if the fast path fails. Results are memoized by the part of the
+    datestring in front of a fraction of a second, so lines sharing the same
+    second are parsed only once. Timestamps are integers of epoch
+    microseconds, timezones are ignored.
+    '''
+
+    def __init__(self, date_format=None, split_fraction=True, cache_size=4096):
+        '''
+        - date_format must be a key of FORMATS or None to always use dateutil
+        '''
+        assert date_format is None or date_format in FORMATS, \
+            'Unknown date format %s' % date_format
+        self.fast = FORMATS.get(date_format)
+        self.split_fraction = split_fraction
+        self.cache_size = cache_size
+        # fast path results keyed by datestring without fraction
+        self.cache = {}
+        # dateutil results keyed by complete datestring
+        self.slow_cache = {}
+
+    def fallback(self, datestring):
+        '''
+        generic and slow dateutil parsing of the complete datestring
+        '''
+        timestamp = self.slow_cache.get(datestring)
+        if timestamp is None:
+            # imported on first use, most datestrings take the fast path
+            import dateutil.parser
+            timestamp = to_timestamp(
+                dateutil.parser.parse(datestring, ignoretz=True)
+            )
+            self.memorize(self.slow_cache, datestring, timestamp)
+        return timestamp
+
+    def memorize(self, cache, key, timestamp):
+        '''
+        store timestamp in bounded cache
+        '''
+        if len(cache) >= self.cache_size:
+            cache.clear()
+        cache[key] = timestamp
+
+    def parse(self, datestring):
+        '''
+        return timestamp for datestring
+        '''
+        key, digits = datestring, None
+        if self.split_fraction:
+            key, _, digits = datestring.partition('.')
+
+        timestamp = self.cache.get(key)
+        if timestamp is None:
+            if not self.fast:
+                return self.fallback(datestring)
+            try:
+                timestamp = to_timestamp(self.fast(key))
+            except (ValueError, IndexError, KeyError):
+                return self.fallback(datestring)
+            self.memorize(self.cache, key, timestamp)
+
+        if digits:
+            try:
+                return timestamp + fraction(digits)
+            except ValueError:
+                return self.fallback(datestring)
+        return timestamp
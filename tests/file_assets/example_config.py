@@ -12,22 +12,46 @@ shellcmd_map = {
     #('journal', 'dmesg --time-format iso -P'),
 }
 
+# start all shell commands at once, read their output without blocking
+'''
+async_shell = True
 '''
-shellcmd_map = set()
 
+# compressed logfiles (gzip, bzip2, xz) are read natively via logfile_map
+'''
 for num in range(2, 32):
-    shellcmd_map.add(
-        ('apache2-error', 'zcat /apache2/error.log.%s.gz' % num)
+    logfile_map.add(
+        ('apache2-error', '/apache2/error.log.%s.gz' % num)
     )
-    shellcmd_map.add(
-        ('apache2-access', 'zcat /apache2/access.log.%s.gz' % num)
+    logfile_map.add(
+        ('apache2-access', '/apache2/access.log.%s.gz' % num)
     )
     if num <= 5:
-        shellcmd_map.add(
-            ('postgresql', 'zcat /postgresql-10-main.log.%s.gz' % num)
+        logfile_map.add(
+            ('postgresql', '/postgresql-10-main.log.%s.gz' % num)
         )
 '''
 
+# or read logfiles and their rotations one after another instead of merging
+# them, rotations ("error.log.1", "error.log.2.gz", ...) are discovered
+'''
+logset_map = {
+    ('apache2-error', '/apache2/error.log'),
+    ('apache2-access', '/apache2/access.log'),
+    ('postgresql', '/postgresql-10-main.log*'),
+}
+'''
+
+# additional datasource arguments keyed by path or command, "*" for all
+'''
+source_options = {
+    # keep persistent time index of logfiles, sampled every 256 KB
+    '*': {'index': True, 'index_step': 256, 'index_dir': '/tmp'},
+    # logfile is time ordered, bisect it for time filters
+    './tests/file_assets/postgresql/postgresql-9.5-main.log': {'seek': True},
+}
+'''
+
 # filter may also be passed as arguments from pf_sherlock
 '''
 # each line must contain 'kernel' and is less than 24 hours old
@@ -37,5 +61,33 @@ filter_map = {
 }
 '''
 
+# keep logfiles open and merge appended lines, hold lines back at most
+# lateness seconds waiting for other datasources
+'''
+follow = True
+lateness = 2.0
+'''
+
 # display keyword
 output = 'stdout'
+
+# additional output arguments keyed by output name
+'''
+output_options = {
+    'histogram': {'bucket': 300, 'style': 'sparkline'},
+    # keep last 30 minutes in memory, dump them on SIGUSR1, "dump" command
+    # on socket or any line containing FATAL
+    'snapshot': {
+        'minutes': 30, 'megabytes': 64, 'directory': '/var/tmp',
+        'trigger': {'kw': 'FATAL'}, 'socket': '/tmp/pf_sherlock-snapshot.sock',
+    },
+}
+'''
+
+# socket of "pf_sherlock --daemon", seconds between reading appended lines
+# and running shell commands, records kept per datasource
+'''
+daemon_socket = '/tmp/pf_sherlock.sock'
+daemon_interval = 5.0
+daemon_max_records = 1000000
+'''
@@ -18,3 +18,1284 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# builtin
+import datetime
+import itertools
+import os
+
+# custom
+import sherlock.mergers as mergers
+from sherlock.record import LineRecord
+
+
+def make_line(second, raw_line=''):
+    '''build record at given second of 2019-01-01'''
+    return LineRecord('LOG', (1546300800 + second) * 1000000, raw_line)
+
+
+def make_datasources(*sources):
+    '''build datasource iterator dict from lists of records'''
+    return {
+        'source-%s' % num: (line_d for line_d in lines)
+        for num, lines in enumerate(sources)
+    }
+
+
+def test_heap_merger_matches_scan_merger():
+    sources = ([1, 4, 6, 9], [2, 3, 10], [], [5, 7, 8])
+    heap = mergers.HeapMerger(make_datasources(
+        *[[make_line(s) for s in seconds] for seconds in sources]
+    ))
+    scan = mergers.ScanMerger(make_datasources(
+        *[[make_line(s) for s in seconds] for seconds in sources]
+    ))
+    expected = list(range(1, 11))
+    assert [l['datetime'].second for l in heap.run()] == expected
+    assert [l['datetime'].second for l in scan.run()] == expected
+
+
+def test_heap_merger_breaks_ties_by_source_order():
+    merger = mergers.HeapMerger(make_datasources(
+        [make_line(1, 'a1'), make_line(2, 'a2')],
+        [make_line(1, 'b1'), make_line(2, 'b2')],
+    ))
+    assert [l['raw_line'] for l in merger.run()] == ['a1', 'b1', 'a2', 'b2']
+
+
+def test_timestamps_fast_path_matches_dateutil():
+    import dateutil.parser
+    from sherlock.timestamps import Timestamps, to_timestamp
+    cases = {
+        'iso': [
+            '2019-01-20 06:26:01', '2019-01-20T06:26:01.895',
+            '2019-01-20T06:26:01+0100', '2019-01-20T06:26:01.5+0100',
+            '20.01.2019 06:26:01',
+        ],
+        'ctime': ['Tue Mar 08 10:34:21 2005', 'Tue Mar 08 10:34:21.123456 2005'],
+        'syslog': ['Jan 20 06:26:01', 'Jan 2 06:26:01'],
+    }
+    for date_format, datestrings in cases.items():
+        timestamps = Timestamps(date_format, date_format != 'ctime')
+        for datestring in datestrings:
+            expected = to_timestamp(dateutil.parser.parse(datestring, ignoretz=True))
+            assert timestamps.parse(datestring) == expected
+            # second call is served from cache
+            assert timestamps.parse(datestring) == expected
+
+
+def test_timestamps_common_log_format():
+    from sherlock.timestamps import Timestamps, to_datetime
+    timestamps = Timestamps('iso-or-clf')
+    timestamp = timestamps.parse('20/Jan/2019:06:26:01')
+    assert to_datetime(timestamp) == datetime.datetime(2019, 1, 20, 6, 26, 1)
+
+
+class CountingParser(object):
+
+    '''wrap parser counting calls of run'''
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.calls = 0
+
+    def run(self, line):
+        self.calls += 1
+        return self.parser.run(line)
+
+
+def write_psql_log(path, hours):
+    '''write postgresql logfile having one line per minute for hours until now'''
+    now = datetime.datetime.now().replace(microsecond=0)
+    with open(path, 'w') as logfile:
+        for minute in range(hours * 60, 0, -1):
+            dateobj = now - datetime.timedelta(minutes=minute)
+            logfile.write('%s CET [1-1] LOG:  minute %s\n' % (dateobj, minute))
+
+
+def test_logfile_bisects_time_window(tmp_path):
+    import sherlock.datasources as datasources
+    import sherlock.filters as filters
+    import sherlock.parsers as parsers
+    path = str(tmp_path / 'postgresql.log')
+    write_psql_log(path, 48)
+
+    lasth = filters.Lasthours(lasth=2)
+    lasth.setup()
+    uptoh = filters.Uptohours(uptoh=1)
+    uptoh.setup()
+
+    results = {}
+    for seek in (True, False):
+        parser = CountingParser(parsers.Psql_Parser())
+        source = datasources.Logfile(parser, [lasth, uptoh], path=path, seek=seek)
+        results[seek] = ([l['raw_line'] for l in source.run()], parser.calls)
+
+    assert results[True][0] == results[False][0]
+    assert 55 <= len(results[True][0]) <= 60
+    assert results[True][1] < results[False][1] / 10
+
+
+def test_mmap_reader_bisects_time_window(tmp_path):
+    import sherlock.datasources as datasources
+    import sherlock.filters as filters
+    import sherlock.parsers as parsers
+    path = str(tmp_path / 'postgresql.log')
+    write_psql_log(path, 48)
+
+    lasth = filters.Lasthours(lasth=2)
+    lasth.setup()
+    uptoh = filters.Uptohours(uptoh=1)
+    uptoh.setup()
+
+    results = {}
+    for reader in ('lines', 'mmap'):
+        source = datasources.Logfile(
+            parsers.Psql_Parser(), [lasth, uptoh], path=path, seek=True, reader=reader
+        )
+        results[reader] = [l['raw_line'] for l in source.run()]
+    assert results['lines'] == results['mmap']
+    assert 55 <= len(results['mmap']) <= 60
+
+
+def test_logfile_reads_unordered_and_crlf_logfiles(tmp_path):
+    import sherlock.datasources as datasources
+    import sherlock.filters as filters
+    import sherlock.parsers as parsers
+    path = str(tmp_path / 'postgresql.log')
+    write_psql_log(path, 4)
+    with open(path) as logfile:
+        lines = logfile.readlines()
+    # newer half first, bisecting would miss lines
+    with open(path, 'w') as logfile:
+        logfile.writelines(lines[120:] + lines[:120])
+    lasth = filters.Lasthours(lasth=3)
+    lasth.setup()
+
+    def run(**kwargs):
+        source = datasources.Logfile(parsers.Psql_Parser(), [lasth], path=path, **kwargs)
+        return [line_d.raw_line for line_d in source.run()]
+
+    # time ordered logfiles are only bisected if asked for
+    assert run() == run(seek=False)
+    assert len(run()) >= 179
+
+    # line breaks are "\n" like in text mode
+    with open(path, 'w', newline='\r\n') as logfile:
+        logfile.writelines(lines)
+    assert run() == run(reader='mmap') == lines[-len(run()):]
+    assert len(run()) >= 179
+    source = datasources.Logfile(parsers.Psql_Parser(), [], path=path)
+    newest = itertools.islice(source.run_reverse(2), 2)
+    assert [line_d.raw_line for line_d in newest] == lines[:-3:-1]
+
+
+def test_logfile_time_index(tmp_path):
+    import sherlock.datasources as datasources
+    import sherlock.filters as filters
+    import sherlock.index as index
+    import sherlock.parsers as parsers
+    path = str(tmp_path / 'postgresql.log')
+    write_psql_log(path, 48)
+
+    lasth = filters.Lasthours(lasth=2)
+    lasth.setup()
+    uptoh = filters.Uptohours(uptoh=1)
+    uptoh.setup()
+
+    def run(**kwargs):
+        parser = CountingParser(parsers.Psql_Parser())
+        source = datasources.Logfile(parser, [lasth, uptoh], path=path, **kwargs)
+        return [l['raw_line'] for l in source.run()], parser.calls
+
+    expected, calls = run(seek=False)
+    options = {'index': True, 'index_step': 4, 'index_dir': str(tmp_path)}
+    built, built_calls = run(**options)
+    cached, cached_calls = run(**options)
+    assert built == cached == expected
+    assert built_calls > cached_calls
+    assert cached_calls < calls / 10
+    index_file = index.index_path(path, str(tmp_path))
+    with open(index_file, 'rb') as indexfile:
+        first_index = indexfile.read()
+
+    # grown logfile extends index, older entries are kept
+    with open(path, 'a') as logfile:
+        logfile.write(expected[-1] * 200)
+    assert run(**options)[0] == run(seek=False)[0]
+    with open(index_file, 'rb') as indexfile:
+        grown_index = indexfile.read()
+    assert len(grown_index) > len(first_index)
+    # last entry of previous index is sampled again
+    old_entries = first_index.split(b'\n', 1)[1][:-24]
+    assert grown_index.split(b'\n', 1)[1].startswith(old_entries)
+
+    # logfile truncated in place and regrown past indexed size, like after
+    # logrotate copytruncate, is indexed from scratch
+    size = os.path.getsize(path)
+    with open(path, 'r+') as logfile:
+        logfile.truncate(0)
+        for line in expected[:1] * 10 + expected:
+            logfile.write(line.rstrip('\n').ljust(size // 50) + '\n')
+    assert os.path.getsize(path) > size
+    assert run(**options)[0] == run(seek=False)[0]
+
+
+ASSET_LOGFILES = [
+    ('postgresql', './tests/file_assets/postgresql/postgresql-9.5-main.log'),
+    ('apache2-access', './tests/file_assets/apache2/access.log'),
+    ('apache2-error', './tests/file_assets/apache2/error.log'),
+]
+
+
+def test_worker_pool_keeps_serial_order(capsys):
+    import sherlock.sherlock as sherlock
+    results = []
+    for workers in (0, 2):
+        sherlock.Sherlock(
+            logfile_map=ASSET_LOGFILES,
+            shellcmd_map=[],
+            output_name='stdout',
+            workers=workers,
+        ).run()
+        results.append(capsys.readouterr().out)
+    assert results[0] and results[0] == results[1]
+
+
+def test_mmap_reader_matches_lines_reader(tmp_path):
+    import sherlock.datasources as datasources
+    import sherlock.filters as filters
+    import sherlock.parsers as parsers
+    keyword = filters.Keyword(keyword='Dec')
+    keyword.setup()
+    nopattern = filters.Nopattern(patterns='notice')
+    nopattern.setup()
+    # last line without line break
+    path = str(tmp_path / 'error.log')
+    with open('./tests/file_assets/apache2/error.log', 'rb') as logfile:
+        data = logfile.read()
+    with open(path, 'wb') as logfile:
+        logfile.write(data.rstrip(b'\n'))
+
+    for lfilters in ([], [keyword], [keyword, nopattern]):
+        results = {}
+        for reader in ('lines', 'mmap'):
+            source = datasources.Logfile(
+                parsers.Apache2_Error_Parser(), lfilters, path=path, reader=reader
+            )
+            source.blocksize = 64
+            results[reader] = [(l.offset, l.raw_line) for l in source.run()]
+        assert results['lines'] == results['mmap']
+        for offset, raw_line in results['mmap']:
+            assert data[offset:].startswith(raw_line.encode('utf-8'))
+
+
+def test_compressedfile_matches_logfile(tmp_path):
+    import bz2
+    import gzip
+    import lzma
+    import sherlock.datasources as datasources
+    import sherlock.parsers as parsers
+    path = './tests/file_assets/apache2/access.log'
+    with open(path, 'rb') as logfile:
+        data = logfile.read()
+    expected = [
+        l['raw_line'] for l in
+        datasources.Logfile(parsers.Apache2_Access_Parser(), [], path=path).run()
+    ]
+
+    for suffix, module in (('gz', gzip), ('bz2', bz2), ('xz', lzma)):
+        compressed = str(tmp_path / ('access.log.%s' % suffix))
+        with module.open(compressed, 'wb') as logfile:
+            logfile.write(data)
+        assert datasources.compression(compressed) is module.open
+        for threaded in (True, False):
+            source = datasources.Compressedfile(
+                parsers.Apache2_Access_Parser(), [],
+                path=compressed, threaded=threaded
+            )
+            source.blocksize = 4096
+            assert [l['raw_line'] for l in source.run()] == expected
+
+    assert datasources.compression(path) is None
+
+
+def test_line_record_dict_access():
+    import pickle
+    record = make_line(61, 'raw\n')
+    assert record['raw_line'] == 'raw\n'
+    assert record.get('code') == 'LOG'
+    assert record.get('unknown', 1) == 1
+    assert record['datetime'] == datetime.datetime(2019, 1, 1, 0, 1, 1)
+    assert set(record.keys()) >= {'code', 'datetime', 'raw_line'}
+    copy = pickle.loads(pickle.dumps(record))
+    assert (copy.code, copy.timestamp, copy.raw_line) == ('LOG', record.timestamp, 'raw\n')
+
+
+def test_custom_parser_dicts_become_records():
+    import sherlock.datasources as datasources
+
+    class DictParser(object):
+        def run(self, line):
+            return {
+                'code': 'LOG',
+                'datetime': datetime.datetime(2019, 1, 1, 0, 0, int(line)),
+                'raw_line': line,
+            }
+
+    source = datasources.Logfile(DictParser(), [])
+    record = source.process('5')
+    assert isinstance(record, LineRecord)
+    assert record.timestamp == make_line(5).timestamp
+
+
+def test_keyword_filter_runs_before_parsing():
+    import sherlock.datasources as datasources
+    import sherlock.filters as filters
+    import sherlock.parsers as parsers
+    keyword = filters.Keyword(keyword='fork')
+    keyword.setup()
+    assert keyword.raw()
+
+    parser = CountingParser(parsers.Apache2_Error_Parser())
+    source = datasources.Logfile(
+        parser, [keyword], path='./tests/file_assets/apache2/error.log'
+    )
+    lines = list(source.run())
+    assert len(lines) == 2
+    assert parser.calls == 2
+
+
+def test_pattern_filters(monkeypatch, tmp_path):
+    import sherlock.filters as filters
+    import sherlock.patterns as patterns
+    patternfile = tmp_path / 'patterns.txt'
+    patternfile.write_text('fork\nre:Dec 1[0-9]\n')
+    with open('./tests/file_assets/apache2/error.log') as logfile:
+        lines = logfile.readlines()
+
+    for automaton in (patterns.ahocorasick, None):
+        monkeypatch.setattr(patterns, 'ahocorasick', automaton)
+        results = {}
+        for f_class, argument in (
+                (filters.Anypattern, '@%s' % patternfile),
+                (filters.Allpatterns, ['Digest', 'done', 're:20(06|18)']),
+                (filters.Nopattern, 'notice,warn')):
+            f_instance = f_class(patterns=argument)
+            f_instance.setup()
+            assert f_instance.raw()
+            results[f_class] = sum(f_instance.run_raw(line) for line in lines)
+        assert results == {
+            filters.Anypattern: 6,
+            filters.Allpatterns: 2,
+            filters.Nopattern: 6,
+        }
+
+
+def test_patterns_with_groups_and_inline_flags(monkeypatch):
+    import sherlock.patterns as patterns
+    for automaton in (patterns.ahocorasick, None):
+        monkeypatch.setattr(patterns, 'ahocorasick', automaton)
+        # global inline flags are not combined into one alternation
+        flagged = patterns.PatternSet(['re:(?i)error', 'fatal', 're:pan+ic'])
+        assert flagged.any('an ERROR occurred')
+        assert flagged.any('kernel pannic')
+        assert not flagged.any('all fine')
+        assert flagged.all('ERROR: fatal panic')
+        assert not flagged.all('ERROR: fatal')
+        # backreferences keep their group numbers
+        groups = patterns.PatternSet(['re:(a)\\1', 're:(b)\\1'])
+        assert groups.any('bb')
+        assert not groups.any('ab')
+        assert groups.all('aa bb')
+        assert not groups.all('aa b')
+
+
+def test_async_shell_runs_commands_concurrently(capsys):
+    import time
+    import sherlock.sherlock as sherlock
+    commands = [
+        ('journal', 'sleep 0.5; echo "2019-01-20T06:26:0%s+0100 host cron[1]: %s"' % (
+            second, second
+        ))
+        for second in (3, 1, 2)
+    ]
+    start = time.perf_counter()
+    sherlock.Sherlock(
+        logfile_map=[],
+        shellcmd_map=commands,
+        output_name='stdout',
+        async_shell=True,
+    ).run()
+    assert time.perf_counter() - start < 1.2
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[-1] for line in lines] == ['1', '2', '3']
+
+
+def test_async_shell_timeout_keeps_output():
+    import time
+    import sherlock.datasources as datasources
+    import sherlock.parsers as parsers
+    source = datasources.AsyncShellcommand(
+        parsers.Journal_Parser(), [],
+        command='echo "2019-01-20T06:26:01+0100 host cron[1]: x"; sleep 10',
+        timeout=0.5
+    )
+    start = time.perf_counter()
+    assert len(list(source.run())) == 1
+    assert time.perf_counter() - start < 5
+
+
+def test_logfile_follow_handles_rotation_and_truncation(tmp_path):
+    import os
+    import sherlock.datasources as datasources
+    import sherlock.parsers as parsers
+    path = str(tmp_path / 'postgresql.log')
+    line = '2019-01-20 06:26:0%s CET [1-1] LOG:  line %s\n'
+    with open(path, 'w') as logfile:
+        logfile.write(line % (1, 1))
+    source = datasources.Logfile(
+        parsers.Psql_Parser(), [], path=path, follow=True, interval=0.01
+    )
+    lines = source.run()
+    assert next(lines).raw_line == line % (1, 1)
+
+    # incomplete line is returned when its line break arrives
+    with open(path, 'a') as logfile:
+        logfile.write((line % (2, 2))[:10])
+        logfile.flush()
+        logfile.write((line % (2, 2))[10:])
+    assert next(lines).raw_line == line % (2, 2)
+
+    os.rename(path, path + '.1')
+    with open(path, 'w') as logfile:
+        logfile.write(line % (3, 3))
+    assert next(lines).raw_line == line % (3, 3)
+
+    # truncation is detected by a logfile shorter than read before
+    with open(path, 'w') as logfile:
+        logfile.write(line % (4, ''))
+    assert next(lines).raw_line == line % (4, '')
+    lines.close()
+
+
+def test_follow_merger_watermark_and_lateness():
+    import queue
+    import time
+
+    def follow(lines):
+        '''yield lines from queue, None ends datasource'''
+        for line_d in iter(lines.get, None):
+            yield line_d
+
+    first, second = queue.Queue(), queue.Queue()
+    merger = mergers.FollowMerger(
+        {'first': follow(first), 'second': follow(second)}, lateness=0.3
+    )
+    merged = merger.run()
+
+    # second datasource is behind, line is released by watermark
+    first.put(make_line(2, 'a2'))
+    second.put(make_line(1, 'b1'))
+    second.put(make_line(3, 'b3'))
+    assert [next(merged).raw_line for _ in range(2)] == ['b1', 'a2']
+
+    # first datasource stays idle, b3 and b4 are released after lateness
+    second.put(make_line(4, 'b4'))
+    start = time.monotonic()
+    assert [next(merged).raw_line for _ in range(2)] == ['b3', 'b4']
+    assert 0.2 < time.monotonic() - start < 2
+
+    first.put(None)
+    second.put(make_line(5, 'b5'))
+    second.put(None)
+    assert [line_d.raw_line for line_d in merged] == ['b5']
+
+
+def test_follow_with_workers_and_shards(tmp_path):
+    import threading
+    import sherlock.sherlock as sherlock
+    path = str(tmp_path / 'postgresql.log')
+    line = '2019-01-20 06:26:0%s CET [1-1] LOG:  line %s\n'
+    with open(path, 'w') as logfile:
+        logfile.write(line % (1, 1))
+
+    def take(lines):
+        '''return next line of lines, None if none arrives within 5 seconds'''
+        taken = []
+        thread = threading.Thread(target=lambda: taken.append(next(lines)), daemon=True)
+        thread.start()
+        thread.join(5)
+        return taken[0].raw_line if taken else None
+
+    for options in ({'workers': 2}, {'shards': 1}):
+        s = sherlock.Sherlock(
+            logfile_map=[('postgresql', path)],
+            shellcmd_map=[],
+            output_name='stdout',
+            follow=True,
+            source_options={'*': {'interval': 0.01}},
+            **options
+        )
+        s.pool.start()
+        try:
+            lines = s.datasources[path]
+            assert take(lines) == line % (1, 1)
+            # appended line arrives in a partial batch
+            with open(path, 'a') as logfile:
+                logfile.write(line % (2, 2))
+            assert take(lines) == line % (2, 2)
+        finally:
+            s.pool.close()
+        with open(path, 'w') as logfile:
+            logfile.write(line % (1, 1))
+
+
+def test_buffered_outputs(capsys, tmp_path):
+    import sherlock.outputs as outputs
+    lines = [make_line(second, 'line %s\n' % second) for second in range(100)]
+    expected = ''.join(line_d.raw_line for line_d in lines)
+
+    output = outputs.StdOut()
+    output.latency = 60
+    output.buffer_size = 100
+    output.setup()
+    output.write_batch(lines[:5])
+    assert capsys.readouterr().out == ''
+    output.write_batch(lines[5:50])
+    for line_d in lines[50:]:
+        output.write(line_d)
+    output.close()
+    assert capsys.readouterr().out == expected
+
+    path = tmp_path / 'paged'
+    pager = outputs.SimplePager()
+    pager.command = 'cat > %s' % path
+    pager.setup()
+    pager.write_batch(lines)
+    pager.close()
+    pager.run()
+    assert path.read_text() == expected
+
+
+def test_tablepager_spills_rows(tmp_path):
+    import sherlock.outputs as outputs
+    lines = [make_line(second, 'line %s\n' % ('x' * second)) for second in range(20)]
+    path = tmp_path / 'table'
+    table = outputs.Tablepager()
+    table.command = 'cat > %s' % path
+    table.setup()
+    table.write_batch(lines[:10])
+    for line_d in lines[10:]:
+        table.write(line_d)
+    table.close()
+    table.run()
+
+    rows = path.read_text().splitlines()
+    assert len(rows) == 22
+    assert len(set(len(row) for row in rows)) == 1
+    assert rows[0].split() == ['|', 'datetime', '|', 'code', '|', 'raw_line', '|']
+    assert rows[-1].split('|')[3].strip() == 'line %s' % ('x' * 19)
+    assert '2019-01-01 00:00:19' in rows[-1]
+
+
+def test_pagers_write_to_stdout_without_terminal(capsys, monkeypatch):
+    import sherlock.outputs as outputs
+    monkeypatch.setenv('PAGER', 'false')
+    lines = [make_line(second, 'line %s\n' % second) for second in range(3)]
+
+    pager = outputs.SimplePager()
+    pager.setup()
+    pager.write_batch(lines)
+    pager.close()
+    pager.run()
+    assert capsys.readouterr().out == ''.join(line_d['raw_line'] for line_d in lines)
+
+    table = outputs.Tablepager()
+    table.setup()
+    table.write_batch(lines)
+    table.close()
+    table.run()
+    rows = capsys.readouterr().out.splitlines()
+    assert len(rows) == 5
+    assert rows[-1].split('|')[3].strip() == 'line 2'
+
+
+def test_stats_count_lines_per_datasource(capsys, tmp_path):
+    import pstats
+    import sherlock.sherlock as sherlock
+    counters = []
+    for workers in (0, 2):
+        s = sherlock.Sherlock(
+            logfile_map=ASSET_LOGFILES,
+            shellcmd_map=[],
+            output_name='stdout',
+            filter_map={'kw': 'cron_fast'},
+            workers=workers,
+            stats=True,
+            profile=str(tmp_path / 'profile') if not workers else None,
+        )
+        s.run()
+        passed = len(capsys.readouterr().out.splitlines())
+        result = s.stats.as_dict()
+        assert sum(stats['passed'] for stats in result['sources'].values()) == passed
+        counters.append({
+            key: (stats['lines'], stats['rejected'], stats['passed'], stats['dropped'])
+            for key, stats in result['sources'].items()
+        })
+    assert counters[0] == counters[1]
+    lines, rejected, passed, dropped = counters[0][ASSET_LOGFILES[1][1]]
+    assert passed and lines == passed + rejected + dropped['Keyword']
+    assert 'datasource' in s.stats.report()
+    assert pstats.Stats(str(tmp_path / 'profile')).total_calls
+
+
+def test_record_cache(tmp_path):
+    import gzip
+    import os
+    import sherlock.datasources as datasources
+    import sherlock.filters as filters
+    import sherlock.parsers as parsers
+    path = str(tmp_path / 'postgresql.log.gz')
+    plain = str(tmp_path / 'postgresql.log')
+    write_psql_log(plain, 48)
+    with open(plain, 'rb') as logfile, gzip.open(path, 'wb') as compressed:
+        compressed.write(logfile.read())
+    cache_dir = str(tmp_path / 'cache')
+
+    lasth = filters.Lasthours(lasth=2)
+    lasth.setup()
+    keyword = filters.Keyword(keyword='minute 1')
+    keyword.setup()
+
+    def run(lfilters, **kwargs):
+        parser = CountingParser(parsers.Psql_Parser())
+        source = datasources.Compressedfile(parser, lfilters, path=path, **kwargs)
+        return [(l.code, l.timestamp, l.raw_line) for l in source.run()], parser.calls
+
+    for lfilters in ([], [lasth], [lasth, keyword]):
+        expected, _ = run(lfilters)
+        assert run(lfilters, cache=cache_dir)[0] == expected
+        cached, calls = run(lfilters, cache=cache_dir)
+        assert cached == expected and calls == 0
+
+    # changed logfile is parsed again
+    os.utime(path, ns=(0, 0))
+    assert run([], cache=cache_dir)[1] > 0
+
+    # least recently used entries are evicted
+    source = datasources.Logfile(
+        parsers.Psql_Parser(), [], path=plain, cache=cache_dir, cache_size=0
+    )
+    assert len(list(source.run())) == 48 * 60
+    assert os.listdir(cache_dir) == []
+
+
+def test_batch_merger_matches_heap_merger():
+    import pytest
+    import random
+    import sherlock.batches as batches
+    if batches.numpy is None:
+        pytest.skip('numpy not installed')
+    rnd = random.Random(0)
+    sources = [
+        sorted(rnd.randrange(50) for _ in range(rnd.randrange(0, 200)))
+        for _ in range(5)
+    ]
+    # unordered datasources, like apache2 error.log
+    sources += [
+        [rnd.randrange(50) for _ in range(rnd.randrange(0, 200))]
+        for _ in range(2)
+    ]
+    sources = [
+        [make_line(second, '%s-%s' % (num, pos)) for pos, second in enumerate(seconds)]
+        for num, seconds in enumerate(sources)
+    ]
+
+    def blocks(lines):
+        '''yield batches of random size'''
+        position = 0
+        while position < len(lines):
+            size = rnd.randrange(1, 20)
+            yield batches.Batch(lines[position:position + size])
+            position += size
+
+    heap = mergers.HeapMerger(make_datasources(*sources))
+    batch = mergers.BatchMerger({
+        'source-%s' % num: blocks(lines) for num, lines in enumerate(sources)
+    })
+    assert [l.raw_line for l in batch.run()] == [l.raw_line for l in heap.run()]
+
+    out_of_order = [make_line(5, 'late'), make_line(1, 'early')]
+    batch = mergers.BatchMerger({'source': iter([batches.Batch(out_of_order)])})
+    assert [l.raw_line for l in batch.run()] == ['late', 'early']
+
+
+def test_batch_engine_masks_time_filters(capsys, tmp_path):
+    import pytest
+    import sherlock.batches as batches
+    import sherlock.sherlock as sherlock
+    if batches.numpy is None:
+        pytest.skip('numpy not installed')
+    logfile_map = []
+    for num in range(3):
+        path = str(tmp_path / ('postgresql-%s.log' % num))
+        write_psql_log(path, 10 + num)
+        logfile_map.append(('postgresql', path))
+
+    results = []
+    for merge_name, workers in (('heap', 0), ('batch', 0), ('batch', 2)):
+        s = sherlock.Sherlock(
+            logfile_map=logfile_map,
+            shellcmd_map=[],
+            output_name='stdout',
+            filter_map={'lh': 5, 'uh': 1},
+            merge_name=merge_name,
+            workers=workers,
+            source_options={'*': {'seek': False}},
+        )
+        s.run()
+        results.append(capsys.readouterr().out)
+    assert results[0] and results[0] == results[1] == results[2]
+
+
+def test_histogram_counts_lines_per_bucket(capsys):
+    import collections
+    import sherlock.outputs as outputs
+    import sherlock.sherlock as sherlock
+    histogram = outputs.Histogram(bucket=60)
+    histogram.setup()
+    lines = [make_line(second * 20) for second in range(10)]
+    for line_d in lines:
+        line_d.source = 'a'
+    lines[-1].code = 'ERROR'
+    histogram.write_batch(lines)
+    histogram.run()
+    rows = capsys.readouterr().out.splitlines()
+    assert 'a ERROR' in rows[0] and 'a LOG' in rows[0]
+    assert [[field.strip() for field in row.split('|')[2:-1]] for row in rows[2:]] == [
+        ['0', '3', '3'], ['0', '3', '3'], ['0', '3', '3'], ['1', '0', '1'],
+    ]
+
+    for merge_name in ('heap', 'batch'):
+        s = sherlock.Sherlock(
+            logfile_map=ASSET_LOGFILES,
+            shellcmd_map=[],
+            output_name='histogram',
+            merge_name=merge_name,
+            output_options={'histogram': {'bucket': 3600}},
+        )
+        s.run()
+        counts = collections.Counter()
+        for (bucket, source, code), count in s.output.counts.items():
+            counts[source] += count
+        assert set(counts) == set(s.sources)
+        capsys.readouterr()
+        s = sherlock.Sherlock(
+            logfile_map=ASSET_LOGFILES,
+            shellcmd_map=[],
+            output_name='stdout',
+        )
+        s.run()
+        assert sum(counts.values()) == len(capsys.readouterr().out.splitlines())
+
+    s.output = outputs.Histogram(bucket=60, style='sparkline', width=10)
+    s.output.setup()
+    s.output.write_batch(lines)
+    s.output.run()
+    sparklines = capsys.readouterr().out.splitlines()
+    assert sparklines[1].endswith('|   █| 1')
+    assert sparklines[2].endswith('|███ | 9')
+
+
+def test_logset_reads_rotations_in_order(tmp_path):
+    import gzip
+    import sherlock.datasources as datasources
+    import sherlock.filters as filters
+    import sherlock.parsers as parsers
+    import sherlock.sherlock as sherlock
+    full = str(tmp_path / 'full.log')
+    write_psql_log(full, 48)
+    with open(full) as logfile:
+        lines = logfile.readlines()
+    # 48 hours rotated into current logfile and 3 rotations of 12 hours
+    path = str(tmp_path / 'postgresql.log')
+    for num in range(4):
+        chunk = ''.join(lines[len(lines) - (num + 1) * 720:len(lines) - num * 720])
+        if num == 0:
+            name = path
+        elif num == 1:
+            name = path + '.1'
+        else:
+            name = path + '.%s.gz' % num
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(name, 'wt') as logfile:
+            logfile.write(chunk)
+    (tmp_path / 'postgresql.log.old').write_text(lines[0])
+
+    assert len(datasources.Logset.discover(path)) == 4
+    assert len(datasources.Logset.discover(path + '*')) == 5
+    source = datasources.Logset(parsers.Psql_Parser(), [], path=path)
+    assert [line_d.raw_line for line_d in source.run()] == lines
+    assert [line_d.raw_line for line_d in source.run_reverse(1000)] == lines[:-1001:-1]
+
+    # rotations outside of time window are not opened
+    lasth = filters.Lasthours(lasth=20)
+    lasth.setup()
+    uptoh = filters.Uptohours(uptoh=14)
+    uptoh.setup()
+    source = datasources.Logset(parsers.Psql_Parser(), [lasth, uptoh], path=path)
+    opened = []
+    datasource = source.datasource
+    source.datasource = lambda member, newest: opened.append(member) or datasource(member, newest)
+    expected = datasources.Logfile(parsers.Psql_Parser(), [lasth, uptoh], path=full)
+    assert [line_d.raw_line for line_d in source.run()] == [
+        line_d.raw_line for line_d in expected.run()
+    ]
+    assert opened == [path + '.1']
+
+    s = sherlock.Sherlock(
+        logfile_map=[],
+        logset_map=[('postgresql', path)],
+        shellcmd_map=[],
+        output_name='stdout',
+        stats=True,
+    )
+    assert len(s.sources) == 1
+    s.output.write_batch = lambda batch: None
+    s.run()
+    assert s.stats.sources[path].passed == len(lines)
+
+
+def test_head_and_tail_limits(capsys, tmp_path):
+    import sherlock.datasources as datasources
+    import sherlock.parsers as parsers
+    import sherlock.sherlock as sherlock
+    path = str(tmp_path / 'postgresql.log')
+    write_psql_log(path, 24)
+    with open(path, 'a') as logfile:
+        logfile.write('no line break')
+    with open(path, 'rb') as logfile:
+        data = logfile.read()
+
+    source = datasources.Logfile(parsers.Psql_Parser(), [], path=path)
+    forward = list(source.run())
+    for blocksize in (7, 100, 1024 * 1024):
+        source.blocksize = blocksize
+        assert [
+            (line_d.raw_line, line_d.offset) for line_d in source.run_reverse()
+        ] == [(line_d.raw_line, line_d.offset) for line_d in reversed(forward)]
+        lines = list(source.reverse_lines(open(path, 'rb'), 0, len(data)))
+        assert lines[0] == (len(data) - 13, b'no line break', False)
+        assert [line for _, line, _ in reversed(lines)] == data.split(b'\n')
+
+    parser = CountingParser(parsers.Psql_Parser())
+    source = datasources.Logfile(parser, [], path=path)
+    assert [line_d.raw_line for line_d in itertools.islice(source.run_reverse(), 5)] == [
+        line_d.raw_line for line_d in forward[-1:-6:-1]
+    ]
+    assert parser.calls < 200
+
+    results = {}
+    for limit in ('head', 'tail', None):
+        s = sherlock.Sherlock(
+            logfile_map=ASSET_LOGFILES,
+            shellcmd_map=[],
+            output_name='stdout',
+            **({limit: 100} if limit else {})
+        )
+        s.run()
+        results[limit] = capsys.readouterr().out.splitlines(True)
+    assert results['head'] == results[None][:100]
+    assert results['tail'] == results[None][-100:]
+
+
+def test_shards_keep_serial_order(capsys):
+    import sherlock.shard as shard
+    import sherlock.sherlock as sherlock
+    records = [make_line(second, 'line %s\n' % second) for second in range(3)]
+    records[1].code = None
+    records[2].offset = 42
+    _, decoded = shard.decode(shard.encode(records))
+    assert [(l.code, l.timestamp, l.raw_line, l.offset) for l in decoded] == [
+        (l.code, l.timestamp, l.raw_line, l.offset) for l in records
+    ]
+
+    results = []
+    for options in ({}, {'shards': 2}, {'shards': 1, 'shard_transport': 'tcp'},
+                    {'merge_name': 'batch'},
+                    {'shards': 2, 'merge_name': 'batch', 'stats': True}):
+        s = sherlock.Sherlock(
+            logfile_map=ASSET_LOGFILES,
+            shellcmd_map=[('apache2-error', 'cat %s' % ASSET_LOGFILES[2][1])],
+            output_name='stdout',
+            **options
+        )
+        s.run()
+        results.append(capsys.readouterr().out)
+    assert results[0] and results[0] == results[1] == results[2]
+    assert results[3] and results[3] == results[4]
+    assert sum(
+        stats.passed for stats in s.stats.sources.values()
+    ) == len(results[4].splitlines())
+
+
+def test_daemon_answers_queries_from_memory(capsys, tmp_path):
+    import io
+    import threading
+    import time
+    import sherlock.client as client
+    import sherlock.daemon as daemon
+    import sherlock.sherlock as sherlock
+    path = str(tmp_path / 'postgresql.log')
+    write_psql_log(path, 2)
+    socket_path = str(tmp_path / 'daemon.sock')
+    s = sherlock.Sherlock(
+        logfile_map=[('postgresql', path)] + ASSET_LOGFILES[1:],
+        shellcmd_map=[('apache2-error', 'cat %s' % ASSET_LOGFILES[2][1])],
+        output_name='stdout',
+    )
+    d = daemon.Daemon(s.sources, socket_path=socket_path, interval=60)
+    thread = threading.Thread(target=d.serve)
+    thread.start()
+    try:
+        for _ in range(100):
+            if d.server:
+                break
+            time.sleep(0.05)
+
+        def query(**request):
+            stream = io.BytesIO()
+            client.query(request, socket_path, stream)
+            return stream.getvalue().decode('utf-8')
+
+        def expected(**kwargs):
+            sherlock.Sherlock(
+                logfile_map=[('postgresql', path)] + ASSET_LOGFILES[1:],
+                shellcmd_map=[('apache2-error', 'cat %s' % ASSET_LOGFILES[2][1])],
+                output_name='stdout',
+                **kwargs
+            ).run()
+            return capsys.readouterr().out
+
+        assert query() == expected()
+        assert query(filter_map={'kw': 'cron_fast'}, tail=10) == expected(
+            filter_map={'kw': 'cron_fast'}, tail=10
+        )
+        assert query(filter_map={'lh': 1}, head=5) == expected(filter_map={'lh': 1}, head=5)
+
+        # appended and rotated logfiles are read on next query
+        with open(path, 'a') as logfile:
+            logfile.write('2099-01-01 00:00:00 CET [1-1] LOG:  appended\n')
+        assert query(tail=1).endswith('appended\n')
+        os.rename(path, path + '.1')
+        with open(path, 'w') as logfile:
+            logfile.write('2099-01-01 00:00:00 CET [1-1] LOG:  rotated\n')
+        assert query(filter_map={'kw': 'CET'}) == (
+            '2099-01-01 00:00:00 CET [1-1] LOG:  rotated\n'
+        )
+
+        histogram = query(output='histogram', output_options={'histogram': {'bucket': 3600}})
+        assert 'total' in histogram.splitlines()[0]
+        try:
+            query(filter_map={'nope': 1})
+        except RuntimeError as exc:
+            assert 'Unknown filter' in str(exc)
+        else:
+            assert False, 'query with unknown filter did not fail'
+    finally:
+        d.shutdown()
+        thread.join()
+    assert not os.path.exists(socket_path)
+
+
+def test_client_picks_pager_and_checks_socket_owner(monkeypatch, tmp_path):
+    import sys
+    import pytest
+    import sherlock.client as client
+    monkeypatch.setenv('PAGER', 'mypager')
+    monkeypatch.setattr(sys.stdout, 'isatty', lambda: True)
+    assert client.local_pager('simple') == 'mypager'
+    assert client.local_pager('stdout') is None
+    assert client.local_pager('histogram') is None
+    monkeypatch.delenv('PAGER')
+    assert client.local_pager('table') == 'less -S'
+    monkeypatch.setattr(sys.stdout, 'isatty', lambda: False)
+    assert client.local_pager('simple') is None
+
+    path = str(tmp_path / 'daemon.sock')
+    open(path, 'w').close()
+    client.check_owner(path)
+    monkeypatch.setattr(os, 'getuid', lambda: os.stat(path).st_uid + 1)
+    with pytest.raises(AssertionError):
+        client.query({}, path)
+
+
+def test_daemon_query_does_not_block_on_clients_and_commands(monkeypatch, tmp_path):
+    import json
+    import threading
+    import time
+    import sherlock.daemon as daemon
+    import sherlock.sherlock as sherlock
+    path = str(tmp_path / 'postgresql.log')
+    write_psql_log(path, 2)
+    runs = str(tmp_path / 'runs')
+    s = sherlock.Sherlock(
+        logfile_map=[('postgresql', path)],
+        shellcmd_map=[('postgresql', 'echo run >> %s; cat %s' % (runs, path))],
+        output_name='stdout',
+    )
+    d = daemon.Daemon(s.sources, interval=60, max_records=50)
+    d.refresh()
+    for store in d.stores.values():
+        if isinstance(store, daemon.CommandStore):
+            store.wait(10)
+
+    class Stream(object):
+        '''stream of a client not reading its answer'''
+
+        def __init__(self):
+            self.release = threading.Event()
+            self.data = []
+
+        def write(self, data):
+            if len(self.data) == 1:
+                self.release.wait(10)
+            self.data.append(data)
+
+    # lines are written to clients while merging
+    monkeypatch.setattr(daemon.SocketOutput, 'buffer_size', 1)
+    slow = Stream()
+    thread = threading.Thread(target=d.query, args=({}, slow))
+    thread.start()
+    start = time.monotonic()
+    fast = Stream()
+    fast.release.set()
+    d.query({'head': 1}, fast)
+    assert time.monotonic() - start < 5
+    assert len(b''.join(fast.data[1:]).splitlines()) == 1
+    slow.release.set()
+    thread.join()
+
+    # commands are not run again by queries, records are bounded
+    d.query({}, fast)
+    with open(runs) as runsfile:
+        assert runsfile.read() == 'run\n'
+    for store in d.stores.values():
+        assert 50 <= len(store.records) <= 50 + 50 // 8
+        assert store.records[-1].raw_line.endswith('minute 1\n')
+
+    # queries reaching before the oldest kept record are flagged in header
+    def header(request):
+        stream = Stream()
+        stream.release.set()
+        d.query(request, stream)
+        return json.loads(stream.data[0].decode('utf-8'))
+
+    assert set(header({})['truncated']) == set(d.stores)
+    assert header({'tail': 10}) == {'truncated': {}}
+    assert header({'filter_map': {'lh': 0.25}}) == {'truncated': {}}
+    assert set(header({'filter_map': {'lh': 1.5}})['truncated']) == set(d.stores)
+
+
+def test_snapshot_ring_buffer_and_triggers(capsys, tmp_path):
+    import gzip
+    import signal
+    import socket
+    import threading
+    import sherlock.filters as filters
+    import sherlock.snapshot as snapshot
+    import sherlock.sherlock as sherlock
+    lines = [make_line(second, 'line %05d\n' % second) for second in range(20000)]
+
+    # memory stays bounded, newest lines are kept
+    ring = snapshot.RingBuffer(max_bytes=20000, block_size=4096)
+    ring.add_batch(lines)
+    assert ring.size + ring.block_size <= ring.max_bytes
+    path = str(tmp_path / 'ring.gz')
+    count = ring.dump(path)
+    with gzip.open(path, 'rt') as dumpfile:
+        dumped = dumpfile.read()
+    assert 0 < count < len(lines)
+    assert dumped == ''.join(line_d.raw_line for line_d in lines[-count:])
+
+    # blocks older than max_age before newest line are dropped
+    ring = snapshot.RingBuffer(max_age=600 * 1000000, block_size=1024)
+    ring.add_batch(lines)
+    ring.seal()
+    assert 600 <= len(ring) <= 700
+
+    keyword = filters.Keyword(keyword='line 00100')
+    keyword.setup()
+    socket_path = str(tmp_path / 'snapshot.sock')
+    output = snapshot.Snapshot(
+        directory=str(tmp_path), trigger=[keyword], socket=socket_path,
+        block_size=1, on_close=False,
+    )
+    output.setup()
+    output.write_batch(lines[:50])
+    assert not output.dumps
+    output.write_batch(lines[50:150])
+    assert len(output.dumps) == 1
+    with gzip.open(output.dumps[0], 'rt') as dumpfile:
+        assert dumpfile.read().splitlines()[-1] == 'line 00149'
+
+    os.kill(os.getpid(), signal.SIGUSR1)
+    output.flush()
+    assert len(output.dumps) == 2
+
+    answer = []
+
+    def command():
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(socket_path)
+            conn.sendall(b'dump\n')
+            answer.append(conn.makefile('rb').readline().decode('utf-8').strip())
+
+    thread = threading.Thread(target=command)
+    thread.start()
+    while not answer:
+        output.flush()
+        thread.join(0.01)
+    assert answer == [output.dumps[2]]
+    output.close()
+    assert not os.path.exists(socket_path)
+    capsys.readouterr()
+
+    # without follow mode the window is dumped when datasources end
+    s = sherlock.Sherlock(
+        logfile_map=ASSET_LOGFILES,
+        shellcmd_map=[],
+        output_name='snapshot',
+        output_options={'snapshot': {
+            'directory': str(tmp_path), 'trigger': {'kw': 'nothing matches'},
+        }},
+    )
+    s.run()
+    assert len(s.output.dumps) == 1
+    assert 'Snapshot of' in capsys.readouterr().err
+
+
+def test_registry_loads_entries_on_first_use(monkeypatch):
+    '''registry imports modules on access, plugins come from entry points'''
+    import importlib.metadata
+    import pytest
+    import sherlock.filters as filters
+    from sherlock.registry import Registry
+
+    registry = Registry('pf_sherlock.filters', {
+        'kw': 'sherlock.filters:Keyword',
+        'missing': 'sherlock_missing_module:Filter',
+    })
+    # names are known without importing their modules
+    assert 'missing' in registry
+    assert not registry.loaded
+    assert registry['kw'] is filters.Keyword
+    with pytest.raises(ImportError):
+        registry['missing']
+
+    registry.register('lh', filters.Lasthours)
+    assert registry['lh'] is filters.Lasthours
+    assert not registry.discovered
+
+    # built in names win over entry points, other names are added
+    entry_points = importlib.metadata.EntryPoints([
+        importlib.metadata.EntryPoint(
+            name, 'sherlock.filters:Nopattern', 'pf_sherlock.filters'
+        )
+        for name in ('kw', 'plugin')
+    ])
+    monkeypatch.setattr(importlib.metadata, 'entry_points', lambda: entry_points)
+    assert 'plugin' in registry
+    assert registry.discovered
+    assert registry['plugin'] is filters.Nopattern
+    assert registry['kw'] is filters.Keyword
+    assert sorted(registry) == ['kw', 'lh', 'missing', 'plugin']
+    with pytest.raises(KeyError):
+        registry['unknown']
+
+
+def test_snapshot_trigger_cooldown_and_signal_handler(capsys, tmp_path):
+    import signal
+    import sherlock.filters as filters
+    import sherlock.snapshot as snapshot
+    lines = [make_line(second, 'line %05d\n' % second) for second in range(100)]
+    keyword = filters.Keyword(keyword='line 000')
+    keyword.setup()
+
+    def handler(signum, frame):
+        pass
+
+    previous = signal.signal(signal.SIGUSR1, handler)
+    try:
+        output = snapshot.Snapshot(
+            directory=str(tmp_path), trigger=[keyword], block_size=1,
+            on_close=False,
+        )
+        output.setup()
+        # trigger lines during cooldown do not dump again, signals do
+        for num in range(10):
+            output.write_batch(lines[num * 10:num * 10 + 10])
+        assert len(output.dumps) == 1
+        output.signalled(signal.SIGUSR1, None)
+        output.flush()
+        assert len(output.dumps) == 2
+        output.cooldown = 0
+        output.write_batch(lines[:1])
+        assert len(output.dumps) == 3
+        output.close()
+        assert signal.getsignal(signal.SIGUSR1) is handler
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+    capsys.readouterr()
+
+
+def test_snapshot_dumps_while_following_quiet_logfiles(capsys, tmp_path):
+    import signal
+    import socket
+    import threading
+    import time
+    import sherlock.sherlock as sherlock
+    path = str(tmp_path / 'postgresql.log')
+    write_psql_log(path, 1)
+    socket_path = str(tmp_path / 'snapshot.sock')
+    s = sherlock.Sherlock(
+        logfile_map=[('postgresql', path)],
+        shellcmd_map=[],
+        output_name='snapshot',
+        output_options={'snapshot': {
+            'directory': str(tmp_path), 'socket': socket_path, 'on_close': False,
+        }},
+        follow=True,
+        source_options={'*': {'interval': 0.01}},
+    )
+
+    def wait(condition):
+        '''return True once condition holds, False after 5 seconds'''
+        deadline = time.monotonic() + 5
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    # like run, signal handler is set up in main thread
+    s.output.setup()
+    try:
+        for source in s.sources.values():
+            source.start()
+        threading.Thread(target=s.merge, daemon=True).start()
+        assert wait(lambda: len(s.output.buffer) == 60)
+
+        os.kill(os.getpid(), signal.SIGUSR1)
+        assert wait(lambda: len(s.output.dumps) == 1)
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(5)
+            conn.connect(socket_path)
+            conn.sendall(b'dump\n')
+            answer = conn.makefile('rb').readline().decode('utf-8').strip()
+        assert answer == s.output.dumps[1]
+    finally:
+        s.output.close()
+    capsys.readouterr()